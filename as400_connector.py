@@ -1,28 +1,1005 @@
-import jaydebeapi
-<<<<<<< Updated upstream
-=======
-import os
-import logging  # 添加日誌模組
-from PySide6.QtWidgets import QMessageBox
->>>>>>> Stashed changes
+import copy
+import logging
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from columnar import ColumnBatch, ResultSet, fetch_column_batch, read_result_set
+from drivers import create_driver, driver_class, jt400_path, start_jvm
+from query_metrics import QueryMetrics
 
-jt400_path = "/Users/clark/Desktop/DDSC/Clark文件/13-JavaCode/jt400.jar"
+try:
+    import jaydebeapi
+except ImportError:
+    # 使用 jpype 或模擬驅動時不需要 jaydebeapi
+    jaydebeapi = None
+
+# 連接池預設參數
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 4
+POOL_IDLE_TIMEOUT = 300  # 閒置超過此秒數的連接會被回收（保留 min_size 個）
+POOL_CHECKOUT_TIMEOUT = 30  # 取得連接的最長等待秒數
+POOL_HEALTH_CHECK_INTERVAL = 30  # 閒置超過此秒數的連接在借出前需先做健康檢查
+HEALTH_CHECK_TIMEOUT = 5
+HEALTH_CHECK_SQL = "VALUES 1"
+
+# 每次 fetchmany 取回的列數
+FETCH_BATCH_SIZE = 1000
+
+# 每個連接最多快取的 PreparedStatement 數量
+STATEMENT_CACHE_SIZE = 64
+
+# 查詢結果快取的容量上限（位元組，估算值）與預設存活秒數
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESULT_CACHE_DEFAULT_TTL = 300
+
+# 執行變更類命令後需要失效的 IBM i 服務視圖，未列出的命令會清除該系統全部快取
+CACHE_INVALIDATION = {
+    "CRTUSRPRF": ("USER_INFO",),
+    "CHGUSRPRF": ("USER_INFO",),
+    "DLTUSRPRF": ("USER_INFO", "OUTPUT_QUEUE_ENTRIES"),
+    "ENDJOB": ("ACTIVE_JOB_INFO",),
+    "HLDJOB": ("ACTIVE_JOB_INFO",),
+    "RLSJOB": ("ACTIVE_JOB_INFO",),
+}
+
+# 等待其他執行緒的相同查詢時，檢查取消的間隔秒數
+SINGLE_FLIGHT_POLL_INTERVAL = 0.1
+
+# 多系統查詢同時執行的最大系統數
+FANOUT_MAX_WORKERS = 16
+
+logger = logging.getLogger(__name__)
+
+# IBM i 物件名稱、作業名稱（號碼/用戶/名稱）與特殊值的格式
+_OBJECT_NAME_RE = re.compile(r"^[A-Z$#@][A-Z0-9$#@_.]{0,9}$")
+_JOB_NAME_RE = re.compile(r"^\d{6}/[A-Z$#@][A-Z0-9$#@_.]{0,9}/[A-Z$#@][A-Z0-9$#@_.]{0,9}$")
+_SPECIAL_VALUE_RE = re.compile(r"^\*[A-Z]+$")
+
+_local = threading.local()
+
+_warm_up_thread = None
+
+
+class PoolTimeoutError(Exception):
+    """等待可用連接逾時"""
+
+
+class QueryCancelledError(Exception):
+    """查詢已被取消或逾時"""
+
+
+def cl_name(name):
+    """檢查並回傳可直接放入 CL 命令的物件名稱"""
+    name = name.strip().upper()
+    if not _OBJECT_NAME_RE.match(name):
+        raise ValueError(f"無效的名稱: {name}")
+    return name
+
+
+def cl_job_name(job_name):
+    """檢查並回傳 號碼/用戶/名稱 格式的作業名稱"""
+    job_name = job_name.strip().upper()
+    if not _JOB_NAME_RE.match(job_name):
+        raise ValueError(f"無效的作業名稱: {job_name}")
+    return job_name
+
+
+def cl_special_value(value):
+    """檢查並回傳 *USER、*ALLOBJ 之類的特殊值"""
+    value = value.strip().upper()
+    if not _SPECIAL_VALUE_RE.match(value):
+        raise ValueError(f"無效的特殊值: {value}")
+    return value
+
+
+def cl_password(password):
+    """密碼不可包含會改變 CL 命令結構的字元"""
+    if not password or any(ch.isspace() or ch in "()'\"" for ch in password):
+        raise ValueError("密碼不可為空，也不可包含空白、括號或引號")
+    return password
+
+
+def cl_string(text):
+    """將文字轉為 CL 字串常數（單引號包住，內部單引號加倍）"""
+    return "'" + text.replace("'", "''") + "'"
+
+
+def cancel_statement(cursor):
+    """呼叫 JDBC Statement.cancel 中斷執行中的語句"""
+    statement = getattr(cursor, "_prep", None) or getattr(cursor, "_statement", None)
+    if statement is None:
+        return
+    try:
+        statement.cancel()
+    except Exception as e:
+        logger.debug("取消語句時發生錯誤: %s", e)
+
+
+class CancelToken:
+    """可由其他執行緒取消的查詢標記
+
+    在 activate() 區塊內透過連接池建立的 cursor 都會自動登記，
+    cancel() 時對所有登記中的語句呼叫 Statement.cancel。
+    timeout 不為 None 時，超過秒數會自動取消。
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.cancelled = False
+        self.timed_out = False
+        self._cursors = []
+        self._lock = threading.Lock()
+
+    def register(self, cursor):
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelledError("查詢逾時" if self.timed_out else "查詢已取消")
+            self._cursors.append(cursor)
+
+    def unregister(self, cursor):
+        with self._lock:
+            if cursor in self._cursors:
+                self._cursors.remove(cursor)
+
+    def cancel(self, timed_out=False):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            self.timed_out = timed_out
+            cursors = list(self._cursors)
+        for cursor in cursors:
+            cancel_statement(cursor)
+
+    @contextmanager
+    def activate(self, start_timer=True):
+        previous = getattr(_local, "cancel_token", None)
+        _local.cancel_token = self
+        timer = None
+        if self.timeout and start_timer:
+            timer = threading.Timer(self.timeout, self.cancel, kwargs={"timed_out": True})
+            timer.daemon = True
+            timer.start()
+        try:
+            yield self
+        finally:
+            if timer is not None:
+                timer.cancel()
+            _local.cancel_token = previous
+
+
+def current_cancel_token():
+    return getattr(_local, "cancel_token", None)
+
+
+@contextmanager
+def track_cursor(cursor):
+    """讓目前執行緒的 CancelToken 可以取消此 cursor 上的語句"""
+    token = current_cancel_token()
+    if token is None:
+        yield cursor
+        return
+    token.register(cursor)
+    try:
+        yield cursor
+    finally:
+        token.unregister(cursor)
+
+
+def normalize_sql(sql):
+    """合併字串常數以外的空白並轉大寫，作為快取鍵"""
+    parts = sql.split("'")
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i]).upper()
+    return "'".join(parts).strip()
+
+
+def _estimate_size(value):
+    """粗估查詢結果佔用的記憶體，只抽樣前 100 行"""
+    if not isinstance(value, tuple) or len(value) != 2:
+        return sys.getsizeof(value)
+    columns, rows = value
+    if isinstance(rows, ResultSet):
+        return rows.nbytes() + sum(sys.getsizeof(name) for name in columns)
+    if not isinstance(rows, list):
+        return sys.getsizeof(value)
+    size = sys.getsizeof(rows) + sum(sys.getsizeof(name) for name in columns)
+    sample = rows[:100]
+    if sample:
+        sample_size = sum(sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row) for row in sample)
+        size += sample_size * len(rows) // len(sample)
+    return size
+
+
+def start_query_record(connection, source, sql, statement=None):
+    """連接池設有 metrics 時建立查詢記錄，否則回傳 None"""
+    metrics = getattr(connection, "metrics", None)
+    if metrics is None:
+        return None
+    return metrics.start(connection.host, source, sql, statement)
+
+
+def record_execute(record, cursor):
+    if record is not None:
+        record.lap_execute(getattr(cursor, "prepare_time", 0.0))
+
+
+class QueryResult(tuple):
+    """(欄位, 結果)，附帶此次呼叫的 QueryRecord
+
+    相同的查詢合併執行或命中快取時，多個呼叫者共用同一個 ResultSet；
+    各呼叫者自己的記錄（耗時、是否共用）放在這裡，顯示端以 result.record 補上繪製時間。
+    """
+
+    def __new__(cls, columns, data, record=None):
+        result = super().__new__(cls, (columns, data))
+        result.record = record
+        return result
+
+
+def finish_query_record(record, result=None, error=None, cached=False):
+    """結束查詢記錄；result 為 (columns, ResultSet) 時記下列數與大小，並回傳附帶此記錄的 QueryResult"""
+    if record is not None:
+        record.cached = cached
+        rows = len(result[1]) if result else 0
+        record._metrics.finish(record, rows, _estimate_size(result) if result else 0, error)
+    if result is None:
+        return None
+    return QueryResult(result[0], result[1], record)
+
+
+def command_tables(cmd):
+    """CL 命令會影響的服務視圖；None 表示影響該系統的全部查詢"""
+    return CACHE_INVALIDATION.get(cmd.strip().split(" ", 1)[0].upper())
+
+
+class ResultCache:
+    """以 (系統, 正規化 SQL, 參數) 為鍵的查詢結果快取
+
+    每筆資料有存活時間，總容量超過上限時依 LRU 淘汰。
+    查詢前以 generation() 取得失效世代並傳給 put()：查詢途中快取被清除過（例如執行了 CL 命令）時
+    不寫入，避免把命令執行前的結果放回快取。
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES, default_ttl=RESULT_CACHE_DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # key -> (value, 到期時間, 大小)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._generation = 0  # 全部清除時遞增
+        self._host_generations = {}  # 系統 -> 該系統被清除的次數
+
+    @staticmethod
+    def make_key(host, sql, params=None):
+        return host, normalize_sql(sql), tuple(params or ())
+
+    def get(self, host, sql, params=None):
+        key = self.make_key(host, sql, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def generation(self, host):
+        with self._lock:
+            return self._generation, self._host_generations.get(host, 0)
+
+    def put(self, host, sql, params, value, ttl=None, generation=None):
+        key = self.make_key(host, sql, params)
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and generation != (self._generation, self._host_generations.get(host, 0)):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate(self, host=None, tables=None):
+        """清除指定系統（及包含指定表名的 SQL）的快取，參數皆為 None 時全部清除"""
+        with self._lock:
+            if host is None:
+                self._generation += 1
+            else:
+                self._host_generations[host] = self._host_generations.get(host, 0) + 1
+            for key in list(self._entries):
+                if host is not None and key[0] != host:
+                    continue
+                if tables and not any(table in key[1] for table in tables):
+                    continue
+                self._remove(key)
+
+    def invalidate_command(self, host, cmd):
+        """依 CL 命令清除受影響的快取"""
+        self.invalidate(host, command_tables(cmd))
+
+    def get_stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self._bytes}
+
+
+def start_jvm_warm_up(callback=None, driver=None):
+    """在背景執行緒啟動 JVM 並載入 jt400 驅動類別
+
+    driver 為不需要 JVM 的驅動時直接略過。callback(elapsed, error) 會在背景執行緒中呼叫。
+    """
+    global _warm_up_thread
+    if _warm_up_thread is not None or (driver is not None and not driver.uses_jvm):
+        return _warm_up_thread
+
+    def run():
+        start = time.perf_counter()
+        error = None
+        try:
+            if driver is not None:
+                driver.warm_up()
+            else:
+                start_jvm()
+        except Exception as e:
+            error = str(e)
+            logger.warning("JVM 預熱失敗: %s", e)
+        if callback:
+            callback(time.perf_counter() - start, error)
+
+    _warm_up_thread = threading.Thread(target=run, name="jvm-warm-up", daemon=True)
+    _warm_up_thread.start()
+    return _warm_up_thread
+
+
+def wait_for_jvm_warm_up():
+    """等待背景預熱結束，避免與 jaydebeapi 同時啟動 JVM"""
+    if _warm_up_thread is not None and _warm_up_thread is not threading.current_thread():
+        _warm_up_thread.join()
+
+
+class StatementCache:
+    """單一連接的 PreparedStatement LRU 快取
+
+    相同 SQL 重複執行時沿用已準備的語句，Db2 for i 可以重用存取計畫。
+    """
+
+    def __init__(self, jconn, max_size=STATEMENT_CACHE_SIZE):
+        self._jconn = jconn
+        self.max_size = max_size
+        self._statements = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def prepare(self, sql):
+        statement = self._statements.get(sql)
+        if statement is not None:
+            self._statements.move_to_end(sql)
+            self.hits += 1
+            return statement
+        self.misses += 1
+        statement = self._jconn.prepareStatement(sql)
+        self._statements[sql] = statement
+        if len(self._statements) > self.max_size:
+            _, oldest = self._statements.popitem(last=False)
+            self.evictions += 1
+            self._close_statement(oldest)
+        return statement
+
+    def discard(self, sql):
+        statement = self._statements.pop(sql, None)
+        if statement is not None:
+            self._close_statement(statement)
+
+    def _close_statement(self, statement):
+        try:
+            statement.close()
+        except Exception:
+            pass
+
+    def close(self):
+        for statement in self._statements.values():
+            self._close_statement(statement)
+        self._statements.clear()
+
+
+class CachedStatementCursor(jaydebeapi.Cursor if jaydebeapi else object):
+    """從 StatementCache 取得 PreparedStatement 的 jaydebeapi cursor"""
+
+    def __init__(self, connection, statement_cache):
+        super().__init__(connection, connection._converters)
+        self._statement_cache = statement_cache
+        self.prepare_time = 0.0
+
+    def _close_last(self):
+        # 快取中的 PreparedStatement 由 StatementCache 管理，這裡只關閉結果集
+        if self._rs:
+            self._rs.close()
+        self._rs = None
+        self._prep = None
+        self._meta = None
+        self._description = None
+
+    def execute(self, operation, parameters=None):
+        if self._connection._closed:
+            raise jaydebeapi.Error()
+        self._close_last()
+        start = time.perf_counter()
+        self._prep = self._statement_cache.prepare(operation)
+        self.prepare_time = time.perf_counter() - start
+        self._prep.clearParameters()
+        self._set_stmt_parms(self._prep, parameters or ())
+        try:
+            is_rs = self._prep.execute()
+        except:
+            self._statement_cache.discard(operation)
+            jaydebeapi._handle_sql_exception()
+        if is_rs:
+            self._rs = self._prep.getResultSet()
+            self._meta = self._rs.getMetaData()
+            self.rowcount = -1
+        else:
+            self.rowcount = self._prep.getUpdateCount()
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "cancelled")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.cancelled = False
+
+
+def _waiter_error(error):
+    """等待者各自拋出新的例外物件，多個執行緒不會同時改寫同一個 __traceback__"""
+    try:
+        copied = copy.copy(error)
+    except Exception:
+        copied = None
+    if copied is None or copied is error or type(copied) is not type(error):
+        copied = RuntimeError(str(error))
+    return copied
+
+
+class SingleFlight:
+    """合併同時執行的相同查詢
+
+    同一個 (系統, 正規化 SQL, 參數) 正在執行時，後到的呼叫等待並取得同一個結果，
+    不再送到伺服器。結果物件由所有呼叫者共用，需要修改時應先複製。
+    帶頭的查詢被取消時，其他等待者自行重新執行，不會一起收到取消。
+    """
 
-class AS400Connector:
     def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, host, sql, params, fn):
+        """執行 fn() 或等待相同的查詢，回傳 (結果, 是否共用他人的結果)"""
+        key = ResultCache.make_key(host, sql, params)
+        token = current_cancel_token()
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = _Flight()
+                    self.leaders += 1
+                    leader = True
+                else:
+                    self.shared += 1
+                    leader = False
+            if leader:
+                return self._lead(key, flight, token, fn), False
+            while not flight.done.wait(SINGLE_FLIGHT_POLL_INTERVAL):
+                if token is not None and token.cancelled:
+                    raise QueryCancelledError("查詢逾時" if token.timed_out else "查詢已取消")
+            if flight.cancelled:
+                continue
+            if flight.error is not None:
+                raise _waiter_error(flight.error) from flight.error
+            return flight.result, True
+
+    def _lead(self, key, flight, token, fn):
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            flight.cancelled = token is not None and token.cancelled
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+
+    def invalidate(self, host=None, tables=None):
+        """之後的呼叫不再等待指定系統（及包含指定表名）正在執行的查詢，參數與 ResultCache.invalidate 相同"""
+        with self._lock:
+            for key in list(self._flights):
+                if host is not None and key[0] != host:
+                    continue
+                if tables and not any(table in key[1] for table in tables):
+                    continue
+                del self._flights[key]
+
+    def get_stats(self):
+        with self._lock:
+            return {"leaders": self.leaders, "shared": self.shared, "in_flight": len(self._flights)}
+
+
+def single_flight(connection, sql, params, fn):
+    """連接池設有 single_flight 時合併相同的查詢，回傳 (結果, 是否共用他人的結果)"""
+    flight = getattr(connection, "single_flight", None)
+    if flight is None:
+        return fn(), False
+    return flight.do(connection.host, sql, params, fn)
+
+
+def invalidate_command(connection, cmd):
+    """執行 CL 命令後讓受影響的快取與執行中的查詢失效，之後的查詢會看到命令的結果"""
+    tables = command_tables(cmd)
+    for name in ("result_cache", "single_flight"):
+        target = getattr(connection, name, None)
+        if target is not None:
+            target.invalidate(connection.host, tables)
+
+
+class ConnectionPool:
+    """單一主機的 JDBC 連接池
+
+    提供與 jaydebeapi 連接相同的 cursor()/close() 介面，
+    讓 UserManager、JobManager 等模組不需修改即可共用。
+    """
+
+    def __init__(self, host, user, password, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 idle_timeout=POOL_IDLE_TIMEOUT, checkout_timeout=POOL_CHECKOUT_TIMEOUT,
+                 health_check_interval=POOL_HEALTH_CHECK_INTERVAL, result_cache=None, driver=None,
+                 metrics=None, single_flight=None):
+        self.host = host
+        self.result_cache = result_cache
+        self.single_flight = single_flight
+        self.metrics = metrics
+        self.driver = driver or create_driver()
+        self._user = user
+        self._password = password
+        self.min_size = max(min_size, 0)
+        self.max_size = max(max_size, self.min_size, 1)
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = []  # [connection, 最後歸還時間, 是否需要健康檢查]
+        self._in_use = set()
+        self._statement_caches = {}
+        self._size = 0
+        self._closed = False
+        self._stats = {
+            "created": 0,
+            "closed": 0,
+            "checkouts": 0,
+            "returns": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "health_failures": 0,
+            "evicted": 0,
+        }
+
+        # 預先建立最小數量的連接，第一個連接失敗時直接拋出錯誤
+        for _ in range(max(self.min_size, 1)):
+            connection = self._create_connection()
+            self._idle.append([connection, time.monotonic(), False])
+            self._size += 1
+
+    def _create_connection(self):
+        if self.driver.uses_jvm:
+            wait_for_jvm_warm_up()
+        connection = self.driver.connect(self.host, self._user, self._password)
+        self._stats["created"] += 1
+        return connection
+
+    def _close_connection(self, connection):
+        """關閉連接；可能需要等待網路，不要在持有鎖時呼叫"""
+        cache = self._statement_caches.pop(connection, None)
+        if cache is not None:
+            cache.close()
+        try:
+            connection.close()
+        except Exception as e:
+            logger.debug("關閉 %s 的連接時發生錯誤: %s", self.host, e)
+        with self._cond:
+            self._stats["closed"] += 1
+
+    def _is_healthy(self, connection):
+        try:
+            jconn = getattr(connection, "jconn", None)
+            if jconn is not None:
+                return bool(jconn.isValid(HEALTH_CHECK_TIMEOUT))
+            cursor = connection.cursor()
+            try:
+                cursor.execute(HEALTH_CHECK_SQL)
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle(self, now):
+        """從閒置列表移除閒置過久的連接並回傳，需在持有鎖時呼叫，關閉則在鎖外進行"""
+        keep = []
+        evicted = []
+        for entry in self._idle:
+            if now - entry[1] > self.idle_timeout and self._size > self.min_size:
+                self._size -= 1
+                self._stats["evicted"] += 1
+                evicted.append(entry[0])
+            else:
+                keep.append(entry)
+        self._idle = keep
+        return evicted
+
+    def acquire(self, timeout=None):
+        """借出一個連接，池已滿時等待其他使用者歸還
+
+        健康檢查、關閉與建立連接都在鎖外進行，一個慢的連接不會讓同一系統的其他借出等待。
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+        while True:
+            candidate = None
+            check = False
+            create = False
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError(f"{self.host} 的連接池已關閉")
+
+                now = time.monotonic()
+                evicted = self._evict_idle(now)
+                if self._idle:
+                    candidate, last_used, suspect = self._idle.pop()
+                    check = suspect or now - last_used > self.health_check_interval
+                    # 先計入使用中，健康檢查期間其他執行緒不會拿到同一個連接
+                    self._in_use.add(candidate)
+                elif self._size < self.max_size:
+                    # 先佔用名額再於鎖外建立連接
+                    self._size += 1
+                    create = True
+                elif not evicted:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(f"等待 {self.host} 的可用連接逾時")
+                    if not waited:
+                        self._stats["waits"] += 1
+                        waited = True
+                    self._cond.wait(remaining)
+
+            for connection in evicted:
+                self._close_connection(connection)
+
+            if candidate is not None:
+                if check and not self._is_healthy(candidate):
+                    with self._cond:
+                        self._in_use.discard(candidate)
+                        self._size -= 1
+                        self._stats["health_failures"] += 1
+                        self._cond.notify()
+                    self._close_connection(candidate)
+                    continue
+                with self._cond:
+                    self._stats["checkouts"] += 1
+                return candidate
+
+            if create:
+                break
+
+        try:
+            connection = self._create_connection()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._in_use.add(connection)
+            self._stats["checkouts"] += 1
+        return connection
+
+    def release(self, connection, suspect=False):
+        """歸還連接；suspect 為 True 時下次借出前會先做健康檢查"""
+        with self._cond:
+            if connection not in self._in_use:
+                return
+            self._in_use.discard(connection)
+            self._stats["returns"] += 1
+            closed = self._closed
+            if closed:
+                self._size -= 1
+            else:
+                self._idle.append([connection, time.monotonic(), suspect])
+            self._cond.notify()
+        if closed:
+            self._close_connection(connection)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        connection = self.acquire(timeout)
+        suspect = False
+        try:
+            yield connection
+        except Exception:
+            suspect = True
+            raise
+        finally:
+            self.release(connection, suspect)
+
+    def new_cursor(self, connection):
+        """建立 cursor；JDBC 連接會使用該連接的 PreparedStatement 快取"""
+        if jaydebeapi is None or not isinstance(connection, jaydebeapi.Connection):
+            return connection.cursor()
+        cache = self._statement_caches.get(connection)
+        if cache is None:
+            cache = self._statement_caches[connection] = StatementCache(connection.jconn)
+        return CachedStatementCursor(connection, cache)
+
+    @contextmanager
+    def cursor(self):
+        """借出連接並建立 cursor，離開區塊時自動關閉並歸還"""
+        with self.connection() as connection:
+            cursor = self.new_cursor(connection)
+            try:
+                with track_cursor(cursor):
+                    yield cursor
+            finally:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(size=self._size, idle=len(self._idle), in_use=len(self._in_use),
+                         min_size=self.min_size, max_size=self.max_size)
+            caches = list(self._statement_caches.values())
+            stats.update(statement_hits=sum(cache.hits for cache in caches),
+                         statement_misses=sum(cache.misses for cache in caches),
+                         statement_evictions=sum(cache.evictions for cache in caches))
+            return stats
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = [connection for connection, _, _ in self._idle]
+            self._size -= len(idle)
+            self._idle = []
+            # 使用中的連接會在歸還時關閉
+            self._cond.notify_all()
+        for connection in idle:
+            self._close_connection(connection)
+
+
+def fetch_batches(cursor, batch_size=FETCH_BATCH_SIZE):
+    """以 fetchmany 分批讀取 cursor 的結果"""
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            return
+        yield batch
+        if len(batch) < batch_size:
+            return
+
+
+class QueryStream:
+    """分批串流查詢結果
+
+    執行期間佔用一個池內連接，讀完、呼叫 close() 或離開 with 區塊時歸還。
+    execute_time 為執行到取得欄位資訊的時間，first_batch_time 為取得第一批資料的時間（秒）。
+    連接池設有 metrics 時以 record 記錄各階段耗時，關閉時寫入。
+    """
+
+    def __init__(self, pool, query, batch_size=FETCH_BATCH_SIZE, params=None, source="QueryStream"):
+        self.pool = pool
+        self.query = query
+        self.params = params or ()
+        self.batch_size = batch_size
+        self.source = source
+        self.columns = None
+        self.rows_fetched = 0
+        self.bytes_fetched = 0
+        self.execute_time = None
+        self.first_batch_time = None
+        self.exhausted = False
+        self.column_types = None
+        self.record = None
+        self.error = None
+        self._recorded = False
+        self._connection = None
+        self._cursor = None
+
+    def _fail(self, error):
+        self.error = str(error)
+        self.close(suspect=True)
+
+    def open(self):
+        start = time.perf_counter()
+        self.record = start_query_record(self.pool, self.source, self.query)
+        try:
+            self._connection = self.pool.acquire()
+            self._cursor = self.pool.new_cursor(self._connection)
+            with track_cursor(self._cursor):
+                self._cursor.execute(self.query, self.params)
+            self.columns = [desc[0] for desc in self._cursor.description]
+        except Exception as e:
+            self._fail(e)
+            raise
+        record_execute(self.record, self._cursor)
+        self._start = start
+        self.execute_time = time.perf_counter() - start
+        return self
+
+    def fetch_batch(self):
+        """讀取下一批資料，沒有更多資料時回傳空列表"""
+        if self.exhausted or self._cursor is None:
+            return []
+        if self.record is not None:
+            self.record.skip()
+        try:
+            with track_cursor(self._cursor):
+                batch = self._cursor.fetchmany(self.batch_size)
+        except Exception as e:
+            self._fail(e)
+            raise
+        if self.record is not None:
+            self.record.lap("fetch")
+        if self.first_batch_time is None:
+            self.first_batch_time = time.perf_counter() - self._start
+        self.rows_fetched += len(batch)
+        if len(batch) < self.batch_size:
+            self.close()
+        return batch
+
+    def fetch_column_batch(self):
+        """讀取下一批資料並轉為 ColumnBatch，沒有更多資料時回傳 None"""
+        if self.exhausted or self._cursor is None:
+            return None
+        if self.record is not None:
+            self.record.skip()
+        try:
+            with track_cursor(self._cursor):
+                batch = fetch_column_batch(self._cursor, self.batch_size, self.columns, self.column_types)
+        except Exception as e:
+            self._fail(e)
+            raise
+        if self.record is not None:
+            self.record.lap("fetch")
+        if self.first_batch_time is None:
+            self.first_batch_time = time.perf_counter() - self._start
+        rows = len(batch) if batch is not None else 0
+        self.rows_fetched += rows
+        if batch is not None:
+            self.column_types = batch.types
+            if self.record is not None:
+                self.bytes_fetched += batch.nbytes()
+        if rows < self.batch_size:
+            self.close()
+        return batch
+
+    def batches(self):
+        while True:
+            batch = self.fetch_batch()
+            if not batch:
+                return
+            yield batch
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from batch
+
+    def close(self, suspect=False):
+        self.exhausted = True
+        if self.record is not None and not self._recorded:
+            self._recorded = True
+            self.record._metrics.finish(self.record, self.rows_fetched, self.bytes_fetched, self.error)
+        if self._cursor is not None:
+            try:
+                self._cursor.close()
+            except Exception:
+                pass
+            self._cursor = None
+        if self._connection is not None:
+            self.pool.release(self._connection, suspect)
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def merge_host_results(results):
+    """將多系統查詢結果合併為一個表格，第一欄為 SYSTEM
+
+    以第一個成功系統的欄位為準，其他系統依欄位名稱對齊，缺少的欄位填 None。
+    """
+    columns = None
+    for outcome in results.values():
+        if outcome["error"] is None:
+            columns = outcome["columns"]
+            break
+    if columns is None:
+        return None, ResultSet([])
+
+    merged_columns = ["SYSTEM"] + list(columns)
+    merged = ResultSet(merged_columns)
+    for host, outcome in results.items():
+        rows = outcome["rows"]
+        if outcome["error"] is not None or not len(rows):
+            continue
+        if outcome["columns"] == columns:
+            data = [rows.column(index) for index in range(len(columns))]
+            types = rows.types
+        else:
+            data = [rows.column(name) if name in outcome["columns"] else [None] * len(rows)
+                    for name in columns]
+            types = [rows.types[outcome["columns"].index(name)] if name in outcome["columns"] else "object"
+                     for name in columns]
+        merged.append_batch(ColumnBatch(merged_columns, ["str"] + list(types), [[host] * len(rows)] + data))
+    return merged_columns, merged
+
+
+class AS400Connector:
+    def __init__(self, pool_min_size=POOL_MIN_SIZE, pool_max_size=POOL_MAX_SIZE,
+                 pool_idle_timeout=POOL_IDLE_TIMEOUT, driver=None):
         self.connections = {}
+        self.driver = driver or create_driver()
         self.current_connection = None
+        self.result_cache = ResultCache()
+        self.single_flight = SingleFlight()
+        self.metrics = QueryMetrics()
+        self.pool_options = {
+            "min_size": pool_min_size,
+            "max_size": pool_max_size,
+            "idle_timeout": pool_idle_timeout,
+            "driver": self.driver,
+        }
 
     def connect_to_as400(self, host, user, password):
         try:
-            connection_string = f"jdbc:as400://{host}"
-            connection = jaydebeapi.connect("com.ibm.as400.access.AS400JDBCDriver",
-                                            connection_string,
-                                            [user, password],
-                                            jt400_path)
-            self.connections[host] = connection
+            pool = ConnectionPool(host, user, password, result_cache=self.result_cache, metrics=self.metrics,
+                                  single_flight=self.single_flight, **self.pool_options)
+            self.result_cache.invalidate(host)
+            if host in self.connections:
+                self.connections[host].close()
+            self.connections[host] = pool
             self.current_connection = host
-            return connection, None
+            return pool, None
         except Exception as e:
             return None, str(e)
 
@@ -31,6 +1008,7 @@ class AS400Connector:
             try:
                 self.connections[host].close()
                 del self.connections[host]
+                self.result_cache.invalidate(host)
                 if self.connections:
                     self.current_connection = next(iter(self.connections))
                 else:
@@ -47,17 +1025,87 @@ class AS400Connector:
             return True
         return False
 
-    def execute_query(self, query):
-        if not self.current_connection:
+    def get_pool_stats(self, host=None):
+        """取得連接池的借出/歸還統計"""
+        host = host or self.current_connection
+        if host not in self.connections:
+            return None
+        return self.connections[host].get_stats()
+
+    def stream_query(self, query, batch_size=FETCH_BATCH_SIZE, host=None, params=None, source="AS400Connector"):
+        """執行查詢並回傳 QueryStream，由呼叫端逐批讀取"""
+        host = host or self.current_connection
+        if not host:
             return None, "沒有活動的連接"
+        pool = self.connections.get(host)
+        if pool is None:
+            return None, f"未連接到 {host}"
         try:
-            with self.connections[self.current_connection].cursor() as cursor:
-                cursor.execute(query)
+            stream = QueryStream(pool, query, batch_size, params, source)
+            return stream.open(), None
+        except Exception as e:
+            return None, str(e)
+
+    def execute_query(self, query, host=None, params=None, source="AS400Connector"):
+        host = host or self.current_connection
+        if not host:
+            return None, "沒有活動的連接"
+        pool = self.connections.get(host)
+        if pool is None:
+            return None, f"未連接到 {host}"
+        record = start_query_record(pool, source, query)
+
+        def fetch():
+            with pool.cursor() as cursor:
+                cursor.execute(query, params or ())
+                record_execute(record, cursor)
                 columns = [desc[0] for desc in cursor.description]
-                result = cursor.fetchall()
-                return (columns, result), None
+                return columns, read_result_set(cursor, columns, FETCH_BATCH_SIZE, record)
+
+        try:
+            # 相同的查詢正在執行時（例如連按刷新）等待同一個結果
+            result, shared = single_flight(pool, query, params, fetch)
         except Exception as e:
+            finish_query_record(record, error=str(e))
             return None, str(e)
+        return finish_query_record(record, result, cached=shared), None
+
+    def execute_query_on_hosts(self, query, hosts=None, max_rows=None):
+        """在多個系統上同時執行同一查詢
+
+        hosts 為 None 時使用所有已連接的系統。回傳依 hosts 順序排列的
+        {host: {"columns", "rows", "error", "elapsed", "truncated"}}，
+        整體耗時接近最慢的系統而非各系統相加。
+        """
+        hosts = [host for host in (hosts or list(self.connections)) if host in self.connections]
+        if not hosts:
+            return {}
+        token = current_cancel_token()
+        with ThreadPoolExecutor(max_workers=min(len(hosts), FANOUT_MAX_WORKERS)) as executor:
+            futures = [executor.submit(self._query_host, host, query, max_rows, token) for host in hosts]
+            return {host: future.result() for host, future in zip(hosts, futures)}
+
+    def _query_host(self, host, query, max_rows, token):
+        outcome = {"columns": None, "rows": ResultSet([]), "error": None, "elapsed": None, "truncated": False}
+        start = time.perf_counter()
+        try:
+            with token.activate(start_timer=False) if token else nullcontext():
+                with QueryStream(self.connections[host], query, source="AS400Connector.fanout").open() as stream:
+                    outcome["columns"] = stream.columns
+                    rows = outcome["rows"] = ResultSet(stream.columns)
+                    while True:
+                        batch = stream.fetch_column_batch()
+                        if batch is None:
+                            break
+                        if max_rows is not None and len(rows) + len(batch) >= max_rows:
+                            rows.append_batch(batch.slice(0, max_rows - len(rows)))
+                            outcome["truncated"] = stream.rows_fetched > max_rows or not stream.exhausted
+                            break
+                        rows.append_batch(batch)
+        except Exception as e:
+            outcome["error"] = str(e)
+        outcome["elapsed"] = time.perf_counter() - start
+        return outcome
 
 # 保留原有的獨立函數，以保持向後兼容性
 def connect_to_as400(host, user, password):
@@ -76,7 +1124,7 @@ def execute_query(connection, query):
         with connection.cursor() as cursor:
             cursor.execute(query)
             columns = [desc[0] for desc in cursor.description]
-            result = cursor.fetchall()
+            result = [row for batch in fetch_batches(cursor) for row in batch]
             return (columns, result), None
     except Exception as e:
-        return None, str(e)
\ No newline at end of file
+        return None, str(e)
@@ -0,0 +1,325 @@
+"""效能基準測試
+
+以模擬驅動量測連接器查詢、主視窗表格顯示、Excel 匯出、作業管理與用戶管理頁面，
+結果寫入 JSON 檔以便比較不同版本：
+
+    python benchmark.py --rows=1000,100000,1000000 --output=benchmark.json
+    python benchmark.py --rows=100000 --compare=benchmark.json
+
+每個資料量在獨立的子行程中執行，峰值記憶體 (peak RSS) 互不影響。
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+DEFAULT_ROWS = [1000, 100000, 1000000]
+DEFAULT_OUTPUT = "benchmark.json"
+BENCHMARK_HOST = "BENCH400"
+BENCHMARK_QUERY = "SELECT * FROM QSYS2.ACTIVE_JOB_INFO"
+WAIT_TIMEOUT = 3600
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 回報，macOS 以 bytes 回報
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Timer:
+    """累計某個方法被呼叫的總耗時，不改變方法行為"""
+
+    def __init__(self, obj, name):
+        self.seconds = 0.0
+        self.calls = 0
+        original = getattr(obj, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - start
+                self.calls += 1
+
+        setattr(obj, name, timed)
+
+    def reset(self):
+        self.seconds = 0.0
+        self.calls = 0
+
+
+def wait_until(app, predicate, timeout=WAIT_TIMEOUT):
+    from PySide6.QtCore import QEventLoop
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("等待背景查詢逾時")
+        app.processEvents(QEventLoop.AllEvents, 50)
+        time.sleep(0.001)
+
+
+def silence_dialogs(export_path):
+    """基準測試不能停在對話框上：訊息框直接返回，存檔對話框回傳暫存檔路徑"""
+    from PySide6.QtWidgets import QFileDialog, QMessageBox
+    for name in ("information", "warning", "critical"):
+        setattr(QMessageBox, name, staticmethod(lambda *args, **kwargs: QMessageBox.Ok))
+    QMessageBox.question = staticmethod(lambda *args, **kwargs: QMessageBox.Yes)
+    QFileDialog.getSaveFileName = staticmethod(lambda *args, **kwargs: (export_path, ""))
+
+
+def bench_connector(driver, rows):
+    """AS400Connector.execute_query，並以 QueryStream 拆分讀取與轉換時間"""
+    from as400_connector import AS400Connector, QueryStream
+    from columnar import ResultSet
+
+    connector = AS400Connector(driver=driver)
+    start = time.perf_counter()
+    _, error = connector.connect_to_as400(BENCHMARK_HOST, "BENCH", "BENCH")
+    if error:
+        raise RuntimeError(error)
+    connect_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result, error = connector.execute_query(BENCHMARK_QUERY)
+    if error:
+        raise RuntimeError(error)
+    total_time = time.perf_counter() - start
+
+    fetch_time = convert_time = 0.0
+    with QueryStream(connector.connections[BENCHMARK_HOST], BENCHMARK_QUERY).open() as stream:
+        result_set = ResultSet(stream.columns)
+        while True:
+            start = time.perf_counter()
+            batch = stream.fetch_column_batch()
+            fetch_time += time.perf_counter() - start
+            if batch is None:
+                break
+            start = time.perf_counter()
+            result_set.append_batch(batch)
+            for col in range(len(batch.columns)):
+                batch.display_column(col)
+            convert_time += time.perf_counter() - start
+        execute_time = stream.execute_time
+    connector.disconnect_from_as400(BENCHMARK_HOST)
+    return {
+        "rows": len(result[1]),
+        "connect_s": connect_time,
+        "execute_query_s": total_time,
+        "execute_s": execute_time,
+        "fetch_s": fetch_time,
+        "convert_s": convert_time,
+        "result_bytes": result_set.nbytes(),
+        "rows_per_s": len(result[1]) / total_time if total_time else None,
+    }
+
+
+def bench_gui(app, driver, rows, export_path):
+    from gui import AS400ConnectorGUI
+
+    results = {}
+    main_gui = AS400ConnectorGUI(driver)
+    main_gui.host_input.setText(BENCHMARK_HOST)
+    main_gui.user_input.setText("BENCH")
+    main_gui.password_input.setText("BENCH")
+    main_gui.connect_to_as400()
+    user_gui = main_gui.user_managers[BENCHMARK_HOST]
+    job_gui = main_gui.job_managers[BENCHMARK_HOST]
+    # 管理頁面只在顯示時由 RefreshScheduler 刷新，開始量測前確認沒有背景查詢
+    wait_until(app, lambda: not user_gui.query_runner.is_busy() and not job_gui.query_runner.is_busy())
+
+    # 主視窗查詢：整體時間與表格填入時間
+    render = Timer(main_gui, "append_result_batch")
+    main_gui.query_input.setPlainText(BENCHMARK_QUERY)
+    start = time.perf_counter()
+    main_gui.execute_query()
+    wait_until(app, lambda: main_gui.active_query is None)
+    first_page_time = time.perf_counter() - start
+    # 第一批顯示後游標保持開啟，以「全部讀取」讀完其餘資料
+    main_gui.fetch_all_results()
+    wait_until(app, lambda: main_gui.active_stream is None)
+    results["gui_query"] = {
+        "rows": len(main_gui.result),
+        "first_page_s": first_page_time,
+        "total_s": time.perf_counter() - start,
+        "render_s": render.seconds,
+        "batches": render.calls,
+    }
+
+    start = time.perf_counter()
+    main_gui.export_results()
+    wait_until(app, lambda: main_gui.active_export is None)
+    export_time = time.perf_counter() - start
+    size = os.path.getsize(export_path) if os.path.exists(export_path) else 0
+    results["export"] = {
+        "format": "xlsx",
+        "rows": len(main_gui.result),
+        "export_s": export_time,
+        "bytes": size,
+        "rows_per_s": len(main_gui.result) / export_time if export_time else None,
+        "mb_per_s": size / (1024 * 1024) / export_time if export_time else None,
+    }
+
+    # 作業管理：刷新（查詢 + 表格填入）與篩選
+    render = Timer(job_gui, "show_job_list")
+    start = time.perf_counter()
+    job_gui.refresh_job_list()
+    wait_until(app, lambda: render.calls > 0)
+    refresh_time = time.perf_counter() - start
+    job_gui.subsystem_filter.blockSignals(True)
+    job_gui.subsystem_filter.setText("q")
+    job_gui.subsystem_filter.blockSignals(False)
+    start = time.perf_counter()
+    job_gui.apply_filters()
+    filter_time = time.perf_counter() - start
+    results["job_manager"] = {
+        "rows": job_gui.job_table.row_count(),
+        "refresh_s": refresh_time,
+        "render_s": render.seconds,
+        "apply_filters_s": filter_time,
+    }
+
+    # 用戶管理：略過快取的刷新與命中快取的刷新
+    render = Timer(user_gui, "show_user_list")
+    start = time.perf_counter()
+    user_gui.refresh_user_list(refresh=True)
+    wait_until(app, lambda: render.calls > 0)
+    refresh_time = time.perf_counter() - start
+    uncached_render = render.seconds
+    render.reset()
+    start = time.perf_counter()
+    user_gui.refresh_user_list()
+    wait_until(app, lambda: render.calls > 0)
+    results["user_manager"] = {
+        "rows": user_gui.user_table.row_count(),
+        "refresh_s": refresh_time,
+        "render_s": uncached_render,
+        "cached_refresh_s": time.perf_counter() - start,
+    }
+
+    main_gui.query_runner.cancel_all()
+    main_gui.as400_connector.disconnect_from_as400(BENCHMARK_HOST)
+    return results
+
+
+def run_child(rows, latency, row_latency):
+    """在子行程中執行單一資料量的所有項目"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtWidgets import QApplication
+    from drivers import SimulatedDriver
+
+    app = QApplication(sys.argv)
+    export_path = os.path.join(tempfile.mkdtemp(prefix="db400_bench_"), "export.xlsx")
+    silence_dialogs(export_path)
+
+    driver = SimulatedDriver(jobs=rows, users=rows, messages=100, history=100, spool_files=0,
+                             latency=latency, row_latency=row_latency, activity=False)
+    start = time.perf_counter()
+    driver.connect(BENCHMARK_HOST, "BENCH", "BENCH").close()
+    result = {"rows": rows, "setup_s": time.perf_counter() - start}
+
+    result["connector"] = bench_connector(driver, rows)
+    result["peak_rss_mb_after_connector"] = peak_rss_mb()
+    result.update(bench_gui(app, driver, rows, export_path))
+    result["peak_rss_mb"] = peak_rss_mb()
+
+    if os.path.exists(export_path):
+        os.remove(export_path)
+    driver.close()
+    return result
+
+
+def run_size(rows, latency, row_latency):
+    command = [sys.executable, os.path.abspath(__file__), "--child", f"--rows={rows}",
+               f"--latency={latency}", f"--row-latency={row_latency}"]
+    process = subprocess.run(command, capture_output=True, text=True)
+    lines = process.stdout.strip().splitlines()
+    if process.returncode != 0 or not lines:
+        return {"rows": rows, "error": (process.stderr.strip().splitlines() or ["子行程沒有輸出"])[-1]}
+    return json.loads(lines[-1])
+
+
+def flatten(result, prefix=""):
+    values = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[f"{prefix}{key}"] = value
+    return values
+
+
+def print_result(result, baseline=None):
+    print(f"== {result['rows']} 行 ==")
+    if "error" in result:
+        print(f"  失敗: {result['error']}")
+        return
+    old = flatten(baseline) if baseline else {}
+    for key, value in flatten(result).items():
+        line = f"  {key:<36} {value:14.3f}"
+        if key in old and old[key]:
+            line += f"  ({value / old[key]:.2f}x)"
+        print(line)
+
+
+def parse_args(argv):
+    options = {"rows": DEFAULT_ROWS, "output": DEFAULT_OUTPUT, "latency": 0.0, "row_latency": 0.0,
+               "compare": None, "child": False}
+    for arg in argv:
+        key, _, value = arg.lstrip("-").partition("=")
+        key = key.replace("-", "_")
+        if key == "rows":
+            options["rows"] = [int(item) for item in value.split(",") if item]
+        elif key in ("latency", "row_latency"):
+            options[key] = float(value)
+        elif key in ("output", "compare"):
+            options[key] = value
+        elif key == "child":
+            options["child"] = True
+        else:
+            raise SystemExit(f"未知的參數: {arg}")
+    return options
+
+
+def main():
+    options = parse_args(sys.argv[1:])
+    if options["child"]:
+        print(json.dumps(run_child(options["rows"][0], options["latency"], options["row_latency"])))
+        return
+
+    baseline = {}
+    if options["compare"]:
+        with open(options["compare"], encoding="utf-8") as f:
+            baseline = {item["rows"]: item for item in json.load(f)["results"]}
+
+    results = []
+    for rows in options["rows"]:
+        result = run_size(rows, options["latency"], options["row_latency"])
+        print_result(result, baseline.get(rows))
+        results.append(result)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "driver": "simulated",
+        "latency": options["latency"],
+        "row_latency": options["row_latency"],
+        "query": BENCHMARK_QUERY,
+        "results": results,
+    }
+    with open(options["output"], "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"結果已寫入 {options['output']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,545 @@
+import datetime
+import decimal
+import sys
+from array import array
+from itertools import compress
+
+# java.sql.Types 常數對應到欄位類型
+_JDBC_TYPES = {
+    -7: "bool", 16: "bool",                                  # BIT, BOOLEAN
+    -6: "int", 5: "int", 4: "int", -5: "int",                # TINYINT, SMALLINT, INTEGER, BIGINT
+    6: "float", 7: "float", 8: "float", 2: "float", 3: "float",  # FLOAT, REAL, DOUBLE, NUMERIC, DECIMAL
+    1: "str", 12: "str", -1: "str", -15: "str", -9: "str", -16: "str", 2005: "str", 2011: "str",
+    91: "date", 92: "time", 93: "timestamp",
+    -2: "bytes", -3: "bytes", -4: "bytes", 2004: "bytes",
+}
+
+
+# 字串欄位讀入這麼多列後，若不重複值比例超過門檻就改回一般列表，不再做字典編碼
+DICT_ENCODING_CHECK_ROWS = 1024
+DICT_ENCODING_MAX_RATIO = 0.5
+
+
+class ColumnBatch:
+    """一批以欄為單位儲存的查詢結果
+
+    data[i] 是第 i 欄的值列表，types[i] 是在讀取前依欄位描述選定的類型。
+    display_column() 會快取整欄的顯示字串，表格與匯出不需逐格再呼叫 str()。
+    """
+
+    def __init__(self, columns, types, data):
+        self.columns = columns
+        self.types = types
+        self.data = data
+        self.num_rows = len(data[0]) if data else 0
+        self._display = {}
+
+    def __len__(self):
+        return self.num_rows
+
+    def column(self, index):
+        return self.data[index]
+
+    def row(self, index):
+        return tuple(column[index] for column in self.data)
+
+    def rows(self):
+        return list(zip(*self.data)) if self.data else []
+
+    def display_column(self, index):
+        display = self._display.get(index)
+        if display is None:
+            values = self.data[index]
+            if self.types[index] == "str":
+                display = [value if value is not None else "None" for value in values]
+            else:
+                display = list(map(str, values))
+            self._display[index] = display
+        return display
+
+    def nbytes(self):
+        """以前 100 列抽樣粗估這批資料佔用的記憶體"""
+        if not self.num_rows:
+            return 0
+        sample = min(self.num_rows, 100)
+        size = sum(sys.getsizeof(value) for column in self.data for value in column[:sample])
+        return size * self.num_rows // sample
+
+    def slice(self, start, stop):
+        return ColumnBatch(self.columns, self.types, [column[start:stop] for column in self.data])
+
+    def take(self, indexes):
+        return ColumnBatch(self.columns, self.types, [[column[i] for i in indexes] for column in self.data])
+
+
+def _timestamp_to_str(value):
+    # 與 jaydebeapi 相同的格式：YYYY-MM-DD HH:MM:SS[.ffffff]
+    if value is None:
+        return None
+    text = str(value)
+    seconds, _, fraction = text.partition(".")
+    fraction = fraction[:6].rstrip("0")
+    return f"{seconds}.{fraction.ljust(6, '0')}" if fraction else seconds
+
+
+def _jdbc_getter(rs, type_name, index):
+    """依欄位類型選定一次 ResultSet 取值函數，讀取時不再逐格判斷"""
+    if type_name == "str":
+        return lambda: rs.getString(index)
+    if type_name == "int":
+        def get_int():
+            value = rs.getLong(index)
+            return None if rs.wasNull() else value
+        return get_int
+    if type_name == "float":
+        def get_float():
+            value = rs.getDouble(index)
+            return None if rs.wasNull() else value
+        return get_float
+    if type_name == "bool":
+        def get_bool():
+            value = rs.getBoolean(index)
+            return None if rs.wasNull() else bool(value)
+        return get_bool
+    if type_name == "timestamp":
+        return lambda: rs.getTimestamp(index)
+    if type_name == "date":
+        return lambda: rs.getDate(index)
+    if type_name == "time":
+        return lambda: rs.getTime(index)
+    if type_name == "bytes":
+        return lambda: rs.getBytes(index)
+    return lambda: rs.getObject(index)
+
+
+def _finish_jdbc_column(type_name, values):
+    """整欄轉換 Java 物件"""
+    if type_name == "timestamp":
+        return [_timestamp_to_str(value) for value in values]
+    if type_name in ("date", "time"):
+        return [None if value is None else str(value) for value in values]
+    if type_name == "bytes":
+        return [None if value is None else bytes(value) for value in values]
+    if type_name == "str":
+        return [None if value is None else str(value) for value in values]
+    return values
+
+
+def jdbc_column_types(cursor):
+    meta = cursor._meta
+    return [_JDBC_TYPES.get(meta.getColumnType(i), "object") for i in range(1, meta.getColumnCount() + 1)]
+
+
+def _python_type(values):
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            return "bool"
+        if isinstance(value, int):
+            return "int"
+        if isinstance(value, (float, decimal.Decimal)):
+            return "float"
+        if isinstance(value, str):
+            return "str"
+        if isinstance(value, datetime.datetime):
+            return "timestamp"
+        if isinstance(value, datetime.date):
+            return "date"
+        if isinstance(value, (bytes, bytearray)):
+            return "bytes"
+        return "object"
+    return "object"
+
+
+def fetch_column_batch(cursor, batch_size, columns, types=None):
+    """讀取一批資料並轉為 ColumnBatch，沒有資料時回傳 None
+
+    jaydebeapi cursor 直接從 JDBC ResultSet 讀取，每欄的取值函數只選定一次；
+    其他 DB-API cursor 以 fetchmany 讀取後整批轉置。
+    types 可傳入前一批的類型，讓同一個結果集各批類型一致。
+    """
+    rs = getattr(cursor, "_rs", None)
+    if rs is not None and getattr(cursor, "_meta", None) is not None:
+        types = types or jdbc_column_types(cursor)
+        getters = [_jdbc_getter(rs, type_name, i) for i, type_name in enumerate(types, 1)]
+        data = [[] for _ in getters]
+        appends = [column.append for column in data]
+        pairs = list(zip(appends, getters))
+        count = 0
+        while count < batch_size and rs.next():
+            for append, getter in pairs:
+                append(getter())
+            count += 1
+        if not count:
+            return None
+        data = [_finish_jdbc_column(type_name, values) for type_name, values in zip(types, data)]
+        return ColumnBatch(columns, types, data)
+
+    rows = cursor.fetchmany(batch_size)
+    if not rows:
+        return None
+    data = [list(values) for values in zip(*rows)]
+    types = types or [_python_type(values) for values in data]
+    return ColumnBatch(columns, types, data)
+
+
+class _ObjectColumn:
+    kind = "object"
+
+    def __init__(self, values=()):
+        self.data = list(values)
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, index):
+        return self.data[index]
+
+    def extend(self, values):
+        self.data.extend(values)
+
+    def set(self, index, value):
+        self.data[index] = value
+
+    def copy(self):
+        return _ObjectColumn(self.data)
+
+    def values(self, start=0, stop=None):
+        return self.data[start:stop]
+
+    def nbytes(self):
+        sample = self.data[:100]
+        per_value = sum(sys.getsizeof(value) for value in sample) / len(sample) if sample else 0
+        return sys.getsizeof(self.data) + int(per_value * len(self.data))
+
+
+class _NumberColumn:
+    """以 array 儲存的數值欄位，NULL 另以位元組遮罩記錄"""
+
+    def __init__(self, kind, typecode):
+        self.kind = kind
+        self.data = array(typecode)
+        self.nulls = bytearray()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, index):
+        return None if self.nulls[index] else self.data[index]
+
+    def extend(self, values):
+        # 先建立完整的 array 再合併，型別不符時不會留下一半的資料
+        self.data += array(self.data.typecode, [0 if value is None else value for value in values])
+        self.nulls += bytearray(value is None for value in values)
+
+    def set(self, index, value):
+        self.data[index] = 0 if value is None else value
+        self.nulls[index] = value is None
+
+    def copy(self):
+        column = _NumberColumn(self.kind, self.data.typecode)
+        column.data = array(self.data.typecode, self.data)
+        column.nulls = bytearray(self.nulls)
+        return column
+
+    def values(self, start=0, stop=None):
+        return [None if null else value for value, null in zip(self.data[start:stop], self.nulls[start:stop])]
+
+    def nbytes(self):
+        return self.data.itemsize * len(self.data) + len(self.nulls)
+
+
+class _DictColumn:
+    """字典編碼的字串欄位：每列只存一個整數代碼"""
+    kind = "str"
+
+    def __init__(self):
+        self.codes = array("I")
+        self.dictionary = []
+        self._index = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def get(self, index):
+        return self.dictionary[self.codes[index]]
+
+    def extend(self, values):
+        index = self._index
+        dictionary = self.dictionary
+        codes = []
+        for value in values:
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(dictionary)
+                dictionary.append(value)
+            codes.append(code)
+        self.codes += array("I", codes)
+
+    def set(self, index, value):
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.dictionary)
+            self.dictionary.append(value)
+        self.codes[index] = code
+
+    def copy(self):
+        column = _DictColumn()
+        column.codes = array("I", self.codes)
+        column.dictionary = list(self.dictionary)
+        column._index = dict(self._index)
+        return column
+
+    def values(self, start=0, stop=None):
+        dictionary = self.dictionary
+        return [dictionary[code] for code in self.codes[start:stop]]
+
+    def worth_keeping(self):
+        return (len(self.codes) < DICT_ENCODING_CHECK_ROWS
+                or len(self.dictionary) <= len(self.codes) * DICT_ENCODING_MAX_RATIO)
+
+    def nbytes(self):
+        return (self.codes.itemsize * len(self.codes) + sys.getsizeof(self.dictionary)
+                + sum(sys.getsizeof(value) for value in self.dictionary))
+
+
+def _new_column(kind):
+    if kind == "int":
+        return _NumberColumn("int", "q")
+    if kind == "float":
+        return _NumberColumn("float", "d")
+    if kind == "str":
+        return _DictColumn()
+    return _ObjectColumn()
+
+
+class ResultSet:
+    """記憶體精簡的欄式查詢結果
+
+    數值欄位存成 array，重複性高的字串欄位做字典編碼，
+    value()/display() 直接讀取單格，不需要先組成每一列的 tuple。
+    為了相容原本的 (columns, rows) 用法，也支援 len()、索引取列與逐列迭代。
+    record 為讀取此結果的 QueryRecord（查詢指紋等）；結果可能由多個呼叫者與快取共用，
+    各呼叫者自己的記錄在 as400_connector.QueryResult.record。
+
+    match_rows()/sort_rows() 供表格篩選與排序使用：每欄的小寫顯示字串在第一次
+    使用時建立並快取，字典編碼的欄位只需比對不重複的值。
+    """
+
+    def __init__(self, columns, types=None):
+        self.columns = list(columns)
+        self.types = types
+        self._data = None
+        self.num_rows = 0
+        self.record = None
+        self._lower = {}
+
+    @classmethod
+    def from_rows(cls, columns, rows, types=None):
+        result = cls(columns, types)
+        result.append_rows(rows)
+        return result
+
+    def _ensure_columns(self, types):
+        if self._data is None:
+            self.types = list(self.types or types)
+            self._data = [_new_column(kind) for kind in self.types]
+
+    def _extend_column(self, index, values):
+        column = self._data[index]
+        try:
+            column.extend(values)
+        except (TypeError, OverflowError, ValueError):
+            # 數值欄位遇到不相容的值時改用一般列表
+            column = self._data[index] = _ObjectColumn(column.values())
+            column.extend(values)
+        if isinstance(column, _DictColumn) and not column.worth_keeping():
+            self._data[index] = _ObjectColumn(column.values())
+
+    def append_batch(self, batch):
+        if batch is None or not len(batch):
+            return
+        self._ensure_columns(batch.types)
+        for index, values in enumerate(batch.data):
+            self._extend_column(index, values)
+        self.num_rows += len(batch)
+
+    def set_row(self, index, values):
+        """以新的值取代第 index 列，供增量刷新使用"""
+        for col, value in enumerate(values):
+            column = self._data[col]
+            try:
+                column.set(index, value)
+            except (TypeError, OverflowError, ValueError):
+                column = self._data[col] = _ObjectColumn(column.values())
+                column.set(index, value)
+            cached = self._lower.get(col)
+            if cached is not None and cached[0] is column and not isinstance(column, _DictColumn) \
+                    and index < len(cached[1]):
+                cached[1][index] = (value if isinstance(value, str) else str(value)).lower()
+
+    def copy(self):
+        """複製一份可以獨立修改的結果（欄位資料各自複製，不含篩選用的小寫快取）"""
+        result = ResultSet(self.columns, self.types)
+        result.num_rows = self.num_rows
+        result.record = self.record
+        if self._data is not None:
+            result._data = [column.copy() for column in self._data]
+        return result
+
+    def append_rows(self, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        data = [list(values) for values in zip(*rows)]
+        self.append_batch(ColumnBatch(self.columns, self.types or [_python_type(v) for v in data], data))
+
+    def __len__(self):
+        return self.num_rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.row(i) for i in range(*index.indices(self.num_rows))]
+        if index < 0:
+            index += self.num_rows
+        if not 0 <= index < self.num_rows:
+            raise IndexError(index)
+        return self.row(index)
+
+    def __iter__(self):
+        return self.rows()
+
+    def value(self, row, col):
+        return self._data[col].get(row)
+
+    def display(self, row, col):
+        value = self._data[col].get(row)
+        return value if isinstance(value, str) else str(value)
+
+    def row(self, index):
+        return tuple(column.get(index) for column in self._data)
+
+    def rows(self, start=0, stop=None):
+        if self._data is None:
+            return
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        for index in range(start, stop):
+            yield tuple(column.get(index) for column in self._data)
+
+    def column(self, col):
+        if isinstance(col, str):
+            col = self.columns.index(col)
+        return self._data[col].values() if self._data else []
+
+    def column_index(self, name):
+        return self.columns.index(name)
+
+    def batch(self, start=0, stop=None):
+        """取出一段列為 ColumnBatch，供匯出等需要逐批處理的地方使用"""
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        if self._data is None or start >= stop:
+            return None
+        return ColumnBatch(self.columns, self.types, [column.values(start, stop) for column in self._data])
+
+    def nbytes(self):
+        return sum(column.nbytes() for column in self._data) if self._data else 0
+
+    def lower_index(self, col):
+        """回傳 (代碼, 小寫字串表)
+
+        字典編碼欄位的第 i 列為 表[代碼[i]]；其他欄位代碼為 None，表即為逐列的小寫字串。
+        追加資料後只補上新的部分。
+        """
+        column = self._data[col]
+        cached = self._lower.get(col)
+        if cached is None or cached[0] is not column:
+            cached = self._lower[col] = (column, [])
+        table = cached[1]
+        if isinstance(column, _DictColumn):
+            values = column.dictionary[len(table):]
+            table += [value.lower() if isinstance(value, str) else str(value).lower() for value in values]
+            return column.codes, table
+        if len(table) < len(column):
+            table += [(value if isinstance(value, str) else str(value)).lower()
+                      for value in (column.get(i) for i in range(len(table), len(column)))]
+        return None, table
+
+    def match_rows(self, col, predicate, rows=None):
+        """回傳小寫顯示字串符合 predicate 的列號；rows 為候選列號，None 表示全部"""
+        if self._data is None:
+            return []
+        codes, table = self.lower_index(col)
+        hits = list(map(predicate, table))
+        if codes is not None:
+            if rows is None:
+                return list(compress(range(len(codes)), map(hits.__getitem__, codes)))
+            return [row for row in rows if hits[codes[row]]]
+        if rows is None:
+            return list(compress(range(len(hits)), hits))
+        return [row for row in rows if hits[row]]
+
+    def sort_rows(self, col, rows=None, reverse=False):
+        """依欄位值排序列號，NULL 排在最後；rows 為 None 時排序全部的列"""
+        rows = range(self.num_rows) if rows is None else rows
+        if self._data is None:
+            return list(rows)
+        column = self._data[col]
+        if isinstance(column, _DictColumn):
+            # 先排序不重複的值，每列只以整數名次比較
+            dictionary = column.dictionary
+            order = _sorted_indexes(dictionary)
+            ranks = [0] * len(dictionary)
+            for rank, index in enumerate(order):
+                ranks[index] = rank
+            codes = column.codes
+            null_codes = {code for code, value in enumerate(dictionary) if value is None}
+            return _nulls_last(rows, lambda row: codes[row] in null_codes, lambda row: ranks[codes[row]], reverse)
+        if isinstance(column, _NumberColumn):
+            data, nulls = column.data, column.nulls
+            return _nulls_last(rows, nulls.__getitem__, data.__getitem__, reverse)
+        values = column.data
+
+        def is_null(row):
+            return values[row] is None
+
+        try:
+            return _nulls_last(rows, is_null, values.__getitem__, reverse)
+        except TypeError:
+            # 同一欄混有無法比較的型別時改以顯示字串排序
+            return _nulls_last(rows, is_null, lambda row: str(values[row]), reverse)
+
+
+def _nulls_last(rows, is_null, key, reverse):
+    """只反轉非 NULL 值的順序，NULL 不論升降冪都排在最後"""
+    values = [row for row in rows if not is_null(row)]
+    values.sort(key=key, reverse=reverse)
+    return values + [row for row in rows if is_null(row)]
+
+
+def _sorted_indexes(values):
+    try:
+        return sorted(range(len(values)), key=lambda i: (values[i] is None, values[i]))
+    except TypeError:
+        return sorted(range(len(values)), key=lambda i: (values[i] is None, str(values[i])))
+
+
+def read_result_set(cursor, columns, batch_size, record=None):
+    """以 fetch_column_batch 將整個結果讀入 ResultSet
+
+    傳入 QueryRecord 時分別累計讀取 (fetch) 與轉換 (convert) 的時間。
+    """
+    result = ResultSet(columns)
+    result.record = record
+    while True:
+        batch = fetch_column_batch(cursor, batch_size, columns, result.types)
+        if record is not None:
+            record.lap("fetch")
+        if batch is None:
+            break
+        result.append_batch(batch)
+        if record is not None:
+            record.lap("convert")
+        if len(batch) < batch_size:
+            break
+    return result
@@ -0,0 +1,576 @@
+import random
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+jt400_path = "/Users/clark/Desktop/DDSC/Clark文件/13-JavaCode/jt400.jar"
+driver_class = "com.ibm.as400.access.AS400JDBCDriver"
+
+_jvm_lock = threading.Lock()
+
+
+def start_jvm():
+    """啟動 JVM 並載入 jt400 驅動類別，已啟動時直接返回"""
+    import jpype
+    with _jvm_lock:
+        if not jpype.isJVMStarted():
+            # 與 jaydebeapi.connect 使用相同的啟動參數，之後連接時會沿用這個 JVM
+            jpype.startJVM(jpype.getDefaultJVMPath(), f"-Djava.class.path={jt400_path}",
+                           ignoreUnrecognized=True, convertStrings=True)
+    jpype.JClass(driver_class)
+
+
+class JayDeBeApiDriver:
+    """透過 jaydebeapi 連接 IBM i（預設）"""
+    name = "jaydebeapi"
+    uses_jvm = True
+
+    def connect(self, host, user, password):
+        import jaydebeapi
+        return jaydebeapi.connect(driver_class, f"jdbc:as400://{host}", [user, password], jt400_path)
+
+    def warm_up(self):
+        start_jvm()
+
+
+class JPypeDriver:
+    """直接使用 JPype 內建的 DB-API (jpype.dbapi2)，少一層 jaydebeapi 的轉換"""
+    name = "jpype"
+    uses_jvm = True
+
+    def connect(self, host, user, password):
+        import jpype.dbapi2
+        start_jvm()
+        return jpype.dbapi2.connect(f"jdbc:as400://{host}", driver=driver_class,
+                                    driver_args={"user": user, "password": password})
+
+    def warm_up(self):
+        start_jvm()
+
+
+# ---------------------------------------------------------------------------
+# 模擬驅動：以 SQLite 模擬本工具用到的 QSYS2 服務，不需要真正的 IBM i
+# ---------------------------------------------------------------------------
+
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+_SCHEMA = {
+    "QSYS2_ACTIVE_JOB_INFO": """
+        ORDINAL_POSITION INTEGER, JOB_NAME TEXT PRIMARY KEY, JOB_NAME_SHORT TEXT, JOB_USER TEXT,
+        JOB_NUMBER TEXT, SUBSYSTEM TEXT, SUBSYSTEM_LIBRARY_NAME TEXT, AUTHORIZATION_NAME TEXT,
+        JOB_TYPE TEXT, FUNCTION_TYPE TEXT, FUNCTION TEXT, JOB_STATUS TEXT, CPU_TIME INTEGER,
+        TOTAL_DISK_IO_COUNT INTEGER, TEMPORARY_STORAGE INTEGER, ELAPSED_CPU_PERCENTAGE REAL""",
+    "QSYS2_USER_INFO": """
+        USER_NAME TEXT PRIMARY KEY, STATUS TEXT, PREVIOUS_SIGNON TEXT, PASSWORD_CHANGE_DATE TEXT,
+        USER_CLASS_NAME TEXT, SPECIAL_AUTHORITIES TEXT, TEXT_DESCRIPTION TEXT""",
+    "QSYS2_MESSAGE_QUEUE_INFO": """
+        MESSAGE_QUEUE_LIBRARY TEXT, MESSAGE_QUEUE_NAME TEXT, MESSAGE_ID TEXT, MESSAGE_TYPE TEXT,
+        MESSAGE_TEXT TEXT, SEVERITY INTEGER, MESSAGE_TIMESTAMP TEXT, MESSAGE_KEY TEXT,
+        FROM_USER TEXT, FROM_JOB TEXT""",
+    "QSYS2_HISTORY_LOG_INFO": """
+        ORDINAL_POSITION INTEGER, MESSAGE_ID TEXT, MESSAGE_TYPE TEXT, SEVERITY INTEGER,
+        MESSAGE_TIMESTAMP TEXT, FROM_USER TEXT, FROM_JOB TEXT, MESSAGE_TEXT TEXT, MESSAGE_KEY TEXT""",
+    "QSYS2_JOBLOG_INFO": """
+        JOB_NAME TEXT, ORDINAL_POSITION INTEGER, MESSAGE_ID TEXT, MESSAGE_TYPE TEXT, SEVERITY INTEGER,
+        MESSAGE_TIMESTAMP TEXT, MESSAGE_TEXT TEXT""",
+    "QSYS2_OUTPUT_QUEUE_ENTRIES_BASIC": """
+        OUTPUT_QUEUE_NAME TEXT, OUTPUT_QUEUE_LIBRARY_NAME TEXT, CREATE_TIMESTAMP TEXT,
+        SPOOLED_FILE_NAME TEXT, USER_NAME TEXT, USER_DATA TEXT, STATUS TEXT, SIZE INTEGER,
+        TOTAL_PAGES INTEGER, COPIES INTEGER, FORM_TYPE TEXT, JOB_NAME TEXT, DEVICE_TYPE TEXT,
+        OUTPUT_PRIORITY INTEGER, FILE_NUMBER INTEGER, SYSTEM TEXT""",
+    "SYSTOOLS_SPOOLED_FILE_DATA": """
+        JOB_NAME TEXT, SPOOLED_FILE_NAME TEXT, ORDINAL_POSITION INTEGER, SPOOLED_DATA TEXT""",
+}
+
+_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS AJI_SBS ON QSYS2_ACTIVE_JOB_INFO (SUBSYSTEM)",
+    "CREATE INDEX IF NOT EXISTS MQI_TS ON QSYS2_MESSAGE_QUEUE_INFO (MESSAGE_QUEUE_NAME, MESSAGE_TIMESTAMP)",
+    "CREATE INDEX IF NOT EXISTS HLI_TS ON QSYS2_HISTORY_LOG_INFO (MESSAGE_TIMESTAMP)",
+    "CREATE INDEX IF NOT EXISTS JLI_JOB ON QSYS2_JOBLOG_INFO (JOB_NAME)",
+    "CREATE INDEX IF NOT EXISTS OQE_USER ON QSYS2_OUTPUT_QUEUE_ENTRIES_BASIC (USER_NAME)",
+    "CREATE INDEX IF NOT EXISTS SFD_JOB ON SYSTOOLS_SPOOLED_FILE_DATA (JOB_NAME, SPOOLED_FILE_NAME)",
+]
+
+# 表格函數參數對應的篩選條件；整數鍵代表位置參數，未列出的參數會被忽略
+_TABLE_FUNCTION_FILTERS = {
+    "ACTIVE_JOB_INFO": {
+        "SUBSYSTEM_LIST_FILTER": "IN_LIST(SUBSYSTEM, {})",
+        "CURRENT_USER_LIST_FILTER": "IN_LIST(AUTHORIZATION_NAME, {})",
+        "JOB_NAME_FILTER": "IN_LIST(JOB_NAME_SHORT, {})",
+    },
+    "HISTORY_LOG_INFO": {
+        0: "MESSAGE_TIMESTAMP >= {}", "START_TIME": "MESSAGE_TIMESTAMP >= {}",
+        1: "MESSAGE_TIMESTAMP <= {}", "END_TIME": "MESSAGE_TIMESTAMP <= {}",
+    },
+    "JOBLOG_INFO": {0: "JOB_NAME = {}", "JOB_NAME": "JOB_NAME = {}"},
+    "SPOOLED_FILE_DATA": {
+        0: "JOB_NAME = {}", "JOB_NAME": "JOB_NAME = {}",
+        1: "SPOOLED_FILE_NAME = {}", "SPOOLED_FILE_NAME": "SPOOLED_FILE_NAME = {}",
+    },
+}
+
+_SUBSYSTEMS = ["QBATCH", "QINTER", "QSYSWRK", "QUSRWRK", "QSERVER", "QHTTPSVR", "QCMN", "QSPL"]
+_JOB_PROFILES = {
+    "QBATCH": ("BCH", ["PAYROLL", "INVUPD", "NIGHTLY", "GLPOST", "EDIIN"]),
+    "QINTER": ("INT", ["QPADEV"]),
+    "QSYSWRK": ("BCH", ["QTCPIP", "QYPSJSVR", "QZSCSRVS"]),
+    "QUSRWRK": ("PJ", ["QZDASOINIT", "QZRCSRVS"]),
+    "QSERVER": ("PJ", ["QZLSFILE", "QPWFSERVSO"]),
+    "QHTTPSVR": ("BCH", ["ADMIN", "WEBSRV"]),
+    "QCMN": ("BCH", ["QCMNARB01"]),
+    "QSPL": ("WTR", ["PRT01", "PRT02"]),
+}
+_JOB_STATUSES = ["RUN", "DEQW", "TIMW", "MSGW", "LCKW", "EVTW", "SELW", "CNDW"]
+_MESSAGES = [
+    ("CPF1124", 0, "Job {job} started on {date} in subsystem {sbs}."),
+    ("CPF1164", 0, "Job {job} ended on {date}; {n} seconds used."),
+    ("CPI1466", 10, "Job {job} is using a large amount of temporary storage."),
+    ("CPF0907", 80, "Serious storage condition may exist. Press HELP."),
+    ("CPA5305", 99, "Record not added. Member {sbs} is full. (C I 9999)"),
+    ("CPF5140", 40, "Session stopped by a request on device QPADEV{n:04d}."),
+    ("CPI0953", 40, "ASP storage threshold reached."),
+    ("CPD0030", 30, "Command {sbs} in library *LIBL not found."),
+    ("CPF9898", 40, "Job {job} failed with escape message."),
+    ("TCP2617", 20, "TCP/IP connection to remote system closed, reason code {n}."),
+]
+
+
+class SimulatedError(Exception):
+    """模擬驅動回報的 SQL 錯誤"""
+
+
+def _in_list(value, values):
+    """模擬 *_LIST_FILTER：逗號分隔的清單，支援 * 結尾的前綴比對"""
+    if values is None or value is None:
+        return 1
+    for item in str(values).split(","):
+        item = item.strip().upper()
+        if not item or item == "*ALL":
+            return 1
+        if item.endswith("*") and str(value).upper().startswith(item[:-1]):
+            return 1
+        if str(value).upper() == item:
+            return 1
+    return 0
+
+
+def _split_arguments(text):
+    """以最外層的逗號切開函數參數，忽略字串與括號內的逗號"""
+    args = []
+    depth = 0
+    quoted = False
+    current = []
+    for ch in text:
+        if ch == "'":
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and ch == "," and depth == 0:
+            args.append("".join(current).strip())
+            current = []
+            continue
+        current.append(ch)
+    if "".join(current).strip():
+        args.append("".join(current).strip())
+    return args
+
+
+def _matching_paren(sql, start):
+    depth = 0
+    quoted = False
+    for i in range(start, len(sql)):
+        ch = sql[i]
+        if ch == "'":
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    raise SimulatedError("SQL0104 括號不成對")
+
+
+_TABLE_FUNCTION_RE = re.compile(r"TABLE\s*\(\s*(QSYS2|SYSTOOLS)\.(\w+)\s*\(", re.IGNORECASE)
+
+
+def _replace_table_functions(sql):
+    while True:
+        match = _TABLE_FUNCTION_RE.search(sql)
+        if not match:
+            return sql
+        outer_end = _matching_paren(sql, sql.index("(", match.start()))
+        args_start = match.end() - 1
+        args_end = _matching_paren(sql, args_start)
+        schema, name = match.group(1).upper(), match.group(2).upper()
+        filters = _TABLE_FUNCTION_FILTERS.get(name, {})
+        conditions = []
+        for position, arg in enumerate(_split_arguments(sql[args_start + 1:args_end])):
+            key, sep, expr = arg.partition("=>")
+            if sep:
+                key, expr = key.strip().upper(), expr.strip()
+            else:
+                key, expr = position, arg
+            template = filters.get(key)
+            if template:
+                conditions.append(template.format(expr))
+            elif "?" in expr:
+                # 不支援的參數仍要消耗參數標記，保持參數順序
+                conditions.append(f"(({expr}) IS NULL OR 1 = 1)")
+        table = f"{schema}_{name}"
+        if conditions:
+            table = f"(SELECT * FROM {table} WHERE {' AND '.join(conditions)})"
+        sql = sql[:match.start()] + table + sql[outer_end + 1:]
+
+
+def _timestamp_expression(match):
+    amount, unit = match.group(1), match.group(2).lower()
+    return f"strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime', '-{amount} {unit}s')"
+
+
+def translate_sql(sql):
+    """將本工具使用的 Db2 for i SQL 轉為 SQLite 語法"""
+    sql = _replace_table_functions(sql)
+    sql = re.sub(r"CURRENT[ _]TIMESTAMP\s*-\s*(\d+)\s*(HOUR|MINUTE|DAY|SECOND)S?\b",
+                 _timestamp_expression, sql, flags=re.IGNORECASE)
+    sql = re.sub(r"CURRENT[ _]TIMESTAMP", "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')",
+                 sql, flags=re.IGNORECASE)
+    sql = re.sub(r"FETCH\s+FIRST\s+(\d+)\s+ROWS?\s+ONLY", r"LIMIT \1", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\b(QSYS2|SYSTOOLS|SYSIBM)\.(\w+)", r"\1_\2", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"^\s*VALUES\s+", "SELECT ", sql, flags=re.IGNORECASE)
+    return sql
+
+
+class _Interrupter:
+    """讓 cancel_statement 能以 _prep.cancel() 中斷模擬語句"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cancel(self):
+        self._cursor.cancel()
+
+
+class SimulatedCursor:
+    arraysize = 1
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._cursor = connection._conn.cursor()
+        self._interrupted = threading.Event()
+        self._prep = None
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def _wait(self, seconds):
+        if seconds > 0 and self._interrupted.wait(seconds):
+            raise SimulatedError("SQL0952 處理已被使用者中斷")
+
+    def execute(self, operation, parameters=None):
+        driver = self._connection.driver
+        parameters = tuple(parameters or ())
+        self._interrupted.clear()
+        self._prep = _Interrupter(self)
+        self._wait(driver.latency)
+        if re.match(r"\s*CALL\s+QSYS2\.QCMDEXC\s*\(", operation, re.IGNORECASE):
+            driver.run_command(self._connection, parameters[0])
+            return
+        driver.simulate_activity(self._connection, operation)
+        try:
+            self._cursor.execute(translate_sql(operation), parameters)
+        except sqlite3.Error as e:
+            raise SimulatedError(f"SQL 執行失敗: {e}") from e
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size or self.arraysize)
+        self._wait(self._connection.driver.row_latency * len(rows))
+        return rows
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._wait(self._connection.driver.row_latency * len(rows))
+        return rows
+
+    def cancel(self):
+        self._interrupted.set()
+        self._connection._conn.interrupt()
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class SimulatedConnection:
+    def __init__(self, driver, host, uri):
+        self.driver = driver
+        self.host = host
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        # 共用快取模式下讓讀取不必等待其他連接的寫入
+        self._conn.execute("PRAGMA read_uncommitted = 1")
+        self._conn.create_function("IN_LIST", 2, _in_list)
+
+    def cursor(self):
+        return SimulatedCursor(self)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+class SimulatedDriver:
+    """以 SQLite 模擬 IBM i 的測試與壓力測試用驅動
+
+    每個主機各有一個記憶體資料庫，內容依參數產生；latency 為每個語句的延遲秒數，
+    row_latency 為每讀取一列的延遲秒數。activity 為 True 時每次查詢作業或訊息
+    都會推進模擬時間：部分作業累積 CPU/IO，並產生新的訊息。
+    """
+    name = "simulated"
+    uses_jvm = False
+
+    def __init__(self, jobs=2000, users=300, messages=2000, history=20000, spool_files=500,
+                 latency=0.0, row_latency=0.0, activity=True, seed=400):
+        self.jobs = int(jobs)
+        self.users = int(users)
+        self.messages = int(messages)
+        self.history = int(history)
+        self.spool_files = int(spool_files)
+        self.latency = float(latency)
+        self.row_latency = float(row_latency)
+        self.activity = activity if isinstance(activity, bool) else str(activity).lower() in ("1", "true", "yes")
+        self.seed = int(seed)
+        self._anchors = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._message_counter = 0
+        self._job_counter = 0
+
+    def warm_up(self):
+        pass
+
+    def _uri(self, host):
+        return f"file:db400sim_{id(self)}_{re.sub(r'[^0-9A-Za-z]', '_', host)}?mode=memory&cache=shared"
+
+    def connect(self, host, user, password):
+        uri = self._uri(host)
+        with self._lock:
+            if host not in self._anchors:
+                # 保留一個連接讓共用記憶體資料庫持續存在
+                anchor = sqlite3.connect(uri, uri=True, check_same_thread=False)
+                self._populate(anchor, random.Random(f"{self.seed}:{host}"))
+                self._anchors[host] = anchor
+        return SimulatedConnection(self, host, uri)
+
+    def close(self):
+        with self._lock:
+            for anchor in self._anchors.values():
+                anchor.close()
+            self._anchors.clear()
+
+    def _populate(self, conn, rng):
+        for table, columns in _SCHEMA.items():
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+        for statement in _INDEXES:
+            conn.execute(statement)
+
+        now = datetime.now()
+        users = ["QSECOFR", "QSYSOPR", "QPGMR", "QUSER", "QTCP", "QSYS"]
+        users += [f"USR{i:05d}" for i in range(max(self.users - len(users), 0))]
+        users = users[:max(self.users, 1)]
+        conn.executemany(
+            "INSERT INTO QSYS2_USER_INFO VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(name,
+              rng.choice(["*ENABLED"] * 9 + ["*DISABLED"]),
+              (now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))).strftime(_TIMESTAMP_FORMAT),
+              (now - timedelta(days=rng.randint(0, 365))).strftime(_TIMESTAMP_FORMAT),
+              "*SECOFR" if name == "QSECOFR" else rng.choice(["*USER", "*USER", "*PGMR", "*SYSOPR"]),
+              "*ALLOBJ *SECADM" if name == "QSECOFR" else "",
+              f"Simulated user {name}") for name in users])
+
+        jobs = [self._make_job(rng, users, i) for i in range(self.jobs)]
+        self._job_counter = self.jobs
+        conn.executemany(f"INSERT INTO QSYS2_ACTIVE_JOB_INFO VALUES ({', '.join('?' * 16)})", jobs)
+
+        job_names = [job[1] for job in jobs] or ["000000/QSYS/SCPF"]
+        conn.executemany(
+            "INSERT INTO QSYS2_MESSAGE_QUEUE_INFO VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [self._make_queue_message(rng, job_names, now - timedelta(seconds=rng.randint(0, 7 * 86400)))
+             for _ in range(self.messages)])
+        conn.executemany(
+            "INSERT INTO QSYS2_HISTORY_LOG_INFO VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [self._make_history_message(rng, job_names, i, now - timedelta(seconds=rng.randint(0, 7 * 86400)))
+             for i in range(self.history)])
+
+        joblog = []
+        for job_name in job_names[:200]:
+            for position in range(20):
+                message_id, severity, text = rng.choice(_MESSAGES)
+                joblog.append((job_name, position + 1, message_id, "INFORMATIONAL", severity,
+                               (now - timedelta(seconds=(20 - position) * 30)).strftime(_TIMESTAMP_FORMAT),
+                               self._message_text(rng, text, job_name)))
+        conn.executemany("INSERT INTO QSYS2_JOBLOG_INFO VALUES (?, ?, ?, ?, ?, ?, ?)", joblog)
+
+        spool = []
+        spool_data = []
+        for i in range(self.spool_files):
+            user = rng.choice(users)
+            job_name = f"{rng.randint(100000, 999999):06d}/{user}/QPRTJOB"
+            file_name = rng.choice(["QSYSPRT", "QPJOBLOG", "QPRINT", "QPDSPLOG"])
+            spool.append(("PRT01", "QUSRSYS",
+                          (now - timedelta(minutes=rng.randint(0, 60 * 24 * 30))).strftime(_TIMESTAMP_FORMAT),
+                          file_name, user, "", rng.choice(["READY", "HELD", "SAVED"]),
+                          rng.randint(4, 4096), rng.randint(1, 200), 1, "*STD", job_name, "PRINTER", 5, i + 1,
+                          "SIMSYS"))
+            spool_data.extend((job_name, file_name, line + 1, f"{file_name} line {line + 1:04d} for {user}")
+                              for line in range(20))
+        conn.executemany(f"INSERT INTO QSYS2_OUTPUT_QUEUE_ENTRIES_BASIC VALUES ({', '.join('?' * 16)})", spool)
+        conn.executemany("INSERT INTO SYSTOOLS_SPOOLED_FILE_DATA VALUES (?, ?, ?, ?)", spool_data)
+        conn.commit()
+
+    def _make_job(self, rng, users, ordinal):
+        subsystem = rng.choice(_SUBSYSTEMS)
+        job_type, names = _JOB_PROFILES[subsystem]
+        short_name = rng.choice(names)
+        if short_name == "QPADEV":
+            short_name = f"QPADEV{rng.randint(0, 9999):04d}"
+        user = rng.choice(users)
+        number = f"{100000 + ordinal % 900000:06d}"
+        return (ordinal + 1, f"{number}/{user}/{short_name}", short_name, user, number, subsystem, "QSYS",
+                user, job_type, rng.choice(["PGM", "CMD", ""]), rng.choice(["QCMD", "QZDASOINIT", "DLYJOB", ""]),
+                rng.choice(_JOB_STATUSES), rng.randint(0, 500000), rng.randint(0, 2000000),
+                rng.randint(1, 512), 0.0)
+
+    def _message_text(self, rng, text, job_name):
+        return text.format(job=job_name, date=datetime.now().strftime("%m/%d/%y"),
+                           sbs=rng.choice(_SUBSYSTEMS), n=rng.randint(1, 9999))
+
+    def _make_queue_message(self, rng, job_names, timestamp):
+        message_id, severity, text = rng.choice(_MESSAGES)
+        job_name = rng.choice(job_names)
+        self._message_counter += 1
+        return ("QSYS", "QSYSOPR", message_id, "INQUIRY" if severity >= 80 else "INFORMATIONAL",
+                self._message_text(rng, text, job_name), severity, timestamp.strftime(_TIMESTAMP_FORMAT),
+                f"{self._message_counter:08X}", job_name.split("/")[1], job_name)
+
+    def _make_history_message(self, rng, job_names, ordinal, timestamp):
+        message_id, severity, text = rng.choice(_MESSAGES)
+        job_name = rng.choice(job_names)
+        self._message_counter += 1
+        return (ordinal + 1, message_id, "INFORMATIONAL", severity, timestamp.strftime(_TIMESTAMP_FORMAT),
+                job_name.split("/")[1], job_name, self._message_text(rng, text, job_name),
+                f"{self._message_counter:08X}")
+
+    def simulate_activity(self, connection, sql):
+        """推進模擬系統的狀態，讓重複查詢看到變化"""
+        if not self.activity:
+            return
+        upper = sql.upper()
+        conn = connection._conn
+        with self._write_lock:
+            if "ACTIVE_JOB_INFO" in upper:
+                conn.execute("""
+                    UPDATE QSYS2_ACTIVE_JOB_INFO
+                    SET CPU_TIME = CPU_TIME + ABS(RANDOM() % 2000),
+                        TOTAL_DISK_IO_COUNT = TOTAL_DISK_IO_COUNT + ABS(RANDOM() % 500)
+                    WHERE ABS(RANDOM() % 100) < 10
+                """)
+            if "MESSAGE_QUEUE_INFO" in upper or "HISTORY_LOG_INFO" in upper:
+                rng = random.Random()
+                names = [row[0] for row in conn.execute(
+                    "SELECT JOB_NAME FROM QSYS2_ACTIVE_JOB_INFO LIMIT 50")] or ["000000/QSYS/SCPF"]
+                now = datetime.now()
+                conn.execute("INSERT INTO QSYS2_MESSAGE_QUEUE_INFO VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             self._make_queue_message(rng, names, now))
+                ordinal = conn.execute("SELECT COALESCE(MAX(ORDINAL_POSITION), 0) FROM QSYS2_HISTORY_LOG_INFO"
+                                       ).fetchone()[0]
+                conn.execute("INSERT INTO QSYS2_HISTORY_LOG_INFO VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             self._make_history_message(rng, names, ordinal, now))
+            conn.commit()
+
+    def run_command(self, connection, cmd):
+        """模擬 QCMDEXC 執行本工具會用到的 CL 命令"""
+        command = cmd.strip().split(" ", 1)[0].upper()
+        params = {key.upper(): value.strip() for key, value in
+                  re.findall(r"(\w+)\(((?:[^()']|'[^']*')*)\)", cmd)}
+        conn = connection._conn
+        with self._write_lock:
+            if command == "CRTUSRPRF":
+                name = params.get("USRPRF", "")
+                if conn.execute("SELECT 1 FROM QSYS2_USER_INFO WHERE USER_NAME = ?", (name,)).fetchone():
+                    raise SimulatedError(f"CPF2214 用戶設定檔 {name} 已存在")
+                conn.execute("INSERT INTO QSYS2_USER_INFO VALUES (?, '*ENABLED', NULL, ?, ?, ?, ?)",
+                             (name, datetime.now().strftime(_TIMESTAMP_FORMAT), params.get("USRCLS", "*USER"),
+                              params.get("SPCAUT", ""), params.get("TEXT", "").strip("'").replace("''", "'")))
+            elif command == "DLTUSRPRF":
+                if not conn.execute("DELETE FROM QSYS2_USER_INFO WHERE USER_NAME = ?",
+                                    (params.get("USRPRF", ""),)).rowcount:
+                    raise SimulatedError(f"CPF2204 找不到用戶設定檔 {params.get('USRPRF', '')}")
+            elif command == "CHGUSRPRF":
+                name = params.get("USRPRF", "")
+                if not conn.execute("SELECT 1 FROM QSYS2_USER_INFO WHERE USER_NAME = ?", (name,)).fetchone():
+                    raise SimulatedError(f"CPF2204 找不到用戶設定檔 {name}")
+                for param, column in (("STATUS", "STATUS"), ("USRCLS", "USER_CLASS_NAME"),
+                                      ("SPCAUT", "SPECIAL_AUTHORITIES")):
+                    if param in params:
+                        conn.execute(f"UPDATE QSYS2_USER_INFO SET {column} = ? WHERE USER_NAME = ?",
+                                     (params[param], name))
+                if "PASSWORD" in params:
+                    conn.execute("UPDATE QSYS2_USER_INFO SET PASSWORD_CHANGE_DATE = ? WHERE USER_NAME = ?",
+                                 (datetime.now().strftime(_TIMESTAMP_FORMAT), name))
+            elif command in ("ENDJOB", "HLDJOB", "RLSJOB"):
+                job_name = params.get("JOB", "")
+                if command == "ENDJOB":
+                    count = conn.execute("DELETE FROM QSYS2_ACTIVE_JOB_INFO WHERE JOB_NAME = ?",
+                                         (job_name,)).rowcount
+                else:
+                    count = conn.execute("UPDATE QSYS2_ACTIVE_JOB_INFO SET JOB_STATUS = ? WHERE JOB_NAME = ?",
+                                         ("HLD" if command == "HLDJOB" else "RUN", job_name)).rowcount
+                if not count:
+                    raise SimulatedError(f"CPF1321 找不到作業 {job_name}")
+            else:
+                raise SimulatedError(f"CPD0030 模擬驅動不支援命令 {command}")
+            conn.commit()
+
+
+DRIVERS = {
+    JayDeBeApiDriver.name: JayDeBeApiDriver,
+    JPypeDriver.name: JPypeDriver,
+    SimulatedDriver.name: SimulatedDriver,
+}
+
+
+def create_driver(spec=None):
+    """依名稱建立驅動，例如 "jaydebeapi" 或 "simulated:jobs=40000,latency=0.05" """
+    if not spec:
+        return JayDeBeApiDriver()
+    name, _, option_text = spec.partition(":")
+    if name not in DRIVERS:
+        raise ValueError(f"未知的驅動: {name}（可用: {', '.join(DRIVERS)}）")
+    options = {}
+    for item in filter(None, option_text.split(",")):
+        key, _, value = item.partition("=")
+        options[key.strip()] = value.strip()
+    return DRIVERS[name](**options)
@@ -0,0 +1,156 @@
+import csv
+import os
+from as400_connector import FETCH_BATCH_SIZE, QueryCancelledError, current_cancel_token
+
+# 存檔對話框的檔案類型，順序與 EXPORT_FORMATS 一致
+EXPORT_FILTERS = "Excel Files (*.xlsx);;CSV Files (*.csv);;Parquet Files (*.parquet)"
+EXPORT_FORMATS = {".xlsx": "xlsx", ".csv": "csv", ".parquet": "parquet"}
+# 每寫入這麼多列回報一次進度
+PROGRESS_INTERVAL_ROWS = 5000
+
+
+def export_format(path, selected_filter=""):
+    """依副檔名（或對話框選擇的類型）決定匯出格式，必要時補上副檔名"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in EXPORT_FORMATS:
+        return path, EXPORT_FORMATS[extension]
+    for extension, fmt in EXPORT_FORMATS.items():
+        if extension in selected_filter:
+            return path + extension, fmt
+    return path + ".xlsx", "xlsx"
+
+
+class _XlsxWriter:
+    """openpyxl 唯寫模式：每列寫入後即釋放，不在記憶體中保留整個工作表"""
+
+    def __init__(self, path, columns, types):
+        from openpyxl import Workbook  # 只有匯出時才需要，延遲載入
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet()
+        self.sheet.append(columns)
+
+    def write_batch(self, batch):
+        append = self.sheet.append
+        for row in batch.rows():
+            append(row)
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+class _CsvWriter:
+    def __init__(self, path, columns, types):
+        # utf-8-sig 讓 Excel 直接開啟時能正確辨識中文
+        self.file = open(path, "w", newline="", encoding="utf-8-sig")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write_batch(self, batch):
+        self.writer.writerows(batch.rows())
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    """以 pyarrow 逐批寫入 row group；欄位型別依 ResultSet 的欄位類型決定"""
+
+    def __init__(self, path, columns, types):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("匯出 Parquet 需要安裝 pyarrow 套件")
+        self.pa = pyarrow
+        arrow_types = {"int": pyarrow.int64(), "float": pyarrow.float64(), "bool": pyarrow.bool_(),
+                       "bytes": pyarrow.binary()}
+        self.types = [arrow_types.get(type_name, pyarrow.string()) for type_name in types or [None] * len(columns)]
+        self.schema = pyarrow.schema([(name, arrow_type) for name, arrow_type in zip(columns, self.types)])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def _array(self, values, arrow_type):
+        if arrow_type == self.pa.string():
+            values = [value if value is None or isinstance(value, str) else str(value) for value in values]
+        elif arrow_type == self.pa.float64():
+            values = [None if value is None else float(value) for value in values]
+        return self.pa.array(values, type=arrow_type)
+
+    def write_batch(self, batch):
+        arrays = [self._array(values, arrow_type) for values, arrow_type in zip(batch.data, self.types)]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+_WRITERS = {"xlsx": _XlsxWriter, "csv": _CsvWriter, "parquet": _ParquetWriter}
+
+
+class _Export:
+    """寫入暫存檔，完成後才替換目標檔案；失敗或取消時刪除暫存檔"""
+
+    def __init__(self, path, fmt, progress=None):
+        self.path = path
+        self.fmt = fmt
+        self.progress = progress
+        self.temp_path = f"{path}.{os.getpid()}.part"
+        self.writer = None
+        self.rows = 0
+        self._reported = 0
+
+    def write(self, columns, types, batches):
+        token = current_cancel_token()
+        try:
+            self.writer = _WRITERS[self.fmt](self.temp_path, columns, types)
+            for batch in batches:
+                if token is not None and token.cancelled:
+                    raise QueryCancelledError("匯出已取消")
+                self.writer.write_batch(batch)
+                self.rows += len(batch)
+                if self.progress is not None and self.rows - self._reported >= PROGRESS_INTERVAL_ROWS:
+                    self._reported = self.rows
+                    self.progress(self.rows)
+            self.writer.close()
+            os.replace(self.temp_path, self.path)
+        except BaseException:
+            self._discard()
+            raise
+        return self.rows
+
+    def _discard(self):
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except Exception:
+                pass
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def export_result_set(result, path, fmt, progress=None, batch_size=FETCH_BATCH_SIZE):
+    """將已載入的 ResultSet 逐批寫入檔案，回傳寫入的列數
+
+    開始時記下列數，之後追加到 result 的資料不會匯出。
+    """
+    count = len(result)
+    batches = (result.batch(start, start + batch_size) for start in range(0, count, batch_size))
+    return _Export(path, fmt, progress).write(result.columns, result.types, batches)
+
+
+def export_query(connector, query, path, fmt, host=None, progress=None, batch_size=FETCH_BATCH_SIZE):
+    """重新執行查詢，從游標逐批直接寫入檔案，不把整個結果留在記憶體"""
+    stream, error = connector.stream_query(query, batch_size, host=host, source="Export")
+    if error:
+        raise RuntimeError(error)
+    with stream:
+        first = stream.fetch_column_batch()
+        types = first.types if first is not None else None
+
+        def batches():
+            batch = first
+            while batch is not None:
+                yield batch
+                batch = stream.fetch_column_batch()
+
+        return _Export(path, fmt, progress).write(stream.columns, types, batches())
@@ -1,16 +1,26 @@
 import os
 import sys
+import time
+from datetime import datetime
 from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, 
-                               QPlainTextEdit, QMessageBox, QTableWidget, QTableWidgetItem, QFileDialog, QComboBox, 
-                               QStyledItemDelegate, QStackedWidget, QDialog, QDialogButtonBox, QFrame)
+                               QPlainTextEdit, QMessageBox, QFileDialog, QComboBox, 
+                               QStyledItemDelegate, QStackedWidget, QDialog, QDialogButtonBox, QFrame,
+                               QListWidget, QListWidgetItem, QProgressDialog)
 from PySide6.QtGui import QFont, QColor, QShortcut, QKeySequence
-from PySide6.QtCore import Qt, Signal  
-from openpyxl import Workbook
-from as400_connector import AS400Connector
-from system_monitor import SystemMonitorGUI
-from user_manager import UserManager, UserManagerGUI
-from job_manager import JobManager, JobManagerGUI
-from utils import force_quit, setup_environment
+from PySide6.QtCore import Qt, Signal, QTimer
+from as400_connector import AS400Connector, merge_host_results
+from query_metrics import SLOW_QUERY_SECONDS
+from result_model import ResultTableView, compile_filter, debounce_timer
+from columnar import ResultSet
+from exporter import EXPORT_FILTERS, export_format, export_query, export_result_set
+from query_worker import CANCELLED_MESSAGE, BackgroundQueryRunner
+from refresh_scheduler import JOB_REFRESH_INTERVAL, USER_REFRESH_INTERVAL, RefreshScheduler
+from utils import force_quit
+
+# 主查詢頁面最多保留的結果列數，避免大型查詢耗盡記憶體
+MAX_RESULT_ROWS = 100000
+# 捲動載入時，游標閒置超過此秒數就關閉並歸還連接
+STREAM_IDLE_TIMEOUT = 300
 
 class CustomItemDelegate(QStyledItemDelegate):
     def paint(self, painter, option, index):
@@ -20,17 +30,78 @@ class CustomItemDelegate(QStyledItemDelegate):
             option.backgroundBrush = QColor("#E2E8F0")
         super().paint(painter, option, index)
 
+class SlowQueryDialog(QDialog):
+    """列出最近耗時較長或失敗的查詢"""
+
+    COLUMNS = ["時間", "系統", "來源", "語句", "總計(ms)", "準備", "執行", "讀取", "轉換", "顯示",
+               "列數", "大小(KB)", "錯誤", "指紋"]
+    THRESHOLDS = [("全部", 0.0), ("≥ 0.5 秒", 0.5), (f"≥ {SLOW_QUERY_SECONDS:g} 秒", SLOW_QUERY_SECONDS),
+                  ("≥ 5 秒", 5.0)]
+
+    def __init__(self, parent, metrics):
+        super().__init__(parent)
+        self.metrics = metrics
+        self.setWindowTitle("慢查詢")
+        self.resize(1000, 500)
+        layout = QVBoxLayout(self)
+
+        control_layout = QHBoxLayout()
+        self.threshold_combo = QComboBox()
+        for label, _ in self.THRESHOLDS:
+            self.threshold_combo.addItem(label)
+        self.threshold_combo.setCurrentIndex(2)
+        self.threshold_combo.currentIndexChanged.connect(self.refresh)
+        refresh_button = QPushButton("重新整理")
+        refresh_button.clicked.connect(self.refresh)
+        control_layout.addWidget(QLabel("門檻:"))
+        control_layout.addWidget(self.threshold_combo)
+        control_layout.addStretch(1)
+        control_layout.addWidget(refresh_button)
+        layout.addLayout(control_layout)
+
+        self.table = ResultTableView()
+        layout.addWidget(self.table)
+        self.refresh()
+
+    def refresh(self):
+        threshold = self.THRESHOLDS[self.threshold_combo.currentIndex()][1]
+        rows = []
+        for record in self.metrics.slow_queries(threshold):
+            source = record.source + ("（快取）" if record.cached else "")
+            values = [datetime.fromtimestamp(record.timestamp).strftime("%H:%M:%S"), record.host, source,
+                      record.statement, f"{record.total * 1000:.0f}"]
+            values += [f"{getattr(record, phase) * 1000:.0f}"
+                       for phase in ("prepare", "execute", "fetch", "convert", "render")]
+            values += [str(record.rows), f"{record.bytes / 1024:.0f}", record.error or "", record.fingerprint]
+            rows.append(values)
+        self.table.set_result(self.COLUMNS, rows)
+        self.table.auto_size_columns()
+        self.table.setColumnWidth(3, min(self.table.columnWidth(3), 400))
+
 class AS400ConnectorGUI(QMainWindow):
     connection_successful = Signal(object)  
     
-    def __init__(self):
+    def __init__(self, driver=None):
         super().__init__()
-        setup_environment()
-        self.as400_connector = AS400Connector()
+        self.as400_connector = AS400Connector(driver=driver)
+        self.query_runner = BackgroundQueryRunner(self)
+        # 所有定期刷新（作業、用戶、系統監控）由同一個排程負責，只刷新顯示中的畫面
+        self.refresh_scheduler = RefreshScheduler(self)
+        self.active_query = None
+        self.active_stream = None
+        self.fetch_all_pending = False
         self.result = None
+        # 產生目前結果的 (查詢, 系統)，匯出時可據此重新執行；多系統查詢為 None
+        self.result_source = None
+        self.result_complete = False
+        self.active_export = None
+        self.export_progress = None
+        self.export_cancelled = False
         self.connection_error = None
         self.user_managers = {}
         self.job_managers = {}
+        self.job_table_host = None
+        self.user_table_host = None
         self.current_connection = None
         self.initUI()
         self.setStyleSheet("""
@@ -60,12 +131,12 @@ class AS400ConnectorGUI(QMainWindow):
             QPushButton:disabled {
                 background-color: #A0AEC0;
             }
-            QTableWidget {
+            QTableView {
                 background-color: #EDF2F7;
                 color: #4A5568;
                 gridline-color: #CBD5E0;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #BEE3F8;
             }
             QHeaderView::section {
@@ -142,7 +213,8 @@ class AS400ConnectorGUI(QMainWindow):
 
         # 創建主界面和系統監控界面
         self.main_page = QWidget()
-        self.system_monitor_page = SystemMonitorGUI(self)
+        self.system_monitor_page = None  # 第一次切換時才載入
+        self.archive_dir = None  # 本機訊息封存的目錄，None 時使用預設位置
         self.user_manager_page = QWidget()
         self.setup_user_manager_page()
         self.job_manager_page = QWidget()
@@ -150,16 +222,33 @@ class AS400ConnectorGUI(QMainWindow):
 
         # 將兩個界面添加到堆疊小部件中
         self.stacked_widget.addWidget(self.main_page)
-        self.stacked_widget.addWidget(self.system_monitor_page)
         self.stacked_widget.addWidget(self.user_manager_page)
         self.stacked_widget.addWidget(self.job_manager_page)
 
         # 設置主界面佈局
         self.setup_main_page()
 
+        self.refresh_scheduler.add("jobs", JOB_REFRESH_INTERVAL, lambda: self.refresh_job_list(quiet=True),
+                                   self.job_manager_page,
+                                   lambda: self.as400_connector.current_connection in self.job_managers)
+        self.refresh_scheduler.add("users", USER_REFRESH_INTERVAL, lambda: self.refresh_user_list(quiet=True),
+                                   self.user_manager_page,
+                                   lambda: self.as400_connector.current_connection in self.user_managers)
+
         self.statusBar().showMessage("準備就緒")
         self.statusBar().setStyleSheet("color: #4A5568; background-color: #E2E8F0;")
 
+        # 狀態列右側顯示查詢結果快取的命中統計
+        self.cache_status_label = QLabel()
+        self.statusBar().addPermanentWidget(self.cache_status_label)
+        self.slow_query_button = QPushButton('慢查詢')
+        self.slow_query_button.clicked.connect(self.show_slow_queries)
+        self.statusBar().addPermanentWidget(self.slow_query_button)
+        self.cache_status_timer = QTimer(self)
+        self.cache_status_timer.timeout.connect(self.update_cache_status)
+        self.cache_status_timer.start(2000)
+        self.update_cache_status()
+
         # 快捷鍵
         QShortcut(QKeySequence(Qt.Key.Key_Return), self, self.connect_to_as400)
         QShortcut(QKeySequence(Qt.Key.Key_Escape), self, self.show_disconnect_dialog)
@@ -251,13 +340,38 @@ class AS400ConnectorGUI(QMainWindow):
         self.execute_button = QPushButton('執行查詢')
         self.execute_button.clicked.connect(self.execute_query)
         self.execute_button.setEnabled(False)
-        layout.addWidget(self.execute_button)
+
+        self.fanout_button = QPushButton('多系統執行')
+        self.fanout_button.clicked.connect(self.execute_query_on_systems)
+        self.fanout_button.setEnabled(False)
+
+        self.cancel_button = QPushButton('取消查詢')
+        self.cancel_button.clicked.connect(self.cancel_query)
+        self.cancel_button.setEnabled(False)
+
+        self.fetch_all_button = QPushButton('全部讀取')
+        self.fetch_all_button.clicked.connect(self.fetch_all_results)
+        self.fetch_all_button.setEnabled(False)
+
+        execute_layout = QHBoxLayout()
+        execute_layout.addWidget(self.execute_button, 1)
+        execute_layout.addWidget(self.fanout_button)
+        execute_layout.addWidget(self.fetch_all_button)
+        execute_layout.addWidget(self.cancel_button)
+        layout.addLayout(execute_layout)
 
         add_separator()
 
-        self.result_display = QTableWidget()
+        self.result_display = ResultTableView()
+        # 捲到底時才從仍開啟的游標讀取下一批
+        self.result_display.result_model.fetch_more_requested.connect(self.fetch_next_batch)
         layout.addWidget(self.result_display)
 
+        self.stream_idle_timer = QTimer(self)
+        self.stream_idle_timer.setSingleShot(True)
+        self.stream_idle_timer.setInterval(STREAM_IDLE_TIMEOUT * 1000)
+        self.stream_idle_timer.timeout.connect(self.close_idle_stream)
+
         self.export_button = QPushButton('匯出結果')
         self.export_button.clicked.connect(self.export_results)
         self.export_button.setEnabled(False)
@@ -304,6 +418,7 @@ class AS400ConnectorGUI(QMainWindow):
             self.connect_button.setEnabled(False)
             self.disconnect_button.setEnabled(True)
             self.execute_button.setEnabled(True)
+            self.fanout_button.setEnabled(True)
             
             if self.system_combo.findText(host) == -1:
                 self.system_combo.addItem(host)
@@ -316,6 +431,9 @@ class AS400ConnectorGUI(QMainWindow):
             
             self.connection_error = None
             self.current_connection = host
+            # 管理模組在第一次連接時才載入，縮短啟動時間
+            from user_manager import UserManager, UserManagerGUI
+            from job_manager import JobManager, JobManagerGUI
             user_manager = UserManager(connection)
             self.user_managers[host] = UserManagerGUI(self, user_manager)
             self.job_managers[host] = JobManagerGUI(self, JobManager(connection))
@@ -354,6 +472,8 @@ class AS400ConnectorGUI(QMainWindow):
             self.disconnect_from_as400(selected_host)
 
     def disconnect_from_as400(self, host):
+        if self.active_stream is not None and self.active_stream.pool.host == host and self.active_query is None:
+            self.finish_query(stopped=True)
         success, error = self.as400_connector.disconnect_from_as400(host)
         if success:
             index = self.system_combo.findText(host)
@@ -368,12 +488,15 @@ class AS400ConnectorGUI(QMainWindow):
                 self.connect_button.setEnabled(True)
                 self.disconnect_button.setEnabled(False)
                 self.execute_button.setEnabled(False)
+                self.fanout_button.setEnabled(False)
                 self.export_button.setEnabled(False)
                 self.statusBar().showMessage("已斷開所有連接")
                 self.update_current_connection()
             
             if host in self.job_managers:
                 self.job_managers[host].disable_refresh()
+            if host in self.user_managers:
+                self.user_managers[host].disable_refresh()
         else:
             QMessageBox.warning(self, "斷開連接警告", f"斷開連接时發生錯誤：{error}")
     def switch_system(self, index):
@@ -401,52 +524,331 @@ class AS400ConnectorGUI(QMainWindow):
             QMessageBox.warning(self, "查詢為空", "請輸入SQL查詢")
             return
 
-        result, error = self.as400_connector.execute_query(query)
-        if result:
-            columns, data = result
-            self.result = data
-            
-            self.result_display.setColumnCount(len(columns))
-            self.result_display.setRowCount(len(self.result))
-            self.result_display.setHorizontalHeaderLabels(columns)
+        if self.active_query is not None:
+            return
+
+        # 上一個查詢若還有未讀完的游標，先關閉並歸還連接
+        self.close_stream()
+        self.result = []
+        self.result_source = (query, self.as400_connector.current_connection)
+        self.result_complete = False
+        self.result_display.clear()
+        self.set_query_running(True)
+        self.statusBar().showMessage("查詢執行中...")
+        self.active_query = self.query_runner.submit(
+            self._open_query_stream, query, self.as400_connector.current_connection,
+            on_result=self.on_query_opened, on_error=self.on_query_failed)
+
+    def _open_query_stream(self, query, host):
+        # 在背景執行緒執行：開啟串流並讀取第一批
+        stream, error = self.as400_connector.stream_query(query, host=host)
+        if error:
+            raise RuntimeError(error)
+        try:
+            return stream, stream.fetch_column_batch()
+        except Exception:
+            stream.close()
+            raise
+
+    def on_query_opened(self, opened):
+        self.active_query = None
+        self.active_stream, batch = opened
+        self.fetch_all_pending = False
+        columns = self.active_stream.columns
+        self.result = ResultSet(columns)
+        self.result_display.set_result(columns, self.result)
+        self.append_result_batch(batch)
+        record = self.active_stream.record
+        self.result_display.auto_size_columns(record.fingerprint if record is not None else None)
+        self.after_batch()
+
+    def on_query_batch(self, batch):
+        self.active_query = None
+        self.append_result_batch(batch)
+        self.after_batch()
+
+    def after_batch(self):
+        """每批讀入後：讀完就結束，否則等待捲動或繼續「全部讀取」"""
+        stream = self.active_stream
+        if stream.exhausted or len(self.result) >= MAX_RESULT_ROWS:
+            self.finish_query()
+            return
+        if self.fetch_all_pending:
+            self.statusBar().showMessage(f"已讀取 {len(self.result)} 行，繼續讀取中...")
+            self.fetch_next_batch()
+            return
+        self.set_query_running(False)
+        self.result_display.result_model.set_more_available(True)
+        self.fetch_all_button.setEnabled(True)
+        self.export_button.setEnabled(True)
+        self.stream_idle_timer.start()
+        message = f"已載入 {len(self.result)} 行，還有更多資料（捲動載入更多或按「全部讀取」）"
+        if stream.first_batch_time is not None and len(self.result) <= stream.batch_size:
+            message += f"，首批 {stream.first_batch_time * 1000:.0f} ms"
+        self.statusBar().showMessage(message)
+
+    def append_result_batch(self, batch):
+        if batch is None:
+            return
+        start = time.perf_counter()
+        # 附加到模型共用的 ResultSet，表格只格式化畫面上可見的儲存格
+        self.result_display.append_batch(batch.slice(0, MAX_RESULT_ROWS - len(self.result)))
+        record = self.active_stream.record if self.active_stream else None
+        if record is not None:
+            record.add_time("convert", time.perf_counter() - start)
+
+    def fetch_next_batch(self):
+        """在背景讀取下一批；由捲動 (fetchMore) 或「全部讀取」觸發"""
+        stream = self.active_stream
+        if stream is None or self.active_query is not None:
+            return
+        self.stream_idle_timer.stop()
+        self.set_query_running(True)
+        self.statusBar().showMessage(f"已載入 {len(self.result)} 行，讀取下一批中...")
+        self.active_query = self.query_runner.submit(
+            stream.fetch_column_batch, on_result=self.on_query_batch, on_error=self.on_query_failed)
+
+    def fetch_all_results(self):
+        if self.active_stream is None:
+            return
+        self.fetch_all_pending = True
+        self.fetch_all_button.setEnabled(False)
+        self.fetch_next_batch()
+
+    def close_stream(self):
+        """關閉仍開啟的游標並歸還連接，已載入的資料保留"""
+        self.stream_idle_timer.stop()
+        self.fetch_all_pending = False
+        self.fetch_all_button.setEnabled(False)
+        self.result_display.result_model.set_more_available(False)
+        if self.active_stream is not None:
+            self.active_stream.close()
+            self.active_stream = None
+
+    def close_idle_stream(self):
+        if self.active_stream is not None and self.active_query is None:
+            self.finish_query(stopped=True)
+            self.statusBar().showMessage(
+                f"游標閒置超過 {STREAM_IDLE_TIMEOUT} 秒已關閉，保留已載入的 {len(self.result)} 行")
+
+    def finish_query(self, stopped=False):
+        stream = self.active_stream
+        truncated = stream.rows_fetched > len(self.result) or not stream.exhausted
+        self.result_complete = not truncated and not stopped
+        self.close_stream()
+        self.active_query = None
+        self.set_query_running(False)
+
+        message = f"查詢成功，返回 {len(self.result)} 行結果"
+        if stream.first_batch_time is not None:
+            message += f"（首批 {stream.first_batch_time * 1000:.0f} ms）"
+        if stopped:
+            message += "，已停止讀取其餘資料"
+        elif truncated:
+            message += f"，已達顯示上限 {MAX_RESULT_ROWS} 行"
+        self.statusBar().showMessage(message)
+        self.export_button.setEnabled(True)
+
+    def on_query_failed(self, error):
+        if self.active_stream is not None:
+            self.active_stream.close(suspect=True)
+            self.active_stream = None
+        self.close_stream()
+        self.active_query = None
+        self.set_query_running(False)
+        self.export_button.setEnabled(bool(self.result))
+        if error == CANCELLED_MESSAGE:
+            # 使用者取消：與停止讀取相同，保留已載入的資料，不視為錯誤
+            self.statusBar().showMessage(f"查詢已取消，保留已載入的 {len(self.result or [])} 行")
+            return
+        QMessageBox.critical(self, "查詢失敗", f"執行查詢时發生錯誤: {error}")
+        self.statusBar().showMessage("查詢執行失敗")
+
+    def set_query_running(self, running):
+        connected = bool(self.as400_connector.connections)
+        self.execute_button.setEnabled(connected and not running)
+        self.fanout_button.setEnabled(connected and not running)
+        self.cancel_button.setEnabled(running or self.active_stream is not None)
+        if running:
+            self.export_button.setEnabled(False)
+
+    def select_systems_dialog(self):
+        """選擇要執行查詢的系統，預設全選"""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("選擇要執行查詢的系統")
+        layout = QVBoxLayout(dialog)
 
-            for row, rowData in enumerate(self.result):
-                for col, value in enumerate(rowData):
-                    self.result_display.setItem(row, col, QTableWidgetItem(str(value)))
+        system_list = QListWidget()
+        for host in self.as400_connector.connections:
+            item = QListWidgetItem(host)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(Qt.CheckState.Checked)
+            system_list.addItem(item)
+        layout.addWidget(system_list)
 
-            self.result_display.resizeColumnsToContents()
-            self.statusBar().showMessage(f"查詢成功，返回 {len(self.result)} 行結果")
-            self.export_button.setEnabled(True)
-        else:
-            QMessageBox.critical(self, "查詢失敗", f"執行查詢时發生錯誤: {error}")
-            self.statusBar().showMessage("查詢執行失敗")
+        button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        button_box.accepted.connect(dialog.accept)
+        button_box.rejected.connect(dialog.reject)
+        layout.addWidget(button_box)
+
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return []
+        return [system_list.item(i).text() for i in range(system_list.count())
+                if system_list.item(i).checkState() == Qt.CheckState.Checked]
+
+    def execute_query_on_systems(self):
+        if not self.as400_connector.connections:
+            QMessageBox.warning(self, "無連接", "請先連接到系統")
+            return
+
+        query = self.query_input.toPlainText()
+        if not query:
+            QMessageBox.warning(self, "查詢為空", "請輸入SQL查詢")
+            return
+
+        if self.active_query is not None:
+            return
+
+        hosts = self.select_systems_dialog()
+        if not hosts:
+            return
+
+        self.close_stream()
+        self.result = []
+        self.result_source = None
+        self.result_complete = False
+        self.result_display.clear()
+        self.set_query_running(True)
+        self.statusBar().showMessage(f"正在 {len(hosts)} 個系統上執行查詢...")
+        self.active_query = self.query_runner.submit(
+            self.as400_connector.execute_query_on_hosts, query, hosts, MAX_RESULT_ROWS,
+            on_result=self.on_fanout_finished, on_error=self.on_query_failed)
+
+    def on_fanout_finished(self, results):
+        self.active_query = None
+        self.set_query_running(False)
+
+        columns, rows = merge_host_results(results)
+        summary = []
+        errors = []
+        for host, outcome in results.items():
+            if outcome["error"] is None:
+                summary.append(f"{host}: {len(outcome['rows'])} 行 {outcome['elapsed'] * 1000:.0f} ms")
+            else:
+                summary.append(f"{host}: 失敗")
+                errors.append(f"{host}: {outcome['error']}")
+
+        if columns is not None:
+            self.result = rows
+            self.result_complete = True
+            self.result_display.set_result(columns, rows)
+            self.result_display.auto_size_columns()
+            self.export_button.setEnabled(bool(rows))
+
+        self.statusBar().showMessage(f"多系統查詢完成，共 {len(self.result)} 行（" + "；".join(summary) + "）")
+        self.statusBar().setToolTip("\n".join(summary))
+        if errors:
+            QMessageBox.warning(self, "部分系統查詢失敗", "\n".join(errors))
+
+    def cancel_query(self):
+        if self.active_query is not None:
+            self.query_runner.cancel(self.active_query)
+            self.statusBar().showMessage("正在取消查詢...")
+        elif self.active_stream is not None:
+            # 停止捲動載入：關閉游標，保留已載入的資料
+            self.finish_query(stopped=True)
 
     def export_results(self):
         if not self.result:
             QMessageBox.warning(self, "無結果", "沒有可匯出的查詢結果")
             return
+        if self.active_export is not None:
+            QMessageBox.information(self, "匯出中", "上一個匯出尚未完成")
+            return
 
-        file_path, _ = QFileDialog.getSaveFileName(self, "保存Excel文", "", "Excel Files (*.xlsx)")
+        file_path, selected_filter = QFileDialog.getSaveFileName(self, "匯出查詢結果", "", EXPORT_FILTERS)
         if not file_path:
             return
+        file_path, fmt = export_format(file_path, selected_filter)
+
+        rerun = False
+        if not self.result_complete and self.result_source is not None:
+            answer = QMessageBox.question(
+                self, "匯出全部資料",
+                f"目前只載入 {len(self.result)} 行。\n"
+                "是否重新執行查詢，將完整結果直接寫入檔案？\n選擇「否」只匯出已載入的資料。",
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel)
+            if answer == QMessageBox.Cancel:
+                return
+            rerun = answer == QMessageBox.Yes
+
+        # 在背景寫檔，匯出期間仍可繼續操作
+        if rerun:
+            query, host = self.result_source
+            total = 0
+            self.active_export = self.query_runner.submit(
+                export_query, self.as400_connector, query, file_path, fmt, host,
+                on_result=lambda rows: self.on_export_finished(file_path, rows),
+                on_error=self.on_export_failed, on_progress=self.on_export_progress, timeout=None)
+        else:
+            total = len(self.result)
+            self.active_export = self.query_runner.submit(
+                export_result_set, self.result, file_path, fmt,
+                on_result=lambda rows: self.on_export_finished(file_path, rows),
+                on_error=self.on_export_failed, on_progress=self.on_export_progress, timeout=None)
 
-        try:
-            wb = Workbook()
-            ws = wb.active
-            
-            columns = [self.result_display.horizontalHeaderItem(i).text() for i in range(self.result_display.columnCount())]
-            ws.append(columns)
-
-            for row in self.result:
-                ws.append(row)
+        self.export_cancelled = False
+        self.export_button.setEnabled(False)
+        # total 為 0 時（重新執行查詢，總數未知）顯示忙碌狀態
+        self.export_progress = QProgressDialog(f"正在匯出到 {file_path}...", "取消", 0, total, self)
+        self.export_progress.setWindowTitle("匯出結果")
+        self.export_progress.setAutoClose(False)
+        self.export_progress.setAutoReset(False)
+        self.export_progress.setMinimumDuration(500)
+        self.export_progress.canceled.connect(self.cancel_export)
+        self.export_progress.setValue(0)
+        self.statusBar().showMessage("匯出中...")
+
+    def on_export_progress(self, rows):
+        if self.export_progress is not None:
+            if self.export_progress.maximum():
+                self.export_progress.setValue(rows)
+            self.export_progress.setLabelText(f"已寫入 {rows} 行...")
+        self.statusBar().showMessage(f"匯出中，已寫入 {rows} 行...")
+
+    def cancel_export(self):
+        if self.active_export is not None:
+            self.export_cancelled = True
+            self.query_runner.cancel(self.active_export)
+            self.statusBar().showMessage("正在取消匯出...")
+
+    def end_export(self):
+        self.active_export = None
+        if self.export_progress is not None:
+            # 先清掉參照，關閉對話框時發出的 canceled 不會再取消
+            progress, self.export_progress = self.export_progress, None
+            progress.close()
+        self.export_button.setEnabled(bool(self.result) and self.active_query is None)
+
+    def on_export_finished(self, file_path, rows):
+        self.end_export()
+        self.statusBar().showMessage(f"已匯出 {rows} 行到 {file_path}")
+        QMessageBox.information(self, "匯出成功", f"查詢結果已成功匯出 {rows} 行到:\n{file_path}")
+
+    def on_export_failed(self, error):
+        self.end_export()
+        if self.export_cancelled:
+            self.statusBar().showMessage("匯出已取消，未寫入檔案")
+            return
+        self.statusBar().showMessage("匯出未完成")
+        QMessageBox.critical(self, "匯出失敗", f"匯出結果时發生錯誤: {error}")
 
-            wb.save(file_path)
-            QMessageBox.information(self, "匯出成功", f"查詢結果已成功匯出到:\n{file_path}")
-        except Exception as e:
-            QMessageBox.critical(self, "匯出失敗", f"匯出結果时發生錯誤: {str(e)}")
-    
     def switch_interface(self):
         if self.stacked_widget.currentWidget() == self.main_page:
+            if self.system_monitor_page is None:
+                from system_monitor import SystemMonitorGUI
+                self.system_monitor_page = SystemMonitorGUI(self)
+                self.stacked_widget.addWidget(self.system_monitor_page)
             self.stacked_widget.setCurrentWidget(self.system_monitor_page)
             self.switch_button.setText('切換到主界面')
         else:
@@ -459,7 +861,8 @@ class AS400ConnectorGUI(QMainWindow):
             return
         self.stacked_widget.setCurrentWidget(self.user_manager_page)
         self.switch_button.setText('切換到系統監控')
-        self.refresh_user_list()  # 自動刷新用戶列表
+        # 自動刷新用戶列表；經由排程送出，下一次定時刷新不會緊接著再查一次
+        self.refresh_scheduler.refresh_now("users", self.refresh_user_list)
 
     def switch_to_job_manager(self):
         if not self.job_managers or self.as400_connector.current_connection not in self.job_managers:
@@ -467,9 +870,15 @@ class AS400ConnectorGUI(QMainWindow):
             return
         self.stacked_widget.setCurrentWidget(self.job_manager_page)
         self.switch_button.setText('切換到系統監控')
-        self.refresh_job_list()  # 自動刷新作業列表
+        # 自動刷新作業列表；經由排程送出，下一次定時刷新不會緊接著再查一次
+        self.refresh_scheduler.refresh_now("jobs", self.refresh_job_list)
 
     def closeEvent(self, event):
+        self.refresh_scheduler.stop()
+        self.query_runner.cancel_all()
+        if self.system_monitor_page is not None:
+            self.system_monitor_page.archives.close()
+        self.close_stream()
         for conn in self.as400_connector.connections.values():
             conn.close()
         event.accept()
@@ -488,7 +897,7 @@ class AS400ConnectorGUI(QMainWindow):
         title_layout.addStretch(1)  # 添加彈性空間
         
         refresh_button = QPushButton('刷新')
-        refresh_button.clicked.connect(self.refresh_user_list)
+        refresh_button.clicked.connect(lambda: self.refresh_user_list(refresh=True))
         refresh_button.setFixedSize(80, 30)  # 設置按鈕大小
         refresh_button.setStyleSheet("border: none;")  # 移除邊框
         title_layout.addWidget(refresh_button)
@@ -500,7 +909,7 @@ class AS400ConnectorGUI(QMainWindow):
         
         layout.addLayout(title_layout)
 
-        self.user_table = QTableWidget()
+        self.user_table = ResultTableView()
         layout.addWidget(self.user_table)
         
         button_layout = QHBoxLayout()
@@ -539,6 +948,8 @@ class AS400ConnectorGUI(QMainWindow):
         self.user_filter = QLineEdit()
         self.user_filter.setPlaceholderText("輸入用戶名稱進行篩選 (支持 * 萬用字元)")
         self.user_filter.textChanged.connect(lambda: self.user_filter.setText(self.user_filter.text().upper()))
+        self.user_filter_timer = debounce_timer(self, self.apply_user_filter)
+        self.user_filter.textChanged.connect(self.user_filter_timer.start)
         filter_layout.addWidget(self.user_filter)
 
         filter_button = QPushButton("確認篩選")
@@ -547,43 +958,64 @@ class AS400ConnectorGUI(QMainWindow):
 
         layout.addLayout(filter_layout)
 
-    def refresh_user_list(self):
+    def refresh_user_list(self, refresh=False, quiet=False):
+        """quiet 為 True 時是定時刷新：保留篩選與捲動位置，錯誤只顯示在狀態列"""
         if not self.user_managers or self.as400_connector.current_connection not in self.user_managers:
             QMessageBox.warning(self, "錯誤", "未連接到系統或 UserManager 未初始化")
             return
         
         user_manager_gui = self.user_managers[self.as400_connector.current_connection]
-        users = user_manager_gui.user_manager.list_users()  # 使用 UserManager 的 list_users 方法
+        if not quiet:
+            self.statusBar().showMessage("正在讀取用戶列表...")
+        host = self.as400_connector.current_connection
+        self.refresh_scheduler.submit((host, "users", refresh), self.query_runner,
+                                      user_manager_gui.user_manager.list_users, refresh,  # 使用 UserManager 的 list_users 方法
+                                      on_result=lambda users: self.show_user_list(users, host, quiet),
+                                      on_error=lambda error: self.show_user_list_error(error, quiet))
+
+    def refresh_user_table(self):
+        """用戶命令完成後刷新主視窗的用戶列表，保留篩選與捲動位置
+
+        經由 "users" 登記刷新，與定時刷新共用同一個查詢與下次到期時間，不會緊接著再查一次。
+        """
+        self.refresh_scheduler.refresh_now("users")
+
+    def show_user_list_error(self, error, quiet=False):
+        if quiet:
+            self.statusBar().showMessage(f"自動刷新用戶列表失敗: {error}")
+            return
+        QMessageBox.warning(self, "錯誤", f"無法獲取用戶列表: {error}")
+
+    def show_user_list(self, users, host=None, quiet=False):
         if users:
             columns, data = users
-            self.user_table.setColumnCount(len(columns))
-            self.user_table.setRowCount(len(data))
-            self.user_table.setHorizontalHeaderLabels(columns)
-            
-            for row, user_data in enumerate(data):
-                for col, value in enumerate(user_data):
-                    self.user_table.setItem(row, col, QTableWidgetItem(str(value)))
-            
-            self.user_table.resizeColumnsToContents()
-            self.user_table.setSelectionBehavior(QTableWidget.SelectRows)
+            if quiet and host is not None and host == self.user_table_host:
+                self.user_table.update_result(columns, data, "USER_NAME")
+                return
+            self.user_table_host = host
+            self.user_table.set_result(columns, data)
+            self.user_table.auto_size_columns()
             self.user_filter.clear()  # 清空篩選器
             self.show_all_rows()  # 顯示所有行
+            self.statusBar().showMessage(f"已載入 {len(data)} 個用戶")
+        elif quiet:
+            self.statusBar().showMessage("自動刷新用戶列表失敗")
         else:
             QMessageBox.warning(self, "錯誤", "無法獲取用戶列表")
 
     def show_all_rows(self):
-        for row in range(self.user_table.rowCount()):
-            self.user_table.setRowHidden(row, False)
+        self.user_filter_timer.stop()
+        self.user_table.set_filters([])
 
     def create_user_dialog(self):
         if self.as400_connector.current_connection in self.user_managers:
-            self.user_managers[self.as400_connector.current_connection].create_user_dialog()
+            self.user_managers[self.as400_connector.current_connection].create_user_dialog(self.refresh_user_table)
         else:
             QMessageBox.warning(self, "錯誤", "未連接到系統或 UserManager 未初始化")
 
     def delete_user_dialog(self):
         if self.as400_connector.current_connection in self.user_managers:
-            self.user_managers[self.as400_connector.current_connection].delete_user_dialog()
+            self.user_managers[self.as400_connector.current_connection].delete_user_dialog(self.refresh_user_table)
         else:
             QMessageBox.warning(self, "錯誤", "未連接到系統或 UserManager 未初始化")
 
@@ -618,7 +1050,7 @@ class AS400ConnectorGUI(QMainWindow):
         
         layout.addLayout(title_layout)
 
-        self.job_table = QTableWidget()
+        self.job_table = ResultTableView()
         layout.addWidget(self.job_table)
         
         button_layout = QHBoxLayout()
@@ -637,65 +1069,97 @@ class AS400ConnectorGUI(QMainWindow):
         
         layout.addLayout(button_layout)
 
-    def refresh_job_list(self):
+    def refresh_job_list(self, quiet=False):
+        """quiet 為 True 時是定時刷新，錯誤只顯示在狀態列"""
         if not self.job_managers or self.as400_connector.current_connection not in self.job_managers:
             QMessageBox.warning(self, "錯誤", "未連接到系統或 JobManager 未初始化")
             return
         
         job_manager_gui = self.job_managers[self.as400_connector.current_connection]
-        jobs = job_manager_gui.job_manager.list_active_jobs()  # 使用 JobManager 的 list_active_jobs 方法
+        if not quiet:
+            self.statusBar().showMessage("正在讀取活動作業列表...")
+        host = self.as400_connector.current_connection
+        # 與各系統作業管理畫面未篩選時的查詢相同，同時刷新時合併為一次
+        self.refresh_scheduler.submit((host, "active_jobs", None, None), self.query_runner,
+                                      job_manager_gui.job_manager.list_active_jobs,  # 使用 JobManager 的 list_active_jobs 方法
+                                      on_result=lambda jobs: self.show_job_list(jobs, host, quiet),
+                                      on_error=lambda error: self.show_job_list_error(error, quiet))
+
+    def show_job_list_error(self, error, quiet=False):
+        if quiet:
+            self.statusBar().showMessage(f"自動刷新活動作業列表失敗: {error}")
+            return
+        QMessageBox.warning(self, "錯誤", f"獲取活動作業列表失敗: {error}")
+
+    def show_job_list(self, jobs, host=None, quiet=False):
         if jobs:
             columns, data = jobs
-            self.job_table.setColumnCount(len(columns))
-            self.job_table.setRowCount(len(data))
-            self.job_table.setHorizontalHeaderLabels(columns)
-            
-            for row, row_data in enumerate(data):
-                for col, value in enumerate(row_data):
-                    self.job_table.setItem(row, col, QTableWidgetItem(str(value)))
-            
-            self.job_table.resizeColumnsToContents()
+            if host is not None and host == self.job_table_host:
+                delta = self.job_table.update_result(columns, data, "JOB_NAME")
+            else:
+                # 切換系統後的第一次刷新整批載入
+                self.job_table.set_result(columns, data)
+                delta = None
+            self.job_table_host = host
+            if delta is None:
+                self.job_table.auto_size_columns()
+                self.statusBar().showMessage(f"已載入 {len(data)} 個活動作業")
+            else:
+                self.statusBar().showMessage(
+                    f"已刷新 {len(data)} 個活動作業（新增 {delta[0]}、結束 {delta[1]}、變更 {delta[2]}）")
+        elif quiet:
+            self.statusBar().showMessage("自動刷新活動作業列表失敗")
         else:
-<<<<<<< Updated upstream
             QMessageBox.warning(self, "錯誤", "獲取活動作業列表失敗")
-=======
-            QMessageBox.warning(self, "錯誤", "獲取活動作列表失敗")
->>>>>>> Stashed changes
 
     def end_selected_job(self):
-        if self.as400_connector.current_connection in self.job_managers:
-            self.job_managers[self.as400_connector.current_connection].select_job_dialog("結束")
-        else:
-            QMessageBox.warning(self, "錯誤", "未連接到系統或 JobManager 未初始化")
+        self.job_action("結束")
 
     def hold_selected_job(self):
-        if self.as400_connector.current_connection in self.job_managers:
-            self.job_managers[self.as400_connector.current_connection].select_job_dialog("暫停")
-        else:
-            QMessageBox.warning(self, "錯", "未連接到系統或 JobManager 未初始化")
+        self.job_action("暫停")
 
     def release_selected_job(self):
-        if self.as400_connector.current_connection in self.job_managers:
-            self.job_managers[self.as400_connector.current_connection].select_job_dialog("釋放")
-        else:
+        self.job_action("釋放")
+
+    def job_action(self, action):
+        """處理作業表格中選取的作業（可多選），沒有選取時開啟選擇對話框"""
+        host = self.as400_connector.current_connection
+        if host not in self.job_managers:
             QMessageBox.warning(self, "錯誤", "未連接到系統或 JobManager 未初始化")
+            return
+        if self.job_table_host != host:
+            # 表格中還是其他系統的作業，不能拿來操作；清空後由對話框載入目前系統的作業
+            self.job_table.set_result([], [])
+            self.job_table_host = None
+        self.job_managers[host].job_action(action, self.job_table, self.refresh_job_list)
 
     def set_managers(self, user_manager, job_manager):
+        from user_manager import UserManagerGUI
+        from job_manager import JobManagerGUI
         self.user_managers[self.as400_connector.current_connection] = UserManagerGUI(self, user_manager)
         self.job_managers[self.as400_connector.current_connection] = JobManagerGUI(self, job_manager)
 
     def disable_user_dialog(self):
         if self.as400_connector.current_connection in self.user_managers:
-            self.user_managers[self.as400_connector.current_connection].disable_user_dialog()
+            self.user_managers[self.as400_connector.current_connection].disable_user_dialog(self.refresh_user_table)
         else:
             QMessageBox.warning(self, "錯誤", "未連接到系統或 UserManager 未初始化")
 
     def enable_user_dialog(self):
         if self.as400_connector.current_connection in self.user_managers:
-            self.user_managers[self.as400_connector.current_connection].enable_user_dialog()
+            self.user_managers[self.as400_connector.current_connection].enable_user_dialog(self.refresh_user_table)
         else:
             QMessageBox.warning(self, "錯誤", "未連接到系統或 UserManager 未初始化")
 
+    def update_cache_status(self):
+        stats = self.as400_connector.result_cache.get_stats()
+        shared = self.as400_connector.single_flight.get_stats()["shared"]
+        self.cache_status_label.setText(
+            f"快取 命中 {stats['hits']} / 未命中 {stats['misses']}（{stats['entries']} 筆）・合併查詢 {shared}")
+
+    def show_slow_queries(self):
+        SlowQueryDialog(self, self.as400_connector.metrics).exec()
+
     def update_current_connection(self):
         if self.as400_connector.current_connection:
             self.system_combo.setCurrentText(self.as400_connector.current_connection)
@@ -703,7 +1167,7 @@ class AS400ConnectorGUI(QMainWindow):
 
     def modify_user_authorities_dialog(self):
         if self.as400_connector.current_connection in self.user_managers:
-            self.user_managers[self.as400_connector.current_connection].modify_authorities_dialog()
+            self.user_managers[self.as400_connector.current_connection].modify_authorities_dialog(self.refresh_user_table)
         else:
             QMessageBox.warning(self, "錯誤", "未連接到系統或 UserManager 未初始化")
 
@@ -714,15 +1178,6 @@ class AS400ConnectorGUI(QMainWindow):
             QMessageBox.warning(self, "錯誤", "未連接到系統或 UserManager 未初始化")
 
     def apply_user_filter(self):
-        filter_text = self.user_filter.text().upper()
-        for row in range(self.user_table.rowCount()):
-            item = self.user_table.item(row, 0)  # 假設用戶名在第一列
-            if item:
-                if self.match_wildcard(item.text().upper(), filter_text):
-                    self.user_table.setRowHidden(row, False)
-                else:
-                    self.user_table.setRowHidden(row, True)
-
-    def match_wildcard(self, text, pattern):
-        import fnmatch
-        return fnmatch.fnmatch(text, pattern)
\ No newline at end of file
+        self.user_filter_timer.stop()
+        # 用戶名在第一列，以萬用字元比對整個名稱
+        self.user_table.set_filters([(0, compile_filter(self.user_filter.text(), full_match=True))])
\ No newline at end of file
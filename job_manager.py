@@ -1,56 +1,162 @@
-import jaydebeapi
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QMessageBox, QLineEdit, QDialog, QListWidget, QDialogButtonBox
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QMessageBox, QLineEdit, QDialog, QListWidget,
+                               QDialogButtonBox, QAbstractItemView, QLabel, QProgressDialog)
 from PySide6.QtCore import Qt, QTimer
+from as400_connector import (FETCH_BATCH_SIZE, cl_job_name, cl_name, finish_query_record, invalidate_command,
+                             record_execute, single_flight, start_query_record)
+from columnar import read_result_set
+from query_worker import BackgroundQueryRunner
+from refresh_scheduler import JOB_REFRESH_INTERVAL
+from result_model import ResultTableView, compile_filter, debounce_timer
+
+# ACTIVE_JOB_INFO 的 SUBSYSTEM_LIST_FILTER / CURRENT_USER_LIST_FILTER 最多可列出的名稱數
+MAX_SUBSYSTEM_FILTER_NAMES = 25
+MAX_USER_FILTER_NAMES = 10
+# 批次作業操作最多同時執行的命令數（另受連接池大小限制）
+BULK_ACTION_MAX_WORKERS = 8
+# 介面上的操作名稱對應到 JobManager 的方法
+JOB_ACTIONS = {"結束": "end", "暫停": "hold", "釋放": "release"}
+
+
+def server_filter_names(text, known, limit):
+    """篩選文字是逗號分隔的完整名稱清單時回傳名稱 tuple，可交給伺服器篩選
+
+    只有出現過的名稱（known）才交給伺服器，輸入到一半的名稱或萬用字元
+    仍由用戶端以包含比對篩選；無法交給伺服器時回傳 None。
+    """
+    names = []
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            name = cl_name(item)
+        except ValueError:
+            return None
+        if name not in known:
+            return None
+        names.append(name)
+    if not names or len(names) > limit:
+        return None
+    return tuple(sorted(set(names)))
+
 
 class JobManager:
     def __init__(self, connection):
         self.connection = connection
 
-    def list_active_jobs(self):
-        """列出所有活動作業"""
-        query = """
+    def list_active_jobs(self, subsystems=None, users=None):
+        """列出活動作業
+
+        subsystems/users 為名稱列表時交給 ACTIVE_JOB_INFO 的清單篩選參數，由伺服器只回傳符合的作業；
+        DETAILED_INFO => 'NONE' 讓伺服器略過這裡用不到的詳細資訊。
+        """
+        arguments = []
+        params = []
+        if subsystems:
+            arguments.append("SUBSYSTEM_LIST_FILTER => ?")
+            params.append(",".join(cl_name(name) for name in subsystems[:MAX_SUBSYSTEM_FILTER_NAMES]))
+        if users:
+            arguments.append("CURRENT_USER_LIST_FILTER => ?")
+            params.append(",".join(cl_name(name) for name in users[:MAX_USER_FILTER_NAMES]))
+        arguments.append("DETAILED_INFO => 'NONE'")
+        query = f"""
         SELECT JOB_NAME, AUTHORIZATION_NAME AS USER, JOB_TYPE, FUNCTION, SUBSYSTEM
-        FROM TABLE(QSYS2.ACTIVE_JOB_INFO()) 
+        FROM TABLE(QSYS2.ACTIVE_JOB_INFO({", ".join(arguments)}))
         ORDER BY SUBSYSTEM, JOB_NAME
         """
-        return self._execute_query(query)
+        return self._execute_query(query, params)
 
     def end_job(self, job_name):
         """結束指定作業"""
-        cmd = f"ENDJOB JOB({job_name}) OPTION(*IMMED)"
+        cmd = f"ENDJOB JOB({cl_job_name(job_name)}) OPTION(*IMMED)"
         self._execute_command(cmd)
 
     def hold_job(self, job_name):
         """暫停指定作業"""
-        cmd = f"HLDJOB JOB({job_name})"
+        cmd = f"HLDJOB JOB({cl_job_name(job_name)})"
         self._execute_command(cmd)
 
     def release_job(self, job_name):
         """釋放指定作業"""
-        cmd = f"RLSJOB JOB({job_name})"
+        cmd = f"RLSJOB JOB({cl_job_name(job_name)})"
         self._execute_command(cmd)
 
-    def _execute_query(self, query):
-        try:
+    def bulk_job_action(self, action, job_names, stop=None, progress=None, max_workers=BULK_ACTION_MAX_WORKERS):
+        """對多個作業同時執行 end/hold/release，回傳 [(作業名稱, 錯誤訊息或 None)]，順序與 job_names 相同
+
+        同時執行的命令數不超過連接池大小減一，保留一個連接給刷新等查詢。
+        stop (threading.Event) 被設定後，尚未開始的作業不再執行。
+        """
+        run = getattr(self, f"{action}_job")
+        pool_size = getattr(self.connection, "max_size", 2)
+        workers = max(1, min(max_workers, pool_size - 1, len(job_names)))
+        lock = threading.Lock()
+        done = [0]
+
+        def run_one(job_name):
+            error = None
+            if stop is not None and stop.is_set():
+                error = "已取消，未執行"
+            else:
+                try:
+                    run(job_name)
+                except Exception as e:
+                    error = str(e)
+            if progress is not None:
+                with lock:
+                    done[0] += 1
+                    count = done[0]
+                progress(count)
+            return job_name, error
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(run_one, job_names))
+
+    def _execute_query(self, query, params=None):
+        record = start_query_record(self.connection, "JobManager", query)
+        is_select = query.strip().upper().startswith("SELECT")
+
+        def run():
             with self.connection.cursor() as cursor:
-                cursor.execute(query)
-                if query.strip().upper().startswith("SELECT"):
+                cursor.execute(query, params or ())
+                record_execute(record, cursor)
+                if is_select:
                     columns = [desc[0] for desc in cursor.description]
-                    result = cursor.fetchall()
-                    return columns, result
-                else:
-                    return None
+                    return columns, read_result_set(cursor, columns, FETCH_BATCH_SIZE, record)
+                return None
+
+        try:
+            if not is_select:
+                run()
+                finish_query_record(record)
+                return None
+            # 同一系統的相同查詢（例如主視窗與作業管理畫面同時刷新）只送一次到伺服器
+            result, shared = single_flight(self.connection, query, params, run)
+            return finish_query_record(record, result, cached=shared)
         except Exception as e:
+            finish_query_record(record, error=str(e))
             print(f"執行查詢時發生錯誤: {str(e)}")
             return None
 
     def _execute_command(self, cmd):
+        # 只記錄命令名稱，參數可能含有密碼
+        record = start_query_record(self.connection, "JobManager", "CALL QSYS2.QCMDEXC(?)",
+                                    f"QCMDEXC {cmd.split(' ', 1)[0]}")
         try:
             with self.connection.cursor() as cursor:
                 cursor.execute("CALL QSYS2.QCMDEXC(?)", (cmd,))
+                record_execute(record, cursor)
+            finish_query_record(record)
         except Exception as e:
+            finish_query_record(record, error=str(e))
             print(f"執行命令時發生錯誤: {str(e)}")
             raise
+        finally:
+            # 命令可能部分生效，無論成功與否都讓相關快取與執行中的查詢失效
+            invalidate_command(self.connection, cmd)
 
 class JobManagerGUI(QWidget):
     def __init__(self, parent, job_manager):
@@ -58,12 +164,17 @@ class JobManagerGUI(QWidget):
         self.parent = parent
         self.job_manager = job_manager
         self.should_refresh = True
+        self.refresh_pending = False
+        # 交給伺服器的篩選 (子系統, 用戶)，以及出現過的名稱，用來判斷篩選文字是否為完整名稱
+        self.server_filter = (None, None)
+        self.known_subsystems = set()
+        self.known_users = set()
+        self.query_runner = BackgroundQueryRunner(self)
+        self.host = job_manager.connection.host
+        self.scheduler = parent.refresh_scheduler
         self.initUI()
-        
-        # 設置定時器，每30秒自動刷新一次
-        self.refresh_timer = QTimer(self)
-        self.refresh_timer.timeout.connect(self.refresh_job_list)
-        self.refresh_timer.start(30000)  # 30000毫秒 = 30秒
+        # 只在畫面顯示時刷新，第一次顯示時載入作業列表
+        self.enable_refresh()
 
     def initUI(self):
         layout = QVBoxLayout(self)
@@ -84,66 +195,88 @@ class JobManagerGUI(QWidget):
         self.end_button = QPushButton('結束作業')
         self.hold_button = QPushButton('暫停作業')
         self.release_button = QPushButton('釋放作業')
+        self.cancel_button = QPushButton('取消查詢')
+        self.cancel_button.setEnabled(False)
 
         button_layout.addWidget(self.refresh_button)
         button_layout.addWidget(self.end_button)
         button_layout.addWidget(self.hold_button)
         button_layout.addWidget(self.release_button)
+        button_layout.addWidget(self.cancel_button)
 
         layout.addLayout(button_layout)
 
         # 創建表格
-        self.job_table = QTableWidget()
+        self.job_table = ResultTableView()
         layout.addWidget(self.job_table)
 
         # 連接按鈕信號
         self.refresh_button.clicked.connect(self.refresh_job_list)
-        self.end_button.clicked.connect(lambda: self.select_job_dialog("結束"))
-        self.hold_button.clicked.connect(lambda: self.select_job_dialog("暫停"))
-        self.release_button.clicked.connect(lambda: self.select_job_dialog("釋放"))
+        self.cancel_button.clicked.connect(self.query_runner.cancel_all)
+        self.query_runner.busy_changed.connect(self.cancel_button.setEnabled)
+        self.end_button.clicked.connect(lambda: self.job_action("結束"))
+        self.hold_button.clicked.connect(lambda: self.job_action("暫停"))
+        self.release_button.clicked.connect(lambda: self.job_action("釋放"))
 
-        # 連接篩選信號
-        self.subsystem_filter.textChanged.connect(self.apply_filters)
-        self.user_filter.textChanged.connect(self.apply_filters)
-
-        # 初始化作業列表
-        self.refresh_job_list()
+        # 連接篩選信號，輸入停止後才重新篩選
+        self.filter_timer = debounce_timer(self, self.apply_filters)
+        self.subsystem_filter.textChanged.connect(self.filter_timer.start)
+        self.user_filter.textChanged.connect(self.filter_timer.start)
 
     def refresh_job_list(self):
         if not self.should_refresh:
             return
-        result = self.job_manager.list_active_jobs()
+        if self.query_runner.is_busy():
+            # 篩選條件在查詢途中改變時，查詢結束後再刷新一次
+            self.refresh_pending = True
+            return
+        self.refresh_pending = False
+        subsystems, users = self.server_filter
+        self.scheduler.submit((self.host, "active_jobs", subsystems, users), self.query_runner,
+                              self.job_manager.list_active_jobs, subsystems, users,
+                              on_result=self.show_job_list,
+                              on_error=lambda error: self.show_job_list(None))
+
+    def show_job_list(self, result):
+        if self.refresh_pending and result:
+            QTimer.singleShot(0, self.refresh_job_list)
         if result:
+            start = time.perf_counter()
             columns, data = result
-            self.job_table.setColumnCount(len(columns))
-            self.job_table.setRowCount(len(data))
-            self.job_table.setHorizontalHeaderLabels(columns)
-
-            for row, job_data in enumerate(data):
-                for col, value in enumerate(job_data):
-                    self.job_table.setItem(row, col, QTableWidgetItem(str(value)))
-
-            self.job_table.resizeColumnsToContents()
-            self.apply_filters()
-        else:
-            self.should_refresh = False
-            self.refresh_timer.stop()
+            if "SUBSYSTEM" in columns:
+                self.known_subsystems.update(data.column("SUBSYSTEM"))
+                self.known_users.update(data.column("USER"))
+            # 只套用與上次結果的差異，保留選取與捲動位置
+            if self.job_table.update_result(columns, data, "JOB_NAME") is None:
+                self.job_table.auto_size_columns()
+            if result.record is not None:
+                result.record.add_time("render", time.perf_counter() - start)
+
+    def job_filters(self, subsystem_text, user_text, model=None):
+        """依欄位名稱組成篩選條件；結果尚未載入時回傳空列表"""
+        model = model or self.job_table.result_model
+        if "SUBSYSTEM" not in model.columns:
+            return []
+        return [(model.column_index("SUBSYSTEM"), compile_filter(subsystem_text)),
+                (model.column_index("USER"), compile_filter(user_text))]
 
     def apply_filters(self):
-        subsystem_filter = self.subsystem_filter.text().lower()
-        user_filter = self.user_filter.text().lower()
-
-        for row in range(self.job_table.rowCount()):
-            subsystem = self.job_table.item(row, 1).text().lower()  # 假設子系統在第2列
-            user = self.job_table.item(row, 2).text().lower()  # 假設用戶名在第3列
-            if subsystem_filter in subsystem and user_filter in user:
-                self.job_table.setRowHidden(row, False)
-            else:
-                self.job_table.setRowHidden(row, True)
+        self.filter_timer.stop()
+        self.job_table.set_filters(self.job_filters(self.subsystem_filter.text(), self.user_filter.text()))
+        # 篩選文字為完整名稱時改由伺服器篩選，其餘情況用戶端篩選只是在已載入的資料上細分
+        server_filter = (
+            server_filter_names(self.subsystem_filter.text(), self.known_subsystems, MAX_SUBSYSTEM_FILTER_NAMES),
+            server_filter_names(self.user_filter.text(), self.known_users, MAX_USER_FILTER_NAMES))
+        if server_filter != self.server_filter:
+            self.server_filter = server_filter
+            self.refresh_job_list()
 
-    def select_job_dialog(self, action):
+    def select_job_dialog(self, action, table=None, refresh=None):
+        """以 table（預設為本畫面的作業表格）的作業列表選擇作業；refresh 用來刷新該表格"""
+        table = table or self.job_table
+        refresh = refresh or self.refresh_job_list
         # 首先刷新作業列表
-        self.refresh_job_list()
+        refresh()
         
         dialog = QDialog(self)
         dialog.setWindowTitle(f"選擇要{action}的作業")
@@ -162,23 +295,42 @@ class JobManagerGUI(QWidget):
         layout.addLayout(filter_layout)
 
         job_list = QListWidget()
+        job_list.setUniformItemSizes(True)
+        job_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         layout.addWidget(job_list)
 
+        model = table.result_model
+
         def apply_filters():
+            filter_timer.stop()
+            # 作業列表更新時重新填入，保留已選取的作業與捲動位置
+            selected = {item.text() for item in job_list.selectedItems()}
+            scroll = job_list.verticalScrollBar().value()
             job_list.clear()
-            subsystem_text = subsystem_filter.text().lower()
-            user_text = user_filter.text().lower()
-            for row in range(self.job_table.rowCount()):
-                job_name = self.job_table.item(row, 0).text()
-                subsystem = self.job_table.item(row, 4).text().lower()  # 假設子系統在第5列
-                user = self.job_table.item(row, 1).text().lower()  # 假設用戶名在第2列
-                if subsystem_text in subsystem and user_text in user:
-                    job_list.addItem(job_name)
-
-        # 連接篩選按鈕的信號
+            if "JOB_NAME" not in model.columns:
+                return
+            result = model.result
+            job_col = model.column_index("JOB_NAME")
+            rows = model.matching_rows(self.job_filters(subsystem_filter.text(), user_filter.text(), model))
+            job_list.addItems([result.display(row, job_col) for row in rows])
+            if selected:
+                for row in range(job_list.count()):
+                    item = job_list.item(row)
+                    if item.text() in selected:
+                        item.setSelected(True)
+            job_list.verticalScrollBar().setValue(scroll)
+
+        # 連接篩選按鈕的信號，輸入停止後也會自動篩選
+        filter_timer = debounce_timer(dialog, apply_filters)
         filter_button.clicked.connect(apply_filters)
-
-        # 初始填充作業列表
+        subsystem_filter.textChanged.connect(filter_timer.start)
+        user_filter.textChanged.connect(filter_timer.start)
+        # 刷新是非同步的：作業列表尚未載入時對話框先是空的，結果到達後自動填入
+        model_signals = (model.modelReset, model.rowsInserted, model.rowsRemoved)
+        for signal in model_signals:
+            signal.connect(filter_timer.start)
+
+        # 以已載入的作業列表初始填充
         apply_filters()
 
         button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
@@ -186,54 +338,104 @@ class JobManagerGUI(QWidget):
         button_box.rejected.connect(dialog.reject)
         layout.addWidget(button_box)
 
-        if dialog.exec_() == QDialog.Accepted:
-            selected_items = job_list.selectedItems()
-            if selected_items:
-                job_name = selected_items[0].text()
-                if action == "結束":
-                    self.end_selected_job(job_name)
-                elif action == "暫停":
-                    self.hold_selected_job(job_name)
-                elif action == "釋放":
-                    self.release_selected_job(job_name)
+        accepted = dialog.exec_() == QDialog.Accepted
+        for signal in model_signals:
+            signal.disconnect(filter_timer.start)
+        selected_jobs = [item.text() for item in job_list.selectedItems()]
+        dialog.deleteLater()
+        if accepted:
+            if selected_jobs:
+                self.run_job_action(action, selected_jobs, refresh)
             else:
-                QMessageBox.warning(self, "警告", "請選擇一個作業")
-
-    def end_selected_job(self, job_name):
-        confirm = QMessageBox.question(self, "確認", f"確定要結束作業 {job_name} 嗎？",
-                                       QMessageBox.Yes | QMessageBox.No)
-        if confirm == QMessageBox.Yes:
-            try:
-                self.job_manager.end_job(job_name)
-                QMessageBox.information(self, "成功", f"作業 {job_name} 已成功結束")
-                self.refresh_job_list()
-            except Exception as e:
-                QMessageBox.critical(self, "錯誤", f"結束作業時發生錯誤: {str(e)}")
-
-    def hold_selected_job(self, job_name):
-        try:
-            self.job_manager.hold_job(job_name)
-            QMessageBox.information(self, "成功", f"作業 {job_name} 已成功暫停")
-            self.refresh_job_list()
-        except Exception as e:
-            QMessageBox.critical(self, "錯誤", f"暫停作業時發生錯誤: {str(e)}")
+                QMessageBox.warning(self, "警告", "請選擇至少一個作業")
 
-    def release_selected_job(self, job_name):
-        try:
-            self.job_manager.release_job(job_name)
-            QMessageBox.information(self, "成功", f"作業 {job_name} 已成功釋放")
-            self.refresh_job_list()
-        except Exception as e:
-            QMessageBox.critical(self, "錯誤", f"釋放作業時發生錯誤: {str(e)}")
+    def job_action(self, action, table=None, refresh=None):
+        """作業表格有選取的列時直接處理選取的作業，否則開啟選擇對話框
+
+        table 為使用者看到的作業表格（例如主視窗的作業管理頁面），預設為本畫面的表格；
+        refresh 刷新該表格，完成操作後呼叫。
+        """
+        table = table or self.job_table
+        model = table.result_model
+        rows = table.selected_rows()
+        if rows and "JOB_NAME" in model.columns:
+            job_col = model.column_index("JOB_NAME")
+            self.run_job_action(action, [model.display(row, job_col) for row in rows], refresh)
+        else:
+            self.select_job_dialog(action, table, refresh)
+
+    def run_job_action(self, action, job_names, refresh=None):
+        """在背景以多個連接同時執行，完成後顯示每個作業的結果並只刷新一次"""
+        refresh = refresh or self.refresh_job_list
+        if action == "結束" or len(job_names) > 1:
+            if len(job_names) == 1:
+                message = f"確定要{action}作業 {job_names[0]} 嗎？"
+            else:
+                message = f"確定要{action}選取的 {len(job_names)} 個作業嗎？"
+            confirm = QMessageBox.question(self, "確認", message, QMessageBox.Yes | QMessageBox.No)
+            if confirm != QMessageBox.Yes:
+                return
+
+        stop = threading.Event()
+        progress = QProgressDialog(f"正在{action} {len(job_names)} 個作業...", "停止", 0, len(job_names), self)
+        progress.setWindowTitle(f"{action}作業")
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+        progress.setMinimumDuration(500)
+        progress.canceled.connect(stop.set)
+        progress.setValue(0)
+
+        def finished(results):
+            progress.canceled.disconnect(stop.set)
+            progress.close()
+            self.show_action_report(action, results)
+            refresh()
+
+        def failed(error):
+            progress.canceled.disconnect(stop.set)
+            progress.close()
+            QMessageBox.critical(self, "錯誤", f"{action}作業時發生錯誤: {error}")
+            refresh()
+
+        self.query_runner.submit(self.job_manager.bulk_job_action, JOB_ACTIONS[action], job_names, stop,
+                                 on_result=finished, on_error=failed, on_progress=progress.setValue, timeout=None)
+
+    def show_action_report(self, action, results):
+        failures = [(job_name, error) for job_name, error in results if error]
+        succeeded = len(results) - len(failures)
+        if len(results) == 1:
+            job_name, error = results[0]
+            if error:
+                QMessageBox.critical(self, "錯誤", f"{action}作業 {job_name} 時發生錯誤: {error}")
+            else:
+                QMessageBox.information(self, "成功", f"作業 {job_name} 已成功{action}")
+            return
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle(f"{action}作業結果")
+        dialog.resize(700, 400)
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel(f"共 {len(results)} 個作業：成功 {succeeded}，失敗 {len(failures)}"))
+        table = ResultTableView()
+        # 失敗的排在前面
+        rows = failures + [(job_name, "成功") for job_name, error in results if not error]
+        table.set_result(["JOB_NAME", "結果"], rows)
+        table.auto_size_columns()
+        layout.addWidget(table)
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok)
+        button_box.accepted.connect(dialog.accept)
+        layout.addWidget(button_box)
+        dialog.exec_()
 
     def enable_refresh(self):
         self.should_refresh = True
-        self.refresh_timer.start()
+        self.scheduler.add(("job_manager", self.host), JOB_REFRESH_INTERVAL, self.refresh_job_list, self)
 
     def disable_refresh(self):
         self.should_refresh = False
-        self.refresh_timer.stop()
+        self.scheduler.remove(("job_manager", self.host))
 
     def closeEvent(self, event):
-        self.refresh_timer.stop()
+        self.disable_refresh()
+        self.query_runner.cancel_all()
         super().closeEvent(event)
\ No newline at end of file
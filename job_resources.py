@@ -0,0 +1,146 @@
+import heapq
+import threading
+import time
+from array import array
+
+# 每個作業保留的取樣數（環形緩衝長度）
+HISTORY_SAMPLES = 30
+# 資源排行顯示的作業數
+TOP_N = 20
+# 可排行的指標：(顯示名稱, ACTIVE_JOB_INFO 欄位, 是否為累計值)
+# 累計值（CPU 毫秒、磁碟 IO 次數）記錄兩次取樣間每秒的增量，暫存空間 (MB) 記錄當下的值
+METRICS = (
+    ("CPU 毫秒/秒", "CPU_TIME", True),
+    ("IO 次/秒", "TOTAL_DISK_IO_COUNT", True),
+    ("暫存 MB", "TEMPORARY_STORAGE", False),
+)
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+JOB_RESOURCE_QUERY = """
+SELECT JOB_NAME, AUTHORIZATION_NAME AS USER, SUBSYSTEM, JOB_STATUS,
+       CPU_TIME, TOTAL_DISK_IO_COUNT, TEMPORARY_STORAGE
+FROM TABLE(QSYS2.ACTIVE_JOB_INFO(DETAILED_INFO => 'NONE'))
+"""
+
+TOP_COLUMNS = ["JOB_NAME", "USER", "SUBSYSTEM", "JOB_STATUS"] + [name for name, _, _ in METRICS] + ["走勢"]
+
+
+def sparkline(values):
+    """以區塊字元畫出數列的走勢，最大值為滿格"""
+    if not values:
+        return ""
+    top = max(values)
+    if top <= 0:
+        return SPARK_CHARS[0] * len(values)
+    scale = (len(SPARK_CHARS) - 1) / top
+    return "".join(SPARK_CHARS[int(max(value, 0) * scale)] for value in values)
+
+
+def _format(value):
+    return f"{value:.1f}" if value < 100 else f"{value:.0f}"
+
+
+class JobResourceHistory:
+    """單一系統各作業資源用量的時間序列
+
+    每個作業佔用一個槽位，各指標的所有槽位共用一個 array，每個槽位是長度 samples 的環形緩衝；
+    所有作業同時取樣，環形位置由取樣次數決定。結束的作業歸還槽位給新作業使用，
+    記憶體只隨同時存在的作業數增長，不隨執行時間增長。
+    取樣可在背景執行緒進行，讀取與寫入以鎖保護。
+    """
+
+    def __init__(self, samples=HISTORY_SAMPLES):
+        self.samples = samples
+        self.sample_count = 0
+        self.last_time = None
+        self._slots = {}  # 作業名稱 -> 槽位
+        self._free = []
+        self._info = []  # 槽位 -> (用戶, 子系統, 狀態)
+        self._first = array("q")  # 槽位 -> 作業第一次出現的取樣序號
+        self._seen = array("q")  # 槽位 -> 最後一次出現的取樣序號
+        self._counters = [array("d") for _ in METRICS]  # 槽位 -> 上次的累計值
+        self._series = [array("f") for _ in METRICS]  # 槽位 * samples + 環形位置 -> 值
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _allocate(self, name):
+        if self._free:
+            slot = self._free.pop()
+            self._first[slot] = self.sample_count
+        else:
+            slot = len(self._first)
+            self._first.append(self.sample_count)
+            self._seen.append(0)
+            self._info.append(None)
+            for counters, series in zip(self._counters, self._series):
+                counters.append(0.0)
+                series.extend(array("f", bytes(4 * self.samples)))
+        self._slots[name] = slot
+        return slot
+
+    def add_sample(self, data, now=None):
+        """加入一次 JOB_RESOURCE_QUERY 的結果；沒有出現在結果中的作業視為已結束並移除"""
+        now = time.monotonic() if now is None else now
+        names = data.column("JOB_NAME")
+        users, subsystems, statuses = data.column("USER"), data.column("SUBSYSTEM"), data.column("JOB_STATUS")
+        columns = [data.column(column) for _, column, _ in METRICS]
+        with self._lock:
+            elapsed = now - self.last_time if self.last_time is not None else 0
+            count = self.sample_count
+            position = count % self.samples
+            for row, name in enumerate(names):
+                slot = self._slots.get(name)
+                new = slot is None
+                if new:
+                    slot = self._allocate(name)
+                self._seen[slot] = count
+                self._info[slot] = (users[row], subsystems[row], statuses[row])
+                offset = slot * self.samples + position
+                for index, (_, _, cumulative) in enumerate(METRICS):
+                    value = columns[index][row] or 0
+                    if cumulative:
+                        counters = self._counters[index]
+                        previous = counters[slot]
+                        counters[slot] = value
+                        # 新出現的作業沒有上一次的值；累計值變小（例如作業號碼重複使用）時視為 0
+                        value = 0.0 if new or elapsed <= 0 else max(value - previous, 0) / elapsed
+                    self._series[index][offset] = value
+            ended = [name for name, slot in self._slots.items() if self._seen[slot] != count]
+            for name in ended:
+                self._free.append(self._slots.pop(name))
+            self.sample_count = count + 1
+            self.last_time = now
+        return len(ended)
+
+    def _history(self, index, slot):
+        """依時間順序取出槽位的數列，只含作業出現之後的取樣"""
+        count = min(self.sample_count - self._first[slot], self.samples)
+        series = self._series[index]
+        base = slot * self.samples
+        return [series[base + sample % self.samples] for sample in range(self.sample_count - count, self.sample_count)]
+
+    def top(self, metric=0, limit=TOP_N):
+        """依最近一次取樣的指標排行，回傳 (欄位, 列) 可直接交給 ResultTableView"""
+        with self._lock:
+            if not self.sample_count:
+                return TOP_COLUMNS, []
+            position = (self.sample_count - 1) % self.samples
+            series = self._series[metric]
+            samples = self.samples
+            ranked = heapq.nlargest(limit, self._slots.items(), key=lambda item: series[item[1] * samples + position])
+            rows = []
+            for name, slot in ranked:
+                latest = [_format(values[slot * samples + position]) for values in self._series]
+                rows.append([name, *self._info[slot], *latest, sparkline(self._history(metric, slot))])
+        return TOP_COLUMNS, rows
+
+
+def sample_top_jobs(connector, host, history, metric=0, limit=TOP_N):
+    """在背景執行緒取樣一次並回傳 ((欄位, 列), 錯誤)，格式與 AS400Connector.execute_query 相同"""
+    result, error = connector.execute_query(JOB_RESOURCE_QUERY, host, source="JobResources")
+    if error:
+        return None, error
+    history.add_sample(result[1])
+    return history.top(metric, limit), None
@@ -1,36 +1,37 @@
 import sys
-<<<<<<< Updated upstream
-import asyncio
+from utils import StartupProfiler, setup_environment
+
+# 盡早建立，才能量測後續模組載入的時間
+profiler = StartupProfiler("--startup-profile" in sys.argv)
+
 from PySide6.QtWidgets import QApplication
 from PySide6.QtCore import QTimer
-=======
-# from PySide6.QtCore import QTimer  # 移除未使用的 QTimer 導入
->>>>>>> Stashed changes
-from gui import AS400ConnectorGUI
-from user_manager import UserManager
-from job_manager import JobManager
-from as400_connector import AS400Connector
-<<<<<<< Updated upstream
-=======
-from utils import setup_environment
-import logging  # 添加此行以導入 logging 模組
-from PySide6.QtWidgets import QApplication  # 確保 PySide6 已正確安裝
->>>>>>> Stashed changes
+from as400_connector import start_jvm_warm_up
+from drivers import create_driver
+profiler.mark("載入 Qt 與連接模組")
+
+def get_option(argv, name):
+    """讀取 --名稱=值 形式的參數，例如 --driver=simulated:jobs=40000,latency=0.05
+    或 --metrics-file=/var/lib/node_exporter/textfile/db400.prom、--archive-dir=/data/db400/archive"""
+    for arg in argv:
+        if arg.startswith(f"--{name}="):
+            return arg.split("=", 1)[1]
+    return None
 
 def create_application():
     app = QApplication(sys.argv)
     app.setStyle('Fusion')  # 使用 Fusion 風格以獲得更現代的外觀
     return app
 
-def setup_main_gui():
-    main_gui = AS400ConnectorGUI()
+def setup_main_gui(driver=None):
+    from gui import AS400ConnectorGUI
+    main_gui = AS400ConnectorGUI(driver)
     return main_gui
 
-<<<<<<< Updated upstream
 def initialize_managers(main_gui):
-    # 同步初始化 AS400Connector
-    connector = AS400Connector()
-    
+    from user_manager import UserManager
+    from job_manager import JobManager
+
     # 使用 main_gui 中的連接信息
     connection = main_gui.as400_connector.connections.get(main_gui.as400_connector.current_connection)
     
@@ -44,25 +45,39 @@ def initialize_managers(main_gui):
     
     # 設置 managers
     main_gui.set_managers(user_manager, job_manager)
-=======
-# 確保在使用之前定義 initialize_managers 函數
-def initialize_managers(main_gui, connection):
-    # ... 函數實現 ...
-    pass  # 替換為實際代碼
 
 def get_active_connection(main_gui):
     return main_gui.as400_connector.connections.get(main_gui.as400_connector.current_connection)
->>>>>>> Stashed changes
+
+def first_paint_done():
+    profiler.mark("首次繪製")
+    profiler.report()
 
 def main():
+    driver = create_driver(get_option(sys.argv, "driver"))
+    if driver.uses_jvm:
+        setup_environment()
+        profiler.mark("設定 Java 環境")
+
     app = create_application()
-    main_gui = setup_main_gui()
-    
-    # 使用 QTimer 來延遲執行初始化和顯示 GUI
-    QTimer.singleShot(0, lambda: initialize_managers(main_gui))
-    QTimer.singleShot(0, main_gui.show)
+    profiler.mark("建立 QApplication")
+
+    # JVM 與 jt400 驅動在背景預熱，與視窗繪製同時進行
+    start_jvm_warm_up(lambda elapsed, error: profiler.record("JVM 預熱", elapsed), driver)
+
+    main_gui = setup_main_gui(driver)
+    # 設定後每次查詢結束會定期以 Prometheus 文字格式寫出延遲統計
+    main_gui.as400_connector.metrics.prometheus_path = get_option(sys.argv, "metrics-file")
+    # 系統監控收集的訊息封存位置，預設為 ~/.db400_tool/archive
+    main_gui.archive_dir = get_option(sys.argv, "archive-dir")
+    profiler.mark("建立主視窗")
+
+    main_gui.show()
+    QTimer.singleShot(0, first_paint_done)
     
-    sys.exit(app.exec())
+    status = app.exec()
+    main_gui.as400_connector.metrics.write_prometheus()
+    sys.exit(status)
 
 if __name__ == '__main__':
     main()
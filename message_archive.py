@@ -0,0 +1,282 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from columnar import ResultSet
+from message_tail import MAX_TAIL_ROWS, TIMESTAMP_COLUMN
+
+# 本機訊息封存的預設位置，每個系統一個 SQLite 檔案
+ARCHIVE_DIR = os.path.join(os.path.expanduser("~"), ".db400_tool", "archive")
+# 封存保留的天數，較舊的訊息在同步後刪除
+RETENTION_DAYS = 90
+# 兩次清理之間至少間隔的秒數
+PRUNE_INTERVAL = 3600
+# 本機查詢最多回傳的訊息數，與追蹤模式畫面保留的數量相同
+SEARCH_LIMIT = MAX_TAIL_ROWS
+
+# 封存的訊息來源：(顯示名稱, 來源)
+SOURCES = (("歷史日誌", "HISTORY_LOG"), ("QSYSOPR 消息", "QSYSOPR"))
+# 本機查詢的期間：(顯示名稱, 天數)，None 為封存中的全部訊息
+PERIODS = (("最近 1 天", 1), ("最近 7 天", 7), ("最近 30 天", 30), ("全部", None))
+ARCHIVE_COLUMNS = ["MESSAGE_TEXT", "MESSAGE_ID", "SEVERITY", "FROM_JOB", TIMESTAMP_COLUMN]
+# 時間一律以固定格式的文字存放，文字順序即時間順序
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+# 全文搜尋使用 trigram 分詞，可搜尋任意子字串（包含中文）；少於 3 個字時改為逐列比對
+_FTS_MIN_LENGTH = 3
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS MESSAGES (
+        ID INTEGER PRIMARY KEY, SOURCE TEXT NOT NULL, MESSAGE_TIMESTAMP TEXT NOT NULL,
+        MESSAGE_ID TEXT, SEVERITY INTEGER, FROM_JOB TEXT, MESSAGE_TEXT TEXT)""",
+    # 同一則訊息重複同步時忽略；同時用來找出各來源最後的訊息時間
+    """CREATE UNIQUE INDEX IF NOT EXISTS MESSAGES_ROW
+        ON MESSAGES (SOURCE, MESSAGE_TIMESTAMP, MESSAGE_ID, FROM_JOB, MESSAGE_TEXT)""",
+    # 清理超過保留天數的訊息用
+    "CREATE INDEX IF NOT EXISTS MESSAGES_TIMESTAMP ON MESSAGES (MESSAGE_TIMESTAMP)",
+    # 本機查詢一律指定來源
+    "CREATE INDEX IF NOT EXISTS MESSAGES_MESSAGE_ID ON MESSAGES (SOURCE, MESSAGE_ID, MESSAGE_TIMESTAMP)",
+    "CREATE INDEX IF NOT EXISTS MESSAGES_SEVERITY ON MESSAGES (SOURCE, SEVERITY, MESSAGE_TIMESTAMP)",
+    "CREATE INDEX IF NOT EXISTS MESSAGES_JOB ON MESSAGES (SOURCE, FROM_JOB, MESSAGE_TIMESTAMP)",
+)
+FTS_SCHEMA = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS MESSAGES_FTS
+        USING fts5(MESSAGE_TEXT, content='MESSAGES', content_rowid='ID', tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS MESSAGES_FTS_INSERT AFTER INSERT ON MESSAGES BEGIN
+        INSERT INTO MESSAGES_FTS (rowid, MESSAGE_TEXT) VALUES (new.ID, new.MESSAGE_TEXT);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS MESSAGES_FTS_DELETE AFTER DELETE ON MESSAGES BEGIN
+        INSERT INTO MESSAGES_FTS (MESSAGES_FTS, rowid, MESSAGE_TEXT) VALUES ('delete', old.ID, old.MESSAGE_TEXT);
+    END""",
+)
+
+
+def _timestamp_text(value):
+    if isinstance(value, datetime):
+        return value.strftime(_TIMESTAMP_FORMAT)
+    return str(value)
+
+
+def _severity(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _archive_file(directory, host):
+    return os.path.join(directory, re.sub(r"[^\w.-]", "_", host) + ".sqlite3")
+
+
+class MessageSearch:
+    """本機封存的查詢條件
+
+    last_id 為上次查詢時封存中最大的 ID；之後以相同條件查詢只回傳新封存的訊息。
+    elapsed 與 rows 記錄上次本機查詢的耗時（秒）與回傳筆數。
+    """
+
+    def __init__(self, host, source, text="", message_id="", severity=None, job="", days=1):
+        self.host = host
+        self.source = source
+        self.text = text.strip()
+        self.message_id = re.sub(r"[^\w@#$]", "", message_id.upper())
+        self.severity = severity
+        self.job = job.strip().upper()
+        self.days = days
+        self.last_id = None
+        self.elapsed = 0.0
+        self.rows = 0
+
+
+class MessageArchive:
+    """單一系統的本機訊息封存
+
+    監控畫面收集到的訊息寫入 SQLite，依時間、訊息 ID、嚴重性與作業建立索引，
+    訊息內容建立全文索引，查詢數週的訊息不必再讓伺服器掃描 HISTORY_LOG_INFO。
+    連線可在多個背景執行緒使用，以鎖保護；sync_lock 讓同一系統的同步依序進行。
+    """
+
+    def __init__(self, path, retention_days=RETENTION_DAYS):
+        self.path = path
+        self.retention_days = retention_days
+        self.sync_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pruned = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+            try:
+                for statement in FTS_SCHEMA:
+                    self._conn.execute(statement)
+                self.fts = True
+            except sqlite3.OperationalError:
+                # SQLite 沒有 FTS5 或 trigram 分詞時以 LIKE 搜尋
+                self.fts = False
+
+    def close(self):
+        with self._lock:
+            self._conn.execute("PRAGMA optimize")
+            self._conn.close()
+
+    def last_timestamp(self, source):
+        """來源最後封存的訊息時間（文字），沒有封存時回傳 None"""
+        with self._lock:
+            return self._conn.execute("SELECT MAX(MESSAGE_TIMESTAMP) FROM MESSAGES WHERE SOURCE = ?",
+                                      (source,)).fetchone()[0]
+
+    def add(self, source, data):
+        """寫入 MessageTail 取得的訊息，已封存的訊息略過，回傳新增的筆數"""
+        columns = [data.column(column) for column in ARCHIVE_COLUMNS]
+        rows = [(source, _timestamp_text(timestamp), message_id, _severity(severity), job, text)
+                for text, message_id, severity, job, timestamp in zip(*columns) if timestamp is not None]
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            # rowcount 不含觸發程序寫入全文索引的筆數
+            return self._conn.executemany(
+                "INSERT OR IGNORE INTO MESSAGES (SOURCE, MESSAGE_TIMESTAMP, MESSAGE_ID, SEVERITY, FROM_JOB, MESSAGE_TEXT)"
+                " VALUES (?, ?, ?, ?, ?, ?)", rows).rowcount
+
+    def prune(self, now=None):
+        """刪除超過保留天數的訊息，回傳刪除的筆數"""
+        now = datetime.now() if now is None else now
+        cutoff = (now - timedelta(days=self.retention_days)).strftime(_TIMESTAMP_FORMAT)
+        with self._lock, self._conn:
+            deleted = self._conn.execute("DELETE FROM MESSAGES WHERE MESSAGE_TIMESTAMP < ?", (cutoff,)).rowcount
+        with self._lock:
+            # 依資料分布更新索引統計，查詢計畫才會選到合適的索引
+            self._conn.execute("PRAGMA optimize")
+        self._pruned = time.monotonic()
+        return deleted
+
+    def prune_if_due(self):
+        if self._pruned is None or time.monotonic() - self._pruned >= PRUNE_INTERVAL:
+            return self.prune()
+        return 0
+
+    def search(self, search, limit=SEARCH_LIMIT):
+        """依條件查詢封存，回傳依時間遞增存放的 ResultSet（最多最新的 limit 筆）
+
+        search.last_id 不為 None 時只回傳之後新封存的訊息，並更新 last_id。
+        """
+        start = time.perf_counter()
+        conditions = ["SOURCE = ?"]
+        params = [search.source]
+        if search.days:
+            conditions.append("MESSAGE_TIMESTAMP >= ?")
+            params.append((datetime.now() - timedelta(days=search.days)).strftime(_TIMESTAMP_FORMAT))
+        if len(search.message_id) == 7:
+            # 完整的訊息 ID 直接依索引的時間順序取出最新的訊息，不必排序
+            conditions.append("MESSAGE_ID = ?")
+            params.append(search.message_id)
+        elif search.message_id:
+            # 訊息 ID 可只輸入開頭（例如 CPF），GLOB 前綴比對可使用索引
+            conditions.append("MESSAGE_ID GLOB ?")
+            params.append(search.message_id + "*")
+        if search.severity:
+            conditions.append("SEVERITY >= ?")
+            params.append(search.severity)
+        if search.job:
+            if search.job.count("/") == 2:
+                conditions.append("FROM_JOB = ?")
+                params.append(search.job)
+            else:
+                conditions.append("instr(FROM_JOB, ?) > 0")
+                params.append(search.job)
+        if search.text:
+            if self.fts and len(search.text) >= _FTS_MIN_LENGTH:
+                conditions.append("ID IN (SELECT rowid FROM MESSAGES_FTS WHERE MESSAGES_FTS MATCH ?)")
+                params.append('"' + search.text.replace('"', '""') + '"')
+            else:
+                conditions.append("instr(lower(MESSAGE_TEXT), lower(?)) > 0")
+                params.append(search.text)
+        if search.last_id is not None:
+            conditions.append("ID > ?")
+            params.append(search.last_id)
+        sql = (f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM MESSAGES WHERE {' AND '.join(conditions)}"
+               " ORDER BY MESSAGE_TIMESTAMP DESC LIMIT ?")
+        with self._lock:
+            last_id = self._conn.execute("SELECT MAX(ID) FROM MESSAGES").fetchone()[0]
+            rows = self._conn.execute(sql, params + [limit]).fetchall()
+        rows.reverse()
+        search.last_id = last_id or 0
+        search.elapsed = time.perf_counter() - start
+        search.rows = len(rows)
+        return ResultSet.from_rows(ARCHIVE_COLUMNS, rows)
+
+
+class MessageArchives:
+    """各系統的 MessageArchive，第一次使用時才建立或開啟檔案"""
+
+    def __init__(self, directory=None, retention_days=RETENTION_DAYS):
+        self.directory = directory or ARCHIVE_DIR
+        self.retention_days = retention_days
+        self._archives = {}
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        with self._lock:
+            archive = self._archives.get(host)
+            if archive is None:
+                os.makedirs(self.directory, exist_ok=True)
+                archive = MessageArchive(_archive_file(self.directory, host), self.retention_days)
+                self._archives[host] = archive
+            return archive
+
+    def close(self):
+        with self._lock:
+            for archive in self._archives.values():
+                archive.close()
+            self._archives.clear()
+
+
+def fetch_and_archive(connector, archives, host, tail, source, name="MessageArchive"):
+    """在背景執行緒以 tail 查詢新的訊息並寫入封存，回傳值與 MessageTail.fetch 相同
+
+    封存失敗時只印出錯誤，不影響畫面顯示。
+    """
+    try:
+        archive = archives.get(host)
+    except (OSError, sqlite3.Error) as e:
+        print(f"開啟訊息封存失敗: {e}")
+        return tail.fetch(connector, host, name)
+    with archive.sync_lock:
+        result, error = tail.fetch(connector, host, name)
+        if error:
+            return None, error
+        try:
+            archive.add(source, result[1])
+            archive.prune_if_due()
+        except sqlite3.Error as e:
+            print(f"寫入訊息封存失敗: {e}")
+    return result, None
+
+
+def sync_and_search(connector, archives, tail, search, name="MessageArchive"):
+    """在背景執行緒將伺服器上新的訊息同步到封存，再於本機查詢
+
+    tail 沒有位置時（例如程式重新啟動）從封存中最後的訊息時間開始同步，伺服器只回傳差異。
+    回傳 ((欄位, ResultSet, 是否為增量, 查詢記錄), 錯誤)，與 MessageTail.fetch 相同；本機查詢沒有查詢記錄。
+    """
+    host = search.host
+    try:
+        archive = archives.get(host)
+        with archive.sync_lock:
+            if tail.position(host) is None:
+                last = archive.last_timestamp(search.source)
+                if last is not None:
+                    tail.seek(host, last)
+            result, error = tail.fetch(connector, host, name)
+            if error:
+                return None, error
+            archive.add(search.source, result[1])
+            archive.prune_if_due()
+        incremental = search.last_id is not None
+        return (ARCHIVE_COLUMNS, archive.search(search), incremental, None), None
+    except (OSError, sqlite3.Error) as e:
+        return None, f"訊息封存錯誤: {e}"
@@ -0,0 +1,82 @@
+from columnar import ResultSet
+
+# 追蹤模式下畫面最多保留的訊息數；超過一成時捨棄最舊的訊息
+MAX_TAIL_ROWS = 5000
+TIMESTAMP_COLUMN = "MESSAGE_TIMESTAMP"
+
+
+def _take(data, indexes):
+    """依列號取出部分列組成新的 ResultSet，保留查詢記錄"""
+    taken = ResultSet(data.columns, data.types)
+    taken.record = data.record
+    if indexes:
+        taken.append_batch(data.batch().take(indexes))
+    return taken
+
+
+def keep_latest(data, limit=MAX_TAIL_ROWS):
+    """訊息（依時間遞增存放）超過 limit 的一成以上時，回傳只含最新 limit 筆的新結果，否則回傳 None"""
+    if len(data) <= limit * 1.1:
+        return None
+    return _take(data, list(range(len(data) - limit, len(data))))
+
+
+class MessageTail:
+    """記住每個系統最後看到的訊息時間，之後只查詢更新的訊息
+
+    query 為第一次（或重新）載入時的 SQL；tail_query 以一個 ? 綁定開始時間（含），
+    只回傳該時間之後的訊息。兩者的欄位必須相同且包含 MESSAGE_TIMESTAMP。
+    回傳的結果一律依時間遞增存放，方便附加與捨棄最舊的訊息。
+    開始時間相同的訊息可能在兩次查詢中都出現，以整列內容去除重複。
+    """
+
+    def __init__(self, query, tail_query):
+        self.query = query
+        self.tail_query = tail_query
+        self._positions = {}  # 系統 -> (最後的訊息時間, 該時間已看過的列)
+
+    def reset(self, host):
+        """下次 fetch 時重新完整載入"""
+        self._positions.pop(host, None)
+
+    def seek(self, host, timestamp):
+        """下次 fetch 從 timestamp（含）開始增量查詢，例如從本機封存最後的訊息接續"""
+        self._positions[host] = (timestamp, set())
+
+    def position(self, host):
+        position = self._positions.get(host)
+        return position[0] if position else None
+
+    def fetch(self, connector, host, source="MessageTail"):
+        """在背景執行緒查詢，回傳 ((欄位, ResultSet, 是否為增量, 查詢記錄), 錯誤)"""
+        position = self._positions.get(host)
+        if position is None:
+            result, error = connector.execute_query(self.query, host, source=source)
+        else:
+            result, error = connector.execute_query(self.tail_query, host, (position[0],), source)
+        if error:
+            return None, error
+        columns, data = result
+        record = getattr(result, "record", None)
+        timestamps = data.column(TIMESTAMP_COLUMN)
+        if position is None:
+            order = sorted(range(len(data)), key=timestamps.__getitem__)
+        else:
+            last, seen = position
+            order = [row for row, timestamp in enumerate(timestamps)
+                     if timestamp != last or data.row(row) not in seen]
+            order.sort(key=timestamps.__getitem__)
+        if order != list(range(len(data))):
+            data = _take(data, order)
+            timestamps = data.column(TIMESTAMP_COLUMN)
+        if len(data):
+            last = timestamps[-1]
+            seen = set()
+            row = len(data) - 1
+            while row >= 0 and timestamps[row] == last:
+                seen.add(data.row(row))
+                row -= 1
+            if position is not None and position[0] == last:
+                seen |= position[1]
+            self._positions[host] = (last, seen)
+        return (columns, data, position is not None, record), None
@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# 環形緩衝保留的查詢記錄數
+METRICS_CAPACITY = 1000
+# 超過此秒數的查詢會列在慢查詢面板
+SLOW_QUERY_SECONDS = 1.0
+# Prometheus 文字檔最短的寫入間隔秒數
+PROMETHEUS_WRITE_INTERVAL = 15
+# 查詢總耗時直方圖的區間（秒）
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+PHASES = ("prepare", "execute", "fetch", "convert", "render")
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def fingerprint_sql(sql):
+    """將字串與數值常數換成 ?，回傳 (指紋, 正規化語句)"""
+    statement = _LITERAL_RE.sub("?", re.sub(r"\s+", " ", sql).strip()).upper()
+    return hashlib.sha1(statement.encode("utf-8")).hexdigest()[:12], statement
+
+
+class QueryRecord:
+    """單一查詢的耗時記錄
+
+    各階段時間以 lap() 累計：從上一次 lap 到現在的時間計入指定階段。
+    render 等查詢結束後的時間由顯示端以 add_time() 補上。
+    """
+
+    __slots__ = ("timestamp", "host", "source", "fingerprint", "statement", "prepare", "execute", "fetch",
+                 "convert", "render", "rows", "bytes", "error", "cached", "_last", "_metrics")
+
+    def __init__(self, host, source, sql, statement=None, metrics=None):
+        self._metrics = metrics
+        self.timestamp = time.time()
+        self.host = host
+        self.source = source
+        self.fingerprint, self.statement = fingerprint_sql(sql)
+        if statement is not None:
+            self.statement = statement
+        self.prepare = self.execute = self.fetch = self.convert = self.render = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.error = None
+        self.cached = False
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        setattr(self, phase, getattr(self, phase) + now - self._last)
+        self._last = now
+
+    def lap_execute(self, prepare_time=0.0):
+        """計入 execute 階段，其中 PreparedStatement 準備的時間改計入 prepare"""
+        self.lap("execute")
+        self.execute -= prepare_time
+        self.prepare += prepare_time
+
+    def add_time(self, phase, seconds):
+        if self._metrics is not None:
+            self._metrics.add_time(self, phase, seconds)
+        else:
+            setattr(self, phase, getattr(self, phase) + seconds)
+
+    def skip(self):
+        """略過從上一次 lap 到現在的時間（例如等待使用者或其他批次）"""
+        self._last = time.perf_counter()
+
+    @property
+    def total(self):
+        return self.prepare + self.execute + self.fetch + self.convert + self.render
+
+
+class _Aggregate:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.bytes = 0
+        self.duration_sum = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.phases = dict.fromkeys(PHASES, 0.0)
+
+
+class QueryMetrics:
+    """查詢記錄的環形緩衝，並依 (系統, 來源) 彙總供 Prometheus 文字檔輸出
+
+    prometheus_path 為 None 時不輸出檔案。指紋只存在記錄中，
+    不作為 Prometheus 標籤，以免標籤數量無限增長。
+    """
+
+    def __init__(self, capacity=METRICS_CAPACITY, prometheus_path=None,
+                 write_interval=PROMETHEUS_WRITE_INTERVAL):
+        self._records = deque(maxlen=capacity)
+        self._aggregates = {}
+        self._lock = threading.Lock()
+        self.prometheus_path = prometheus_path
+        self.write_interval = write_interval
+        self._last_write = 0.0
+        # finish() 由多個背景執行緒呼叫，寫檔時持有，同一時間只有一個執行緒使用暫存檔
+        self._write_lock = threading.Lock()
+
+    def start(self, host, source, sql, statement=None):
+        return QueryRecord(host, source, sql, statement, self)
+
+    def finish(self, record, rows=0, nbytes=0, error=None):
+        record.rows = rows
+        record.bytes = nbytes
+        record.error = error
+        with self._lock:
+            self._records.append(record)
+            aggregate = self._aggregates.get((record.host, record.source))
+            if aggregate is None:
+                aggregate = self._aggregates[(record.host, record.source)] = _Aggregate()
+            aggregate.count += 1
+            aggregate.errors += error is not None
+            aggregate.rows += rows
+            aggregate.bytes += nbytes
+            total = record.total
+            aggregate.duration_sum += total
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if total <= bound:
+                    aggregate.buckets[i] += 1
+            for phase in PHASES:
+                aggregate.phases[phase] += getattr(record, phase)
+        self.maybe_write()
+        return record
+
+    def add_time(self, record, phase, seconds):
+        """補上查詢結束後才發生的時間，例如顯示端的轉換與繪製"""
+        if record is None:
+            return
+        with self._lock:
+            setattr(record, phase, getattr(record, phase) + seconds)
+            aggregate = self._aggregates.get((record.host, record.source))
+            if aggregate is not None:
+                aggregate.phases[phase] += seconds
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+    def slow_queries(self, threshold=SLOW_QUERY_SECONDS, limit=100):
+        """回傳總耗時超過門檻的記錄，由慢到快排序"""
+        slow = [record for record in self.records() if record.total >= threshold or record.error]
+        slow.sort(key=lambda record: record.total, reverse=True)
+        return slow[:limit]
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def maybe_write(self):
+        if not self.prometheus_path:
+            return
+        # 其他執行緒正在寫檔時略過，不讓查詢等待
+        if not self._write_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self._last_write >= self.write_interval:
+                self._write(self.prometheus_path)
+        finally:
+            self._write_lock.release()
+
+    def write_prometheus(self, path=None):
+        """以 Prometheus 文字格式寫出彙總值，先寫暫存檔再替換，避免收集器讀到一半的檔案"""
+        path = path or self.prometheus_path
+        if not path:
+            return
+        with self._write_lock:
+            self._write(path)
+
+    def _write(self, path):
+        self._last_write = time.monotonic()
+        try:
+            text = self.prometheus_text()
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning("寫入 Prometheus 指標檔失敗: %s", e)
+
+    def prometheus_text(self):
+        with self._lock:
+            aggregates = sorted(self._aggregates.items())
+            lines = [
+                "# HELP db400_query_duration_seconds Query duration measured when the query finishes.",
+                "# TYPE db400_query_duration_seconds histogram",
+            ]
+            for (host, source), aggregate in aggregates:
+                labels = f'host="{_escape_label(host)}",source="{_escape_label(source)}"'
+                for bound, count in zip(DURATION_BUCKETS, aggregate.buckets):
+                    lines.append(f'db400_query_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'db400_query_duration_seconds_bucket{{{labels},le="+Inf"}} {aggregate.count}')
+                lines.append(f"db400_query_duration_seconds_sum{{{labels}}} {aggregate.duration_sum:.6f}")
+                lines.append(f"db400_query_duration_seconds_count{{{labels}}} {aggregate.count}")
+            lines += ["# HELP db400_query_phase_seconds_total Time spent per query phase.",
+                      "# TYPE db400_query_phase_seconds_total counter"]
+            for (host, source), aggregate in aggregates:
+                labels = f'host="{_escape_label(host)}",source="{_escape_label(source)}"'
+                for phase in PHASES:
+                    lines.append(f'db400_query_phase_seconds_total{{{labels},phase="{phase}"}} '
+                                 f"{aggregate.phases[phase]:.6f}")
+            for name, attribute, help_text in (
+                    ("db400_query_rows_total", "rows", "Rows returned by queries."),
+                    ("db400_query_bytes_total", "bytes", "Approximate bytes held by query results."),
+                    ("db400_query_errors_total", "errors", "Queries that failed.")):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for (host, source), aggregate in aggregates:
+                    labels = f'host="{_escape_label(host)}",source="{_escape_label(source)}"'
+                    lines.append(f"{name}{{{labels}}} {getattr(aggregate, attribute)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,125 @@
+import itertools
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal, Slot
+from as400_connector import CancelToken
+
+# 單一背景查詢的預設逾時秒數
+DEFAULT_QUERY_TIMEOUT = 120
+# 使用者主動取消時 on_error 收到的訊息；逾時另有訊息，仍視為失敗
+CANCELLED_MESSAGE = "查詢已取消"
+
+
+class QueryWorkerSignals(QObject):
+    result = Signal(int, object)
+    error = Signal(int, str)
+    progress = Signal(int, object)
+
+
+class QueryWorker(QRunnable):
+    """在 QThreadPool 中執行一個查詢函數"""
+
+    def __init__(self, worker_id, fn, args, kwargs, timeout=DEFAULT_QUERY_TIMEOUT):
+        super().__init__()
+        self.worker_id = worker_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.token = CancelToken(timeout)
+        self.signals = QueryWorkerSignals()
+
+    def report_progress(self, value):
+        """可在背景執行緒呼叫，value 會以 on_progress 在 GUI 執行緒回呼"""
+        self.signals.progress.emit(self.worker_id, value)
+
+    def cancel(self):
+        self.token.cancel()
+
+    def _cancel_message(self):
+        if self.token.timed_out:
+            return f"查詢超過 {self.token.timeout} 秒已自動取消"
+        return CANCELLED_MESSAGE
+
+    def run(self):
+        try:
+            with self.token.activate():
+                result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            message = self._cancel_message() if self.token.cancelled else str(e)
+            self.signals.error.emit(self.worker_id, message)
+            return
+        if self.token.cancelled:
+            self.signals.error.emit(self.worker_id, self._cancel_message())
+        else:
+            self.signals.result.emit(self.worker_id, result)
+
+
+class BackgroundQueryRunner(QObject):
+    """在背景執行緒執行 JDBC 呼叫，並在 GUI 執行緒回呼結果
+
+    回呼函數一律在 GUI 執行緒執行，可以直接操作介面元件。
+    """
+
+    busy_changed = Signal(bool)
+
+    def __init__(self, parent=None, thread_pool=None):
+        super().__init__(parent)
+        self.thread_pool = thread_pool or QThreadPool.globalInstance()
+        self._ids = itertools.count(1)
+        self._workers = {}
+
+    def submit(self, fn, *args, on_result=None, on_error=None, on_progress=None,
+               timeout=DEFAULT_QUERY_TIMEOUT, **kwargs):
+        """排入背景執行，回傳可用於 cancel() 的工作編號
+
+        指定 on_progress 時，fn 會多收到 progress 參數，呼叫 progress(value) 即回報進度。
+        """
+        worker_id = next(self._ids)
+        worker = QueryWorker(worker_id, fn, args, kwargs, timeout)
+        worker.signals.result.connect(self._on_result)
+        worker.signals.error.connect(self._on_error)
+        if on_progress is not None:
+            kwargs["progress"] = worker.report_progress
+            worker.signals.progress.connect(self._on_progress)
+        self._workers[worker_id] = (worker, on_result, on_error, on_progress)
+        if len(self._workers) == 1:
+            self.busy_changed.emit(True)
+        self.thread_pool.start(worker)
+        return worker_id
+
+    def is_running(self, worker_id):
+        return worker_id in self._workers
+
+    def is_busy(self):
+        return bool(self._workers)
+
+    def cancel(self, worker_id):
+        entry = self._workers.get(worker_id)
+        if entry:
+            entry[0].cancel()
+
+    def cancel_all(self):
+        for worker, *_ in list(self._workers.values()):
+            worker.cancel()
+
+    def _finish(self, worker_id):
+        entry = self._workers.pop(worker_id, None)
+        if entry and not self._workers:
+            self.busy_changed.emit(False)
+        return entry
+
+    @Slot(int, object)
+    def _on_result(self, worker_id, result):
+        entry = self._finish(worker_id)
+        if entry and entry[1]:
+            entry[1](result)
+
+    @Slot(int, object)
+    def _on_progress(self, worker_id, value):
+        entry = self._workers.get(worker_id)
+        if entry and entry[3]:
+            entry[3](value)
+
+    @Slot(int, str)
+    def _on_error(self, worker_id, message):
+        entry = self._finish(worker_id)
+        if entry and entry[2]:
+            entry[2](message)
@@ -0,0 +1,155 @@
+import time
+from PySide6.QtCore import QObject, QTimer
+
+# 檢查到期刷新的間隔（毫秒）；隱藏的畫面重新顯示後最多這麼久就會刷新
+TICK_INTERVAL_MS = 1000
+# 刷新間隔至少是上次刷新耗時的這個倍數：查詢花 3 秒時至少隔 30 秒才再查
+SLOW_FACTOR = 10
+# 連續失敗時間隔加倍，但不超過這個秒數（登記的間隔更長時以登記的為準）
+MAX_BACKOFF_SECONDS = 600
+
+# 各畫面顯示時的刷新間隔（秒）
+JOB_REFRESH_INTERVAL = 30
+USER_REFRESH_INTERVAL = 300
+QSYSOPR_REFRESH_INTERVAL = 60
+HISTORY_LOG_REFRESH_INTERVAL = 300
+JOB_RESOURCE_SAMPLE_INTERVAL = 10
+# 訊息「即時追蹤」時的輪詢間隔（秒）
+FOLLOW_REFRESH_INTERVAL = 5
+
+
+class _Subscription:
+    __slots__ = ("name", "interval", "refresh", "view", "active", "due", "running", "duration", "failures")
+
+    def __init__(self, name, interval, refresh, view, active):
+        self.name = name
+        self.interval = interval
+        self.refresh = refresh
+        self.view = view
+        self.active = active
+        # 剛登記時立即到期，畫面第一次顯示就會刷新
+        self.due = 0.0
+        self.running = False
+        self.duration = 0.0
+        self.failures = 0
+
+
+class RefreshScheduler(QObject):
+    """所有定期刷新的中央排程，由主視窗建立並由各系統、各畫面共用
+
+    各畫面以 add() 登記刷新函式與所屬的檢視：只有檢視可見且 active() 為真時才會到期刷新，
+    隱藏的畫面不查詢，重新顯示時若已過期則在下一次檢查時刷新。
+    刷新函式以 submit() 送出查詢：相同 key（系統, 查詢）已在執行時不再送出，
+    改為等待同一次結果。間隔依上次刷新的耗時與連續失敗次數拉長，伺服器變慢時自動降低頻率。
+    """
+
+    def __init__(self, parent=None, tick_interval=TICK_INTERVAL_MS):
+        super().__init__(parent)
+        self._subscriptions = {}
+        # key -> [工作編號, [(on_result, on_error, 登記)]]
+        self._inflight = {}
+        self._current = None
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.tick)
+        self.timer.start(tick_interval)
+
+    def add(self, name, interval, refresh, view=None, active=None):
+        """登記定期刷新，interval 為秒數；同名的登記會被取代
+
+        refresh 不帶參數，應以 submit() 送出查詢；view 為顯示結果的元件，
+        active 為額外的條件（例如是否已連接）。
+        """
+        self._subscriptions[name] = _Subscription(name, interval, refresh, view, active)
+
+    def remove(self, name):
+        self._subscriptions.pop(name, None)
+
+    def stop(self):
+        self.timer.stop()
+        self._subscriptions.clear()
+
+    def refresh_now(self, name, refresh=None):
+        """立即刷新登記的項目（例如切換到該畫面時），並從現在重新計算下次到期時間
+
+        refresh 可取代登記的刷新函式（例如錯誤改以對話框顯示的版本）；查詢仍計入該登記，
+        下一次檢查不會緊接著再查一次。查詢正在執行時等待該次結果，不另外送出。
+        """
+        subscription = self._subscriptions.get(name)
+        if subscription is None:
+            if refresh is not None:
+                refresh()
+            return
+        if not subscription.running:
+            self._run(subscription, time.monotonic(), refresh)
+
+    def interval(self, name):
+        """目前實際使用的刷新間隔（秒）"""
+        return self._interval(self._subscriptions[name])
+
+    def _interval(self, subscription):
+        interval = max(subscription.interval, subscription.duration * SLOW_FACTOR)
+        if subscription.failures:
+            limit = max(MAX_BACKOFF_SECONDS, subscription.interval)
+            interval = min(interval * 2 ** min(subscription.failures, 10), limit)
+        return interval
+
+    def _is_active(self, subscription):
+        view = subscription.view
+        if view is not None and (not view.isVisible() or view.window().isMinimized()):
+            return False
+        return subscription.active is None or subscription.active()
+
+    def tick(self):
+        now = time.monotonic()
+        for subscription in list(self._subscriptions.values()):
+            if subscription.running or now < subscription.due or not self._is_active(subscription):
+                continue
+            self._run(subscription, now)
+
+    def _run(self, subscription, now, refresh=None):
+        # 刷新函式沒有送出查詢（例如畫面正忙）時照原本的間隔再試
+        subscription.due = now + self._interval(subscription)
+        self._current = subscription
+        try:
+            (refresh or subscription.refresh)()
+        finally:
+            self._current = None
+
+    def submit(self, key, runner, fn, *args, on_result=None, on_error=None):
+        """以 runner 在背景執行 fn；相同 key 的查詢正在執行時合併為一次，回傳工作編號
+
+        合併時所有呼叫者收到同一個結果物件，需要修改時應先複製。
+        在排程的刷新中呼叫時，查詢耗時與成敗會用來調整該登記的間隔。
+        """
+        subscription = self._current
+        if subscription is not None:
+            subscription.running = True
+        entry = self._inflight.get(key)
+        if entry is not None:
+            entry[1].append((on_result, on_error, subscription))
+            return entry[0]
+        entry = self._inflight[key] = [None, [(on_result, on_error, subscription)]]
+        started = time.monotonic()
+        entry[0] = runner.submit(fn, *args,
+                                 on_result=lambda result: self._finish(key, started, result, None),
+                                 on_error=lambda error: self._finish(key, started, None, error))
+        return entry[0]
+
+    def is_running(self, key):
+        return key in self._inflight
+
+    def _finish(self, key, started, result, error):
+        _, waiters = self._inflight.pop(key, (None, ()))
+        now = time.monotonic()
+        for _, _, subscription in waiters:
+            if subscription is not None:
+                subscription.running = False
+                subscription.duration = now - started
+                subscription.failures = subscription.failures + 1 if error is not None else 0
+                subscription.due = now + self._interval(subscription)
+        for on_result, on_error, _ in waiters:
+            if error is None:
+                if on_result is not None:
+                    on_result(result)
+            elif on_error is not None:
+                on_error(error)
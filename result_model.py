@@ -0,0 +1,592 @@
+import fnmatch
+import re
+from bisect import bisect_left
+from collections import OrderedDict
+from itertools import compress
+from operator import ne, or_
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt, QTimer, Signal
+from PySide6.QtGui import QColor
+from PySide6.QtWidgets import QAbstractItemView, QHeaderView, QMenu, QTableView
+from columnar import ResultSet
+
+# 儲存格文字超過這個長度時以提示顯示完整內容
+TOOLTIP_MIN_LENGTH = 60
+# 篩選輸入停止這麼多毫秒後才重新篩選
+FILTER_DEBOUNCE_MS = 200
+# 自動欄寬最多抽樣的列數
+AUTO_SIZE_SAMPLE_ROWS = 200
+# 自動欄寬的上限（像素），過長的內容以提示顯示
+MAX_AUTO_COLUMN_WIDTH = 480
+# 增量刷新後新增與變更的列標示多久（毫秒）
+HIGHLIGHT_MS = 3000
+HIGHLIGHT_COLOR = QColor("#FFF3BF")
+# 變更的列超過這個數量時改為通知整個範圍
+HIGHLIGHT_ROW_SIGNALS = 200
+# 已結束的列超過這個數量且多於仍存在的列時重建 ResultSet
+COMPACT_MIN_DEAD_ROWS = 5000
+# 文字兩側的留白與標題排序箭頭的空間（像素）
+CELL_PADDING = 14
+HEADER_PADDING = 28
+
+# 欄寬快取最多保留的欄數，超過時淘汰最久未使用的
+COLUMN_WIDTH_CACHE_SIZE = 2000
+
+# (查詢指紋或欄位組合, 欄位名稱) -> 欄寬；同一查詢再次顯示時直接沿用
+_column_widths = OrderedDict()
+
+
+def _cached_width(key):
+    width = _column_widths.get(key)
+    if width is not None:
+        _column_widths.move_to_end(key)
+    return width
+
+
+def _cache_width(key, width):
+    _column_widths[key] = width
+    _column_widths.move_to_end(key)
+    while len(_column_widths) > COLUMN_WIDTH_CACHE_SIZE:
+        _column_widths.popitem(last=False)
+
+
+def sample_rows(count, limit=AUTO_SIZE_SAMPLE_ROWS):
+    """在 0..count-1 中平均取最多 limit 個列號，包含最後一列"""
+    if count <= limit:
+        return range(count)
+    step = (count - 1) / (limit - 1)
+    return [round(i * step) for i in range(limit)]
+
+
+def compile_filter(text, full_match=False):
+    """將篩選文字編譯成判斷小寫字串的函式，空白時回傳 None
+
+    以 re: 開頭為正規表示式；逗號分隔的多個條件符合任一個即可；
+    含 * 或 ? 為萬用字元；其餘為包含比對。
+    full_match 為 True 時一律以萬用字元比對整個字串（沒有萬用字元就是完全相符）。
+    """
+    text = text.strip()
+    if not text:
+        return None
+    if text.startswith("re:"):
+        try:
+            return re.compile(text[3:], re.IGNORECASE).search
+        except re.error:
+            return re.compile(re.escape(text[3:].lower())).search
+    patterns = []
+    for part in text.lower().split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if full_match or "*" in part or "?" in part:
+            pattern = fnmatch.translate(part)
+            # 部分比對時去掉結尾錨點，任何位置符合即可
+            patterns.append(pattern if full_match else pattern.replace(r"\Z", ""))
+        else:
+            patterns.append(re.escape(part))
+    if not patterns:
+        return None
+    pattern = re.compile(patterns[0] if len(patterns) == 1 else "|".join(f"(?:{p})" for p in patterns))
+    return pattern.match if full_match else pattern.search
+
+
+def debounce_timer(parent, slot, msec=FILTER_DEBOUNCE_MS):
+    """建立單次計時器：連續輸入時只在停止輸入後呼叫一次 slot"""
+    timer = QTimer(parent)
+    timer.setSingleShot(True)
+    timer.setInterval(msec)
+    timer.timeout.connect(slot)
+    return timer
+
+
+class ResultTableModel(QAbstractTableModel):
+    """直接以 ResultSet 為資料來源的表格模型
+
+    只有畫面上可見的儲存格才會呼叫 data() 取得顯示字串，
+    不需要為每一格建立 QTableWidgetItem。extra_columns 為附加在最後、
+    沒有資料的欄位（例如放置按鈕的「操作」欄）。
+
+    結果還沒讀完時呼叫 set_more_available(True)，表格捲到底時 Qt 會呼叫
+    fetchMore()，模型發出 fetch_more_requested 由擁有者在背景讀取下一批。
+
+    set_filters()/sort() 不隱藏列，而是改變畫面列到資料列的對應 (rows)，
+    row_values()/display() 等方法接受的都是畫面上的列號。
+    欄位相同的新結果（例如定時刷新）會沿用目前的篩選與排序；
+    apply_delta() 只套用前後兩次結果的差異，結束的列記在 dead 中不再顯示。
+    """
+
+    fetch_more_requested = Signal()
+
+    def __init__(self, parent=None, extra_columns=()):
+        super().__init__(parent)
+        self.columns = []
+        self.result = ResultSet([])
+        self.extra_columns = list(extra_columns)
+        self.more_available = False
+        self._fetch_pending = False
+        self.rows = None
+        self.filters = []
+        self.sort_column = -1
+        self.sort_order = Qt.SortOrder.AscendingOrder
+        # 增量刷新：已結束（不再顯示）的資料列、鍵值到資料列的索引、暫時標示的資料列
+        self.dead = set()
+        self._key_col = None
+        self._key_index = None
+        self.highlighted = set()
+        # set_result 收到的結果可能與其他畫面共用（查詢合併、快取），第一次修改前先複製
+        self._owns_result = True
+        self._highlight_timer = QTimer(self)
+        self._highlight_timer.setSingleShot(True)
+        self._highlight_timer.setInterval(HIGHLIGHT_MS)
+        self._highlight_timer.timeout.connect(self.clear_highlight)
+
+    def set_result(self, columns, data):
+        """以新的查詢結果取代目前內容；data 可為 ResultSet 或列的列表"""
+        if not isinstance(data, ResultSet):
+            data = ResultSet.from_rows(columns, data)
+        self.beginResetModel()
+        if list(columns) != self.columns:
+            self.filters = []
+            self.sort_column = -1
+        self.columns = list(columns)
+        self.result = data
+        self._owns_result = False
+        self.more_available = False
+        self._fetch_pending = False
+        self.dead = set()
+        self._key_index = None
+        self.highlighted = set()
+        self.rows = self._mapped_rows()
+        self.endResetModel()
+
+    def clear(self):
+        self.set_result([], ResultSet([]))
+
+    def append_batch(self, batch):
+        """將一批 ColumnBatch 附加到結果最後"""
+        self._fetch_pending = False
+        if batch is None or not len(batch):
+            return
+        start = len(self.result)
+        if self.rows is not None:
+            self.result.append_batch(batch)
+            self._insert_view_rows(self._filtered_rows(range(start, len(self.result))))
+            return
+        self.beginInsertRows(QModelIndex(), start, start + len(batch) - 1)
+        self.result.append_batch(batch)
+        self.endInsertRows()
+
+    def _filtered_rows(self, rows=None):
+        for col, predicate in self.filters:
+            rows = self.result.match_rows(col, predicate, rows)
+        return rows
+
+    def _mapped_rows(self):
+        """依目前的篩選、排序與已結束的列算出畫面列的對應；皆無時回傳 None"""
+        if not self.filters and self.sort_column < 0 and not self.dead:
+            return None
+        rows = None
+        if self.dead:
+            rows = [row for row in range(len(self.result)) if row not in self.dead]
+        rows = self._filtered_rows(rows)
+        if 0 <= self.sort_column < len(self.columns):
+            rows = self.result.sort_rows(self.sort_column, rows,
+                                         self.sort_order == Qt.SortOrder.DescendingOrder)
+        return list(range(len(self.result))) if rows is None else rows
+
+    def _relayout(self, rows):
+        """以新的列對應重新排列畫面，選取等持久索引跟著資料列移動"""
+        self.layoutAboutToBeChanged.emit()
+        old_indexes = self.persistentIndexList()
+        old_rows = self.rows
+        self.rows = rows
+        if old_indexes:
+            positions = {source: row for row, source in enumerate(range(len(self.result)) if rows is None else rows)}
+            new_indexes = []
+            for index in old_indexes:
+                source = index.row() if old_rows is None else old_rows[index.row()]
+                row = positions.get(source)
+                new_indexes.append(QModelIndex() if row is None else self.index(row, index.column()))
+            self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+
+    def _resort(self):
+        if 0 <= self.sort_column < len(self.columns) and self.rows:
+            rows = self.result.sort_rows(self.sort_column, self.rows,
+                                         self.sort_order == Qt.SortOrder.DescendingOrder)
+            if rows != self.rows:
+                self._relayout(rows)
+
+    def _positions(self, sources):
+        """資料列在畫面上的位置（不在畫面上的略過）"""
+        rows = self.rows
+        if self.sort_column < 0:
+            # 未排序時 rows 依資料列遞增，可二分搜尋
+            positions = []
+            for source in sources:
+                position = bisect_left(rows, source)
+                if position < len(rows) and rows[position] == source:
+                    positions.append(position)
+            return positions
+        lookup = {source: row for row, source in enumerate(rows)}
+        return [lookup[source] for source in sources if source in lookup]
+
+    def _remove_view_rows(self, sources):
+        positions = sorted(self._positions(sources))
+        end = len(positions)
+        while end:
+            # 由後往前，連續的位置一次移除
+            start = end - 1
+            while start and positions[start - 1] == positions[start] - 1:
+                start -= 1
+            first, last = positions[start], positions[end - 1]
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self.rows[first:last + 1]
+            self.endRemoveRows()
+            end = start
+
+    def _insert_view_rows(self, sources, resort=True):
+        sources = sorted(sources or ())
+        if not sources:
+            return
+        rows = self.rows
+        if self.sort_column < 0:
+            # 未排序時依資料列順序插入；比最後一列還後面的（一般新增的列）一次附加到最後
+            last = rows[-1] if rows else -1
+            middle = bisect_left(sources, last)
+            for source in sources[:middle]:
+                position = bisect_left(rows, source)
+                self.beginInsertRows(QModelIndex(), position, position)
+                rows.insert(position, source)
+                self.endInsertRows()
+            sources = sources[middle:]
+        if sources:
+            first = len(rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(sources) - 1)
+            rows += sources
+            self.endInsertRows()
+        if resort:
+            self._resort()
+
+    def apply_delta(self, data, key_col):
+        """與新的查詢結果比對，只套用新增、結束與變更的列
+
+        以 key_col 欄的值（例如 JOB_NAME）對照前後兩次結果，畫面的選取與捲動位置不受影響，
+        新增與變更的列會暫時標示。鍵值重複時無法比對，改為整批取代並回傳 None；
+        否則回傳 (新增, 結束, 變更) 的列數。
+        """
+        result = self.result
+        keys = data.column(key_col)
+        if len(set(keys)) != len(keys):
+            self.set_result(self.columns, data)
+            return None
+        if self._key_index is None or self._key_col != key_col:
+            self._key_col = key_col
+            self._key_index = {result.value(row, key_col): row for row in range(len(result))
+                               if row not in self.dead}
+        index = self._key_index
+
+        # 逐欄以 map 比較，避免為每一列組成 tuple
+        sources = list(map(index.get, keys))
+        present = [i for i, source in enumerate(sources) if source is not None]
+        old_sources = [sources[i] for i in present]
+        changed_mask = [False] * len(present)
+        for col in range(len(self.columns)):
+            old_values = list(map(result.column(col).__getitem__, old_sources))
+            new_values = data.column(col)
+            if len(present) != len(new_values):
+                new_values = list(map(new_values.__getitem__, present))
+            changed_mask = list(map(or_, changed_mask, map(ne, old_values, new_values)))
+        changed = [(old_sources[j], data.row(present[j])) for j in compress(range(len(present)), changed_mask)]
+        added = [data.row(i) for i, source in enumerate(sources) if source is None]
+        new_keys = set(keys)
+        ended = [source for key, source in index.items() if key not in new_keys]
+
+        self.clear_highlight()
+        if not self._owns_result:
+            result = self.result = result.copy()
+            self._owns_result = True
+        if ended:
+            if self.rows is None:
+                self.rows = list(range(len(result)))
+            self.dead.update(ended)
+            for source in ended:
+                del index[result.value(source, key_col)]
+            self._remove_view_rows(ended)
+
+        for source, row in changed:
+            result.set_row(source, row)
+        start = len(result)
+        if added:
+            if self.rows is None:
+                self.beginInsertRows(QModelIndex(), start, start + len(added) - 1)
+            result.append_rows(added)
+            if self.rows is None:
+                self.endInsertRows()
+            for offset, row in enumerate(added):
+                index[row[key_col]] = start + offset
+        changed_sources = [source for source, _ in changed]
+        new_sources = list(range(start, len(result)))
+        self.highlighted = set(changed_sources) | set(new_sources)
+
+        if self.rows is not None:
+            if self.filters:
+                # 變更可能讓列進入或離開篩選結果
+                passing = set(self._filtered_rows(changed_sources))
+                visible = set(self.rows)
+                self._remove_view_rows([source for source in changed_sources
+                                        if source in visible and source not in passing])
+                entering = [source for source in changed_sources if source not in visible and source in passing]
+            else:
+                entering = []
+            self._insert_view_rows(entering + list(self._filtered_rows(new_sources)), resort=False)
+            self._resort()
+        if changed_sources:
+            self._emit_rows_changed(changed_sources)
+        if self.highlighted:
+            self._highlight_timer.start()
+        if len(self.dead) > max(COMPACT_MIN_DEAD_ROWS, len(result) - len(self.dead)):
+            self._compact()
+        return len(added), len(ended), len(changed)
+
+    def _emit_rows_changed(self, sources):
+        last_column = self.columnCount() - 1
+        if self.rows is None:
+            positions = sources
+        else:
+            positions = self._positions(sources)
+        if len(positions) > HIGHLIGHT_ROW_SIGNALS:
+            # 變更太多時一次通知整個範圍，由表格只重繪可見的部分
+            self.dataChanged.emit(self.index(0, 0), self.index(self.rowCount() - 1, last_column))
+            return
+        for row in positions:
+            self.dataChanged.emit(self.index(row, 0), self.index(row, last_column))
+
+    def clear_highlight(self):
+        self._highlight_timer.stop()
+        if self.highlighted:
+            sources = self.highlighted
+            self.highlighted = set()
+            self._emit_rows_changed(sources)
+
+    def _compact(self):
+        """已結束的列太多時重建 ResultSet；畫面上的列與位置不變，不需要通知表格"""
+        result = self.result
+        live = [row for row in range(len(result)) if row not in self.dead]
+        mapping = {old: new for new, old in enumerate(live)}
+        compacted = ResultSet(self.columns, result.types)
+        compacted.record = result.record
+        batch = result.batch()
+        if batch is not None and live:
+            compacted.append_batch(batch.take(live))
+        self.result = compacted
+        self._owns_result = True
+        self.dead = set()
+        self.rows = [mapping[row] for row in self.rows]
+        if not self.filters and self.sort_column < 0:
+            self.rows = None
+        self.highlighted = {mapping[row] for row in self.highlighted if row in mapping}
+        self._key_index = None
+
+    def set_filters(self, filters):
+        """filters 為 (欄位索引, compile_filter 的結果) 的列表，所有條件都要符合；None 的條件略過"""
+        self.beginResetModel()
+        self.filters = [(col, predicate) for col, predicate in filters if predicate is not None]
+        self.rows = self._mapped_rows()
+        self.endResetModel()
+
+    def matching_rows(self, filters):
+        """不改變畫面，回傳整個結果中符合 filters 的資料列號"""
+        rows = [row for row in range(len(self.result)) if row not in self.dead] if self.dead else None
+        for col, predicate in filters:
+            if predicate is not None:
+                rows = self.result.match_rows(col, predicate, rows)
+        return list(range(len(self.result))) if rows is None else rows
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        self.sort_column = column if column < len(self.columns) else -1
+        self.sort_order = order
+        self._relayout(self._mapped_rows())
+
+    def source_row(self, row):
+        """畫面列號對應到 ResultSet 中的列號"""
+        return row if self.rows is None else self.rows[row]
+
+    def set_more_available(self, available):
+        """設定是否還有尚未讀取的資料；也會結束等待中的 fetchMore"""
+        self.more_available = available
+        self._fetch_pending = False
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.more_available and not self._fetch_pending
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self._fetch_pending = True
+            self.fetch_more_requested.emit()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.result) if self.rows is None else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns) + len(self.extra_columns)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.column() >= len(self.columns):
+            return None
+        row = self.source_row(index.row())
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.result.display(row, index.column())
+        if role == Qt.ItemDataRole.ToolTipRole:
+            text = self.result.display(row, index.column())
+            return text if len(text) >= TOOLTIP_MIN_LENGTH else None
+        if role == Qt.ItemDataRole.BackgroundRole and row in self.highlighted:
+            return HIGHLIGHT_COLOR
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            names = self.columns + self.extra_columns
+            return names[section] if section < len(names) else None
+        return str(section + 1)
+
+    def value(self, row, col):
+        return self.result.value(self.source_row(row), col)
+
+    def display(self, row, col):
+        return self.result.display(self.source_row(row), col)
+
+    def row_values(self, row):
+        return self.result.row(self.source_row(row))
+
+    def column_index(self, name):
+        return self.columns.index(name)
+
+
+class ResultTableView(QTableView):
+    """搭配 ResultTableModel 的表格，取代原本的 QTableWidget
+
+    列高固定，捲動時不需要逐列計算高度。點選欄位標題可排序。
+    auto_size_columns() 只以標題與抽樣的列估算欄寬，並依查詢記住欄寬
+    （包含使用者手動調整的寬度）；標題右鍵選單的「精確調整欄寬」才會量測所有列。
+    """
+
+    def __init__(self, parent=None, extra_columns=()):
+        super().__init__(parent)
+        self._width_key = None
+        self._sizing = False
+        self.result_model = ResultTableModel(self, extra_columns)
+        self.setModel(self.result_model)
+        self.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.setWordWrap(False)
+        vertical_header = self.verticalHeader()
+        vertical_header.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        vertical_header.setDefaultSectionSize(self.fontMetrics().height() + 8)
+        # 預設不排序，保留查詢本身的 ORDER BY
+        self.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        self.setSortingEnabled(True)
+        header = self.horizontalHeader()
+        header.sectionResized.connect(self._remember_width)
+        header.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        header.customContextMenuRequested.connect(self._show_header_menu)
+
+    def set_result(self, columns, data):
+        self.result_model.set_result(columns, data)
+        if self.result_model.sort_column < 0 and self.horizontalHeader().sortIndicatorSection() >= 0:
+            self.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+
+    def set_filters(self, filters):
+        self.result_model.set_filters(filters)
+
+    def update_result(self, columns, data, key):
+        """定時刷新用：欄位相同時只套用以 key 欄對照的差異，保留選取與捲動位置
+
+        回傳 (新增, 結束, 變更) 的列數；整批取代時回傳 None。
+        """
+        model = self.result_model
+        if list(columns) != model.columns or key not in model.columns or not isinstance(data, ResultSet):
+            self.set_result(columns, data)
+            return None
+        return model.apply_delta(data, model.column_index(key))
+
+    def width_key(self):
+        result = self.result_model.result
+        if result.record is not None:
+            return result.record.fingerprint
+        return tuple(self.result_model.columns)
+
+    def auto_size_columns(self, key=None):
+        """以標題與最多 AUTO_SIZE_SAMPLE_ROWS 列估算欄寬，不掃描全部資料
+
+        key 為欄寬快取的鍵，預設為查詢指紋，沒有記錄時為欄位名稱組合。
+        """
+        model = self.result_model
+        self._width_key = key = key if key is not None else self.width_key()
+        metrics = self.fontMetrics()
+        header_metrics = self.horizontalHeader().fontMetrics()
+        rows = sample_rows(model.rowCount())
+        self._sizing = True
+        try:
+            for col, name in enumerate(model.columns):
+                width = _cached_width((key, name))
+                if width is None:
+                    width = header_metrics.horizontalAdvance(name) + HEADER_PADDING
+                    # 先以字元數挑出最長的幾個值，再量測實際寬度
+                    texts = sorted({model.display(row, col) for row in rows}, key=len, reverse=True)[:20]
+                    for text in texts:
+                        width = max(width, metrics.horizontalAdvance(text) + CELL_PADDING)
+                    width = min(width, MAX_AUTO_COLUMN_WIDTH)
+                    if rows:
+                        # 沒有資料時只依標題估算，不寫入快取
+                        _cache_width((key, name), width)
+                self.setColumnWidth(col, width)
+            for col in range(len(model.columns), model.columnCount()):
+                # 附加欄（例如按鈕）的列數少，直接依內容調整
+                self.resizeColumnToContents(col)
+        finally:
+            self._sizing = False
+
+    def fit_columns_exactly(self):
+        """量測所有列的內容調整欄寬，並更新欄寬快取"""
+        self._sizing = True
+        try:
+            self.resizeColumnsToContents()
+        finally:
+            self._sizing = False
+        key = self._width_key if self._width_key is not None else self.width_key()
+        for col, name in enumerate(self.result_model.columns):
+            _cache_width((key, name), self.columnWidth(col))
+
+    def _remember_width(self, col, old_width, new_width):
+        # 只記住使用者拖曳調整的寬度
+        if self._sizing or self._width_key is None or col >= len(self.result_model.columns):
+            return
+        _cache_width((self._width_key, self.result_model.columns[col]), new_width)
+
+    def _show_header_menu(self, pos):
+        menu = QMenu(self)
+        menu.addAction("精確調整欄寬", self.fit_columns_exactly)
+        menu.addAction("重新估算欄寬", self._reset_widths)
+        menu.exec(self.horizontalHeader().mapToGlobal(pos))
+
+    def _reset_widths(self):
+        key = self._width_key if self._width_key is not None else self.width_key()
+        for name in self.result_model.columns:
+            _column_widths.pop((key, name), None)
+        self.auto_size_columns(key)
+
+    def clear(self):
+        self.result_model.clear()
+
+    def append_batch(self, batch):
+        self.result_model.append_batch(batch)
+
+    def row_count(self):
+        return self.result_model.rowCount()
+
+    def selected_rows(self):
+        """回傳已選取的列號（依畫面順序）"""
+        return sorted(index.row() for index in self.selectionModel().selectedRows())
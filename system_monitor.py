@@ -1,14 +1,70 @@
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTableWidget, QLineEdit, QComboBox, QTabWidget, QTableWidgetItem, QMessageBox
+import time
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QComboBox, QTabWidget, QMessageBox, QCheckBox
 from PySide6.QtGui import QFont
 from PySide6.QtCore import Qt
 from as400_connector import execute_query
+from job_resources import METRICS, JobResourceHistory, sample_top_jobs
+from message_archive import PERIODS, SOURCES, MessageArchives, MessageSearch, fetch_and_archive, sync_and_search
+from message_tail import TIMESTAMP_COLUMN, MessageTail, keep_latest
+from refresh_scheduler import (FOLLOW_REFRESH_INTERVAL, HISTORY_LOG_REFRESH_INTERVAL, JOB_RESOURCE_SAMPLE_INTERVAL,
+                               QSYSOPR_REFRESH_INTERVAL)
+from result_model import ResultTableView
+
+# 第一次載入最近的訊息；之後只以綁定的開始時間查詢更新的訊息，伺服器不必重新掃描
+QSYSOPR_QUERY = """
+SELECT MESSAGE_TEXT, MESSAGE_ID, SEVERITY, FROM_JOB, MESSAGE_TIMESTAMP
+FROM QSYS2.MESSAGE_QUEUE_INFO
+WHERE MESSAGE_QUEUE_NAME = 'QSYSOPR' AND SEVERITY > 10
+ORDER BY MESSAGE_TIMESTAMP DESC
+FETCH FIRST 100 ROWS ONLY
+"""
+QSYSOPR_TAIL_QUERY = """
+SELECT MESSAGE_TEXT, MESSAGE_ID, SEVERITY, FROM_JOB, MESSAGE_TIMESTAMP
+FROM QSYS2.MESSAGE_QUEUE_INFO
+WHERE MESSAGE_QUEUE_NAME = 'QSYSOPR' AND SEVERITY > 10 AND MESSAGE_TIMESTAMP >= ?
+ORDER BY MESSAGE_TIMESTAMP
+"""
+# 本機封存沒有訊息時先同步最近 24 小時，之後只同步封存中最後一則訊息之後的訊息
+HISTORY_LOG_QUERY = """
+SELECT MESSAGE_TEXT, MESSAGE_ID, SEVERITY, FROM_JOB, MESSAGE_TIMESTAMP
+FROM TABLE(QSYS2.HISTORY_LOG_INFO(
+    START_TIME => CURRENT TIMESTAMP - 24 HOURS)) X
+WHERE SEVERITY >= '30'
+ORDER BY MESSAGE_TIMESTAMP DESC
+"""
+HISTORY_LOG_TAIL_QUERY = """
+SELECT MESSAGE_TEXT, MESSAGE_ID, SEVERITY, FROM_JOB, MESSAGE_TIMESTAMP
+FROM TABLE(QSYS2.HISTORY_LOG_INFO(START_TIME => ?)) X
+WHERE SEVERITY >= '30'
+ORDER BY MESSAGE_TIMESTAMP
+"""
 
 class SystemMonitorGUI(QWidget):
     def __init__(self, parent):
         super().__init__(parent)
         self.parent_gui = parent
+        self.pending_queries = set()
+        # 系統 -> JobResourceHistory，切換系統時各自保留走勢
+        self.job_histories = {}
+        self.qsysopr_tail = MessageTail(QSYSOPR_QUERY, QSYSOPR_TAIL_QUERY)
+        # 收集到的訊息寫入各系統的本機封存，歷史日誌選項卡在封存中查詢
+        self.archives = MessageArchives(parent.archive_dir)
+        # 歷史日誌選項卡同步封存用，與 QSYSOPR 選項卡的追蹤位置分開
+        self.archive_tails = {
+            "HISTORY_LOG": MessageTail(HISTORY_LOG_QUERY, HISTORY_LOG_TAIL_QUERY),
+            "QSYSOPR": MessageTail(QSYSOPR_QUERY, QSYSOPR_TAIL_QUERY),
+        }
+        self.history_search = None
+        # 訊息表格 -> 目前顯示的系統；與查詢的系統不同時改為完整載入
+        self.message_hosts = {}
         self.initUI()
 
+        # 選項卡顯示時才定期刷新，切到其他選項卡或頁面就暫停
+        self.set_follow("qsysopr", False)
+        self.set_follow("history_log", False)
+        self.parent_gui.refresh_scheduler.add("job_resources", JOB_RESOURCE_SAMPLE_INTERVAL,
+                                              self.sample_job_resources, self.job_resources_tab, self.connected)
+
     def initUI(self):
         layout = QVBoxLayout(self)
 
@@ -22,6 +78,12 @@ class SystemMonitorGUI(QWidget):
         
         title_layout.addStretch(1)  # 添加彈性空間
         
+        self.cancel_button = QPushButton('取消查詢')
+        self.cancel_button.clicked.connect(self.cancel_queries)
+        self.cancel_button.setFixedSize(100, 30)
+        self.cancel_button.setEnabled(False)
+        title_layout.addWidget(self.cancel_button)
+
         switch_to_main_button = QPushButton('切換到主界面')
         switch_to_main_button.clicked.connect(self.parent_gui.switch_interface)
         switch_to_main_button.setFixedSize(120, 30)  # 設置按鈕大小
@@ -42,51 +104,185 @@ class SystemMonitorGUI(QWidget):
         # 添加作業日誌監控選項卡
         self.add_job_log_tab(self.tab_widget)
 
+        # 添加作業資源排行選項卡
+        self.add_job_resources_tab(self.tab_widget)
+
     def add_qsysopr_tab(self, tab_widget):
-        tab = QWidget()
+        tab = self.qsysopr_tab = QWidget()
         layout = QVBoxLayout(tab)
 
+        button_layout = QHBoxLayout()
         query_button = QPushButton('查詢 QSYSOPR 消息')
-        query_button.clicked.connect(self.query_qsysopr)
-        layout.addWidget(query_button)
+        query_button.clicked.connect(lambda: self.query_qsysopr())
+        button_layout.addWidget(query_button, 1)
+        follow_check = QCheckBox('即時追蹤')
+        follow_check.toggled.connect(lambda checked: self.set_follow("qsysopr", checked))
+        button_layout.addWidget(follow_check)
+        layout.addLayout(button_layout)
 
-        self.qsysopr_result = QTableWidget()
+        self.qsysopr_result = ResultTableView()
         layout.addWidget(self.qsysopr_result)
 
         tab_widget.addTab(tab, 'QSYSOPR 消息')
 
-    def query_qsysopr(self):
-        query = """
-        SELECT MESSAGE_TEXT, MESSAGE_ID, SEVERITY, FROM_JOB, MESSAGE_TIMESTAMP 
-        FROM QSYS2.MESSAGE_QUEUE_INFO
-        WHERE MESSAGE_QUEUE_NAME = 'QSYSOPR' AND SEVERITY > 10
-        ORDER BY MESSAGE_TIMESTAMP DESC
-        FETCH FIRST 100 ROWS ONLY
-        """
-        self.execute_query(query, self.qsysopr_result)
+    def query_qsysopr(self, quiet=False):
+        """按鈕重新載入最近的訊息；定時刷新（quiet）只附加新的訊息"""
+        self.tail_messages(self.qsysopr_tail, "QSYSOPR", self.qsysopr_result, quiet)
 
     def add_history_log_tab(self, tab_widget):
-        tab = QWidget()
+        tab = self.history_log_tab = QWidget()
         layout = QVBoxLayout(tab)
 
+        # 查詢條件套用在本機封存上，按 Enter 或查詢按鈕後生效
+        filter_layout = QHBoxLayout()
+        self.history_source_combo = QComboBox()
+        for name, source in SOURCES:
+            self.history_source_combo.addItem(name, source)
+        filter_layout.addWidget(self.history_source_combo)
+        self.history_period_combo = QComboBox()
+        for name, days in PERIODS:
+            self.history_period_combo.addItem(name, days)
+        filter_layout.addWidget(self.history_period_combo)
+        self.history_severity_combo = QComboBox()
+        self.history_severity_combo.addItem('全部嚴重性', None)
+        for severity in (30, 40, 50, 70):
+            self.history_severity_combo.addItem(f'嚴重性 >= {severity}', severity)
+        filter_layout.addWidget(self.history_severity_combo)
+        self.history_text_input = QLineEdit()
+        self.history_text_input.setPlaceholderText('訊息內容')
+        filter_layout.addWidget(self.history_text_input, 2)
+        self.history_message_id_input = QLineEdit()
+        self.history_message_id_input.setPlaceholderText('訊息 ID (例如: CPF)')
+        filter_layout.addWidget(self.history_message_id_input, 1)
+        self.history_job_input = QLineEdit()
+        self.history_job_input.setPlaceholderText('作業名稱')
+        filter_layout.addWidget(self.history_job_input, 1)
+        for line_edit in (self.history_text_input, self.history_message_id_input, self.history_job_input):
+            line_edit.returnPressed.connect(lambda: self.query_history_log())
+        layout.addLayout(filter_layout)
+
+        button_layout = QHBoxLayout()
         query_button = QPushButton('查詢歷史日誌')
-        query_button.clicked.connect(self.query_history_log)
-        layout.addWidget(query_button)
+        query_button.clicked.connect(lambda: self.query_history_log())
+        button_layout.addWidget(query_button, 1)
+        self.history_status_label = QLabel()
+        button_layout.addWidget(self.history_status_label)
+        follow_check = QCheckBox('即時追蹤')
+        follow_check.toggled.connect(lambda checked: self.set_follow("history_log", checked))
+        button_layout.addWidget(follow_check)
+        layout.addLayout(button_layout)
 
-        self.history_log_result = QTableWidget()
+        self.history_log_result = ResultTableView()
         layout.addWidget(self.history_log_result)
 
         tab_widget.addTab(tab, '歷史日誌')
 
-    def query_history_log(self):
-        query = """
-        SELECT MESSAGE_TEXT, MESSAGE_ID, SEVERITY, FROM_JOB, MESSAGE_TIMESTAMP 
-        FROM TABLE(QSYS2.HISTORY_LOG_INFO(
-            START_TIME => CURRENT TIMESTAMP - 24 HOURS)) X
-        WHERE SEVERITY >= '30'
-        ORDER BY MESSAGE_TIMESTAMP DESC
+    def query_history_log(self, quiet=False):
+        """先向伺服器同步新的訊息到本機封存，再依條件在封存中查詢
+
+        按鈕依目前的條件重新查詢；定時刷新（quiet）沿用上次的條件，只附加新封存的訊息。
         """
-        self.execute_query(query, self.history_log_result)
+        connector = self.parent_gui.as400_connector
+        host = connector.current_connection
+        if not host:
+            QMessageBox.warning(self, "無連接", "請先選擇一個連接的系統")
+            return
+        search = self.history_search
+        if not quiet or search is None or search.host != host:
+            search = self.history_search = MessageSearch(
+                host, self.history_source_combo.currentData(), self.history_text_input.text(),
+                self.history_message_id_input.text(), self.history_severity_combo.currentData(),
+                self.history_job_input.text(), self.history_period_combo.currentData())
+        worker_id = self.parent_gui.refresh_scheduler.submit(
+            (host, "archive", search), self.parent_gui.query_runner,
+            sync_and_search, connector, self.archives, self.archive_tails[search.source], search, "SystemMonitor",
+            on_result=lambda outcome: self.show_history(worker_id, outcome, search, quiet),
+            on_error=lambda error: self.show_history(worker_id, (None, error), search, quiet))
+        self.pending_queries.add(worker_id)
+        self.cancel_button.setEnabled(True)
+
+    def show_history(self, worker_id, outcome, search, quiet):
+        self.pending_queries.discard(worker_id)
+        self.cancel_button.setEnabled(bool(self.pending_queries))
+
+        result, error = outcome
+        if not result:
+            self.query_failed(error, quiet)
+            return
+        if search is not self.history_search:
+            # 查詢途中已改用新的條件或切換了系統
+            return
+        columns, data, incremental, _ = result
+        self.display_messages(self.history_log_result, columns, data, incremental)
+        self.history_status_label.setText(f"本機查詢 {search.elapsed * 1000:.1f} ms・{search.rows} 筆")
+
+    def set_follow(self, name, follow):
+        """即時追蹤時以較短的間隔輪詢；每次只查詢新的訊息，對伺服器的負擔很小"""
+        tab, interval, refresh = {
+            "qsysopr": (self.qsysopr_tab, QSYSOPR_REFRESH_INTERVAL, self.query_qsysopr),
+            "history_log": (self.history_log_tab, HISTORY_LOG_REFRESH_INTERVAL, self.query_history_log),
+        }[name]
+        self.parent_gui.refresh_scheduler.add(name, FOLLOW_REFRESH_INTERVAL if follow else interval,
+                                              lambda: refresh(quiet=True), tab, self.connected)
+
+    def connected(self):
+        return bool(self.parent_gui.as400_connector.current_connection)
+
+    def tail_messages(self, tail, source, result_widget, quiet=False):
+        connector = self.parent_gui.as400_connector
+        host = connector.current_connection
+        if not host:
+            QMessageBox.warning(self, "無連接", "請先選擇一個連接的系統")
+            return
+        if not quiet or self.message_hosts.get(result_widget) != host:
+            tail.reset(host)
+        worker_id = self.parent_gui.refresh_scheduler.submit(
+            (host, "tail", tail.query), self.parent_gui.query_runner,
+            fetch_and_archive, connector, self.archives, host, tail, source, "SystemMonitor",
+            on_result=lambda outcome: self.show_messages(worker_id, outcome, tail, result_widget, host, quiet),
+            on_error=lambda error: self.show_messages(worker_id, (None, error), tail, result_widget, host, quiet))
+        self.pending_queries.add(worker_id)
+        self.cancel_button.setEnabled(True)
+
+    def show_messages(self, worker_id, outcome, tail, result_widget, host, quiet):
+        self.pending_queries.discard(worker_id)
+        self.cancel_button.setEnabled(bool(self.pending_queries))
+
+        result, error = outcome
+        if not result:
+            self.query_failed(error, quiet)
+            return
+        columns, data, incremental, record = result
+        if not incremental:
+            self.message_hosts[result_widget] = host
+        elif self.message_hosts.get(result_widget) != host:
+            # 查詢途中切換了系統，下次重新完整載入
+            tail.reset(host)
+            return
+        self.display_messages(result_widget, columns, data, incremental, record)
+
+    def query_failed(self, error, quiet):
+        if quiet:
+            self.parent_gui.statusBar().showMessage(f"自動刷新失敗: {error}")
+        else:
+            QMessageBox.critical(self, "查詢失敗", f"執行查詢時發生錯誤: {error}")
+
+    def display_messages(self, result_widget, columns, data, incremental, record=None):
+        """完整結果取代表格內容；增量結果附加在最後，超過上限時捨棄最舊的訊息"""
+        start = time.perf_counter()
+        if not incremental:
+            result_widget.set_result(columns, data)
+            result_widget.auto_size_columns()
+            if result_widget.result_model.sort_column < 0:
+                # 資料依時間遞增存放，畫面依時間遞減顯示，新的訊息出現在最上方
+                result_widget.sortByColumn(columns.index(TIMESTAMP_COLUMN), Qt.SortOrder.DescendingOrder)
+        elif len(data):
+            result_widget.append_batch(data.batch())
+            latest = keep_latest(result_widget.result_model.result)
+            if latest is not None:
+                result_widget.set_result(columns, latest)
+        if record is not None:
+            record.add_time("render", time.perf_counter() - start)
 
     def add_job_log_tab(self, tab_widget):
         tab = QWidget()
@@ -101,37 +297,120 @@ class SystemMonitorGUI(QWidget):
         query_button.clicked.connect(lambda: self.query_job_log(job_input.text()))
         layout.addWidget(query_button)
 
-        self.job_log_result = QTableWidget()
+        self.job_log_result = ResultTableView()
         layout.addWidget(self.job_log_result)
 
         tab_widget.addTab(tab, '作業日誌')
 
     def query_job_log(self, job_name):
-        query = f"""
+        query = """
         SELECT MESSAGE_TEXT, MESSAGE_ID, MESSAGE_TYPE, MESSAGE_TIMESTAMP
-        FROM TABLE(QSYS2.JOBLOG_INFO('{job_name}')) AS X
+        FROM TABLE(QSYS2.JOBLOG_INFO(?)) AS X
         ORDER BY MESSAGE_TIMESTAMP DESC
         FETCH FIRST 100 ROWS ONLY
         """
-        self.execute_query(query, self.job_log_result)
+        self.execute_query(query, self.job_log_result, (job_name,))
+
+    def add_job_resources_tab(self, tab_widget):
+        tab = self.job_resources_tab = QWidget()
+        layout = QVBoxLayout(tab)
+
+        control_layout = QHBoxLayout()
+        control_layout.addWidget(QLabel('排行依據:'))
+        self.job_metric_combo = QComboBox()
+        for name, _, _ in METRICS:
+            self.job_metric_combo.addItem(name)
+        self.job_metric_combo.currentIndexChanged.connect(lambda: self.show_top_jobs())
+        control_layout.addWidget(self.job_metric_combo)
+        self.job_resources_label = QLabel()
+        control_layout.addWidget(self.job_resources_label)
+        control_layout.addStretch(1)
+        sample_button = QPushButton('立即取樣')
+        sample_button.clicked.connect(self.sample_job_resources)
+        control_layout.addWidget(sample_button)
+        layout.addLayout(control_layout)
+
+        self.job_resources_result = ResultTableView()
+        layout.addWidget(self.job_resources_result)
 
-    def execute_query(self, query, result_widget):
+        tab_widget.addTab(tab, '作業資源')
+
+    def job_history(self, host):
+        # 已斷開的系統不再保留走勢
+        connections = self.parent_gui.as400_connector.connections
+        for name in [name for name in self.job_histories if name not in connections]:
+            del self.job_histories[name]
+        if host not in self.job_histories:
+            self.job_histories[host] = JobResourceHistory()
+        return self.job_histories[host]
+
+    def sample_job_resources(self):
+        """取樣一次 ACTIVE_JOB_INFO 的 CPU/IO/暫存空間，在背景計算差值後顯示排行"""
+        connector = self.parent_gui.as400_connector
+        host = connector.current_connection
+        if not host:
+            return
+        history = self.job_history(host)
+        worker_id = self.parent_gui.refresh_scheduler.submit(
+            (host, "job_resources"), self.parent_gui.query_runner,
+            sample_top_jobs, connector, host, history, self.job_metric_combo.currentIndex(),
+            on_result=lambda outcome: self.show_job_resources(worker_id, outcome, history),
+            on_error=lambda error: self.show_job_resources(worker_id, (None, error), history))
+        self.pending_queries.add(worker_id)
+        self.cancel_button.setEnabled(True)
+
+    def show_job_resources(self, worker_id, outcome, history):
+        self.pending_queries.discard(worker_id)
+        self.cancel_button.setEnabled(bool(self.pending_queries))
+        result, error = outcome
+        if error:
+            self.parent_gui.statusBar().showMessage(f"作業資源取樣失敗: {error}")
+            return
+        # 取樣途中切換了系統時只保留走勢，不顯示
+        if history is self.job_histories.get(self.parent_gui.as400_connector.current_connection):
+            self.show_top_jobs(result)
+
+    def show_top_jobs(self, top=None):
+        """top 為背景算好的排行；None 時依目前選擇的指標重新排行"""
+        history = self.job_histories.get(self.parent_gui.as400_connector.current_connection)
+        if history is None:
+            return
+        columns, rows = top or history.top(self.job_metric_combo.currentIndex())
+        self.job_resources_result.set_result(columns, rows)
+        self.job_resources_result.auto_size_columns()
+        self.job_resources_label.setText(f"已取樣 {history.sample_count} 次・追蹤 {len(history)} 個作業")
+
+    def execute_query(self, query, result_widget, params=None):
         if not self.parent_gui.as400_connector.current_connection:
             QMessageBox.warning(self, "無連接", "請先選擇一個連接的系統")
             return
 
-        result, error = self.parent_gui.as400_connector.execute_query(query)
-        if result:
-            columns, data = result
-            
-            result_widget.setColumnCount(len(columns))
-            result_widget.setRowCount(len(data))
-            result_widget.setHorizontalHeaderLabels(columns)
+        connector = self.parent_gui.as400_connector
+        host = connector.current_connection
+        # 同一系統的相同查詢還在執行時（例如連按查詢按鈕）等待同一次結果
+        worker_id = self.parent_gui.refresh_scheduler.submit(
+            (host, query, params), self.parent_gui.query_runner,
+            connector.execute_query, query, host, params, "SystemMonitor",
+            on_result=lambda outcome: self.show_result(worker_id, outcome, result_widget),
+            on_error=lambda error: self.show_result(worker_id, (None, error), result_widget))
+        self.pending_queries.add(worker_id)
+        self.cancel_button.setEnabled(True)
 
-            for row, rowData in enumerate(data):
-                for col, value in enumerate(rowData):
-                    result_widget.setItem(row, col, QTableWidgetItem(str(value)))
+    def show_result(self, worker_id, outcome, result_widget):
+        self.pending_queries.discard(worker_id)
+        self.cancel_button.setEnabled(bool(self.pending_queries))
 
-            result_widget.resizeColumnsToContents()
+        result, error = outcome
+        if result:
+            start = time.perf_counter()
+            columns, data = result
+            result_widget.set_result(columns, data)
+            result_widget.auto_size_columns()
+            if result.record is not None:
+                result.record.add_time("render", time.perf_counter() - start)
         else:
-            QMessageBox.critical(self, "查詢失敗", f"執行查詢時發生錯誤: {error}")
\ No newline at end of file
+            QMessageBox.critical(self, "查詢失敗", f"執行查詢時發生錯誤: {error}")
+
+    def cancel_queries(self):
+        for worker_id in list(self.pending_queries):
+            self.parent_gui.query_runner.cancel(worker_id)
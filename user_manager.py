@@ -1,8 +1,19 @@
-import jaydebeapi
-from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, 
+import time
+from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
                                QMessageBox, QInputDialog, QLineEdit, QComboBox, QDialog, QFormLayout, QCheckBox, QDialogButtonBox, QLabel)
 from PySide6.QtCore import Qt
 from PySide6.QtGui import QIcon
+from as400_connector import (FETCH_BATCH_SIZE, cl_name, cl_password, cl_special_value, cl_string,
+                             finish_query_record, invalidate_command, record_execute, single_flight,
+                             start_query_record)
+from columnar import read_result_set
+from query_worker import BackgroundQueryRunner
+from refresh_scheduler import USER_REFRESH_INTERVAL
+from result_model import ResultTableView
+
+# USER_INFO 與 spool file 清單的快取秒數
+USER_INFO_CACHE_TTL = 300
+SPOOL_FILES_CACHE_TTL = 60
 
 class PasswordLineEdit(QWidget):
     def __init__(self, parent=None):
@@ -82,81 +93,115 @@ class UserManager:
     def __init__(self, connection):
         self.connection = connection
 
-    def list_users(self):
-        """列出所有使用者"""
+    def list_users(self, refresh=False):
+        """列出所有使用者，refresh 為 True 時略過快取重新查詢"""
         query = """
         SELECT USER_NAME, STATUS, PREVIOUS_SIGNON, PASSWORD_CHANGE_DATE
         FROM QSYS2.USER_INFO
         ORDER BY USER_NAME
         """
-        return self._execute_query(query)
+        return self._execute_query(query, cache_ttl=USER_INFO_CACHE_TTL, refresh=refresh)
 
     def create_user(self, username, password, description="", user_class="*USER", special_authorities=[]):
         """創建新使用者"""
-        special_auth = " ".join(special_authorities)
-        cmd = f"CRTUSRPRF USRPRF({username}) PASSWORD({password}) TEXT('{description}') USRCLS({user_class}) SPCAUT({special_auth})"
+        special_auth = " ".join(cl_special_value(auth) for auth in special_authorities)
+        cmd = (f"CRTUSRPRF USRPRF({cl_name(username)}) PASSWORD({cl_password(password)}) "
+               f"TEXT({cl_string(description)}) USRCLS({cl_special_value(user_class)}) SPCAUT({special_auth})")
         self._execute_command(cmd)
 
     def delete_user(self, username):
         """刪除使用者"""
-        cmd = f"DLTUSRPRF USRPRF({username})"
+        cmd = f"DLTUSRPRF USRPRF({cl_name(username)})"
         self._execute_command(cmd)
 
     def change_password(self, username, new_password):
         """更改使用者密碼"""
-        cmd = f"CHGUSRPRF USRPRF({username}) PASSWORD({new_password})"
+        cmd = f"CHGUSRPRF USRPRF({cl_name(username)}) PASSWORD({cl_password(new_password)})"
         self._execute_command(cmd)
 
     def disable_user(self, username):
         """停用用戶帳號"""
-        cmd = f"CHGUSRPRF USRPRF({username}) STATUS(*DISABLED)"
+        cmd = f"CHGUSRPRF USRPRF({cl_name(username)}) STATUS(*DISABLED)"
         self._execute_command(cmd)
 
     def enable_user(self, username):
         """啟用用戶帳號"""
-        cmd = f"CHGUSRPRF USRPRF({username}) STATUS(*ENABLED)"
+        cmd = f"CHGUSRPRF USRPRF({cl_name(username)}) STATUS(*ENABLED)"
         self._execute_command(cmd)
 
     def modify_user_authorities(self, username, user_class, special_authorities):
         """修改用戶的 User Class 和特殊權限"""
-        special_auth = " ".join(special_authorities)
-        cmd = f"CHGUSRPRF USRPRF({username}) USRCLS({user_class}) SPCAUT({special_auth})"
+        special_auth = " ".join(cl_special_value(auth) for auth in special_authorities)
+        cmd = f"CHGUSRPRF USRPRF({cl_name(username)}) USRCLS({cl_special_value(user_class)}) SPCAUT({special_auth})"
         self._execute_command(cmd)
 
     def get_user_spool_files(self, username):
         """獲取指定用戶的 spool files"""
-        query = f"""
+        query = """
         SELECT * FROM QSYS2.OUTPUT_QUEUE_ENTRIES_BASIC
-        WHERE USER_NAME = '{username}'
+        WHERE USER_NAME = ?
         ORDER BY SIZE DESC
         FETCH FIRST 100 ROWS ONLY
         """
-        return self._execute_query(query)
-    def _execute_query(self, query):
-        try:
+        return self._execute_query(query, (username,), cache_ttl=SPOOL_FILES_CACHE_TTL)
+
+    def _execute_query(self, query, params=None, cache_ttl=None, refresh=False):
+        # cache_ttl 不為 None 時使用連接池共用的結果快取
+        cache = getattr(self.connection, "result_cache", None) if cache_ttl is not None else None
+        record = start_query_record(self.connection, "UserManager", query)
+        if cache is not None and not refresh:
+            cached = cache.get(self.connection.host, query, params)
+            if cached is not None:
+                return finish_query_record(record, cached, cached=True)
+        # 查詢途中執行了命令（快取被清除）時，結果可能是命令前的資料，不寫入快取
+        generation = cache.generation(self.connection.host) if cache is not None else None
+
+        def fetch():
             with self.connection.cursor() as cursor:
-                cursor.execute(query)
+                cursor.execute(query, params or ())
+                record_execute(record, cursor)
                 columns = [desc[0] for desc in cursor.description]
-                result = cursor.fetchall()
-                return columns, result
+                return columns, read_result_set(cursor, columns, FETCH_BATCH_SIZE, record)
+
+        try:
+            # 快取未命中時，相同的查詢正在執行就等待同一個結果
+            result, shared = single_flight(self.connection, query, params, fetch)
         except Exception as e:
+            finish_query_record(record, error=str(e))
             print(f"執行查詢時發生錯誤: {str(e)}")
             return None
+        if cache is not None and not shared:
+            cache.put(self.connection.host, query, params, result, cache_ttl, generation)
+        return finish_query_record(record, result, cached=shared)
 
     def _execute_command(self, cmd):
+        # 只記錄命令名稱，參數可能含有密碼
+        record = start_query_record(self.connection, "UserManager", "CALL QSYS2.QCMDEXC(?)",
+                                    f"QCMDEXC {cmd.split(' ', 1)[0]}")
         try:
             with self.connection.cursor() as cursor:
                 cursor.execute("CALL QSYS2.QCMDEXC(?)", (cmd,))
+                record_execute(record, cursor)
+            finish_query_record(record)
         except Exception as e:
+            finish_query_record(record, error=str(e))
             print(f"執行命令時發生錯誤: {str(e)}")
             raise
+        finally:
+            # 命令可能部分生效，無論成功與否都讓相關快取與執行中的查詢失效
+            invalidate_command(self.connection, cmd)
 
 class UserManagerGUI(QWidget):
     def __init__(self, parent, user_manager):
         super().__init__(parent)
         self.parent = parent
         self.user_manager = user_manager
+        self.query_runner = BackgroundQueryRunner(self)
+        self.host = user_manager.connection.host
+        self.scheduler = parent.refresh_scheduler
         self.initUI()
+        # 只在畫面顯示時刷新，第一次顯示時載入用戶列表
+        self.scheduler.add(("user_manager", self.host), USER_REFRESH_INTERVAL, self.refresh_user_list, self)
 
     def initUI(self):
         layout = QVBoxLayout(self)
@@ -171,6 +216,8 @@ class UserManagerGUI(QWidget):
         self.enable_user_button = QPushButton('啟用帳號')
         self.modify_authorities_button = QPushButton('修改權限')
         self.view_spool_files_button = QPushButton('查看 Spool Files')
+        self.cancel_button = QPushButton('取消查詢')
+        self.cancel_button.setEnabled(False)
 
         button_layout.addWidget(self.refresh_button)
         button_layout.addWidget(self.create_button)
@@ -180,72 +227,87 @@ class UserManagerGUI(QWidget):
         button_layout.addWidget(self.enable_user_button)
         button_layout.addWidget(self.modify_authorities_button)
         button_layout.addWidget(self.view_spool_files_button)
+        button_layout.addWidget(self.cancel_button)
 
         layout.addLayout(button_layout)
 
         # 創建表格
-        self.user_table = QTableWidget()
+        self.user_table = ResultTableView()
         layout.addWidget(self.user_table)
 
         # 連接按鈕信號
-        self.refresh_button.clicked.connect(self.refresh_user_list)
-        self.create_button.clicked.connect(self.create_user_dialog)
-        self.delete_button.clicked.connect(self.delete_user_dialog)
+        self.refresh_button.clicked.connect(lambda: self.refresh_user_list(refresh=True))
+        self.create_button.clicked.connect(lambda: self.create_user_dialog())
+        self.delete_button.clicked.connect(lambda: self.delete_user_dialog())
         self.change_password_button.clicked.connect(self.change_password_dialog)
-        self.disable_user_button.clicked.connect(self.disable_user_dialog)
-        self.enable_user_button.clicked.connect(self.enable_user_dialog)
-        self.modify_authorities_button.clicked.connect(self.modify_authorities_dialog)
+        self.disable_user_button.clicked.connect(lambda: self.disable_user_dialog())
+        self.enable_user_button.clicked.connect(lambda: self.enable_user_dialog())
+        self.modify_authorities_button.clicked.connect(lambda: self.modify_authorities_dialog())
         self.view_spool_files_button.clicked.connect(self.show_user_spool_files)
+        self.cancel_button.clicked.connect(self.query_runner.cancel_all)
+        self.query_runner.busy_changed.connect(self.cancel_button.setEnabled)
 
-        # 初始化用戶列表
-        self.refresh_user_list()
+    def refresh_user_list(self, refresh=False):
+        if self.query_runner.is_busy():
+            return
+        self.scheduler.submit((self.host, "users", refresh), self.query_runner, self.user_manager.list_users, refresh,
+                              on_result=self.show_user_list,
+                              on_error=lambda error: self.show_user_list(None))
 
-    def refresh_user_list(self):
-        result = self.user_manager.list_users()
+    def disable_refresh(self):
+        self.scheduler.remove(("user_manager", self.host))
+
+    def show_user_list(self, result):
         if result:
+            start = time.perf_counter()
             columns, data = result
-            self.user_table.setColumnCount(len(columns))
-            self.user_table.setRowCount(len(data))
-            self.user_table.setHorizontalHeaderLabels(columns)
-
-            for row, user_data in enumerate(data):
-                for col, value in enumerate(user_data):
-                    self.user_table.setItem(row, col, QTableWidgetItem(str(value)))
-
-            self.user_table.resizeColumnsToContents()
-            self.user_table.setSelectionBehavior(QTableWidget.SelectRows)
+            self.user_table.set_result(columns, data)
+            self.user_table.auto_size_columns()
+            if result.record is not None:
+                result.record.add_time("render", time.perf_counter() - start)
         else:
             QMessageBox.warning(self, "錯誤", "無法取用戶列表")
 
-    def create_user_dialog(self):
+    def run_user_command(self, fn, *args, success, failure, refresh=None):
+        """在背景執行 QCMDEXC 命令，完成後在 GUI 執行緒顯示結果
+
+        refresh 刷新使用者看到的用戶列表（例如主視窗的用戶管理頁面），成功後呼叫。
+        """
+        def finished(_):
+            QMessageBox.information(self, "成功", success)
+            if refresh is not None:
+                refresh()
+
+        def failed(error):
+            QMessageBox.critical(self, "錯誤", f"{failure}：{error}")
+
+        self.query_runner.submit(fn, *args, on_result=finished, on_error=failed, timeout=None)
+
+    def create_user_dialog(self, refresh=None):
         dialog = CreateUserDialog(self)
         if dialog.exec_():
             user_info = dialog.get_user_info()
-            try:
-                self.user_manager.create_user(
-                    user_info["username"],
-                    user_info["password"],
-                    user_info["description"],
-                    user_info["user_class"],
-                    user_info["special_authorities"]
-                )
-                QMessageBox.information(self, "成功", f"用戶 {user_info['username']} 已成功創建")
-                self.refresh_user_list()
-            except Exception as e:
-                QMessageBox.critical(self, "錯誤", f"創建用戶時發生錯誤：{str(e)}")
-
-    def delete_user_dialog(self):
+            self.run_user_command(
+                self.user_manager.create_user,
+                user_info["username"],
+                user_info["password"],
+                user_info["description"],
+                user_info["user_class"],
+                user_info["special_authorities"],
+                success=f"用戶 {user_info['username']} 已成功創建",
+                failure="創建用戶時發生錯誤",
+                refresh=refresh or self.refresh_user_list)
+
+    def delete_user_dialog(self, refresh=None):
         username, ok = QInputDialog.getText(self, "刪除用戶", "輸入要刪除的用戶名:")
         if ok and username:
             confirm = QMessageBox.question(self, "確認", f"確定要刪除用戶 {username} 嗎？",
                                            QMessageBox.Yes | QMessageBox.No)
             if confirm == QMessageBox.Yes:
-                try:
-                    self.user_manager.delete_user(username)
-                    QMessageBox.information(self, "成功", f"用戶 {username} 已成功刪除")
-                    self.refresh_user_list()
-                except Exception as e:
-                    QMessageBox.critical(self, "錯誤", f"刪除用戶時發生錯誤：{str(e)}")
+                self.run_user_command(self.user_manager.delete_user, username,
+                                      success=f"用戶 {username} 已成功刪除",
+                                      failure="刪除用戶時發生錯誤",
+                                      refresh=refresh or self.refresh_user_list)
 
     def change_password_dialog(self):
         username, ok = QInputDialog.getText(self, "更改密碼", "輸入要更改密碼的用戶名:")
@@ -262,33 +324,27 @@ class UserManagerGUI(QWidget):
 
             if password_dialog.exec_() == QDialog.Accepted:
                 new_password = password_input.text()
-                try:
-                    self.user_manager.change_password(username, new_password)
-                    QMessageBox.information(self, "成功", f"用戶 {username} 的密碼已成功更改")
-                except Exception as e:
-                    QMessageBox.critical(self, "錯誤", f"更改密碼時發生錯誤：{str(e)}")
+                self.run_user_command(self.user_manager.change_password, username, new_password,
+                                      success=f"用戶 {username} 的密碼已成功更改",
+                                      failure="更改密碼時發生錯誤")
 
-    def disable_user_dialog(self):
+    def disable_user_dialog(self, refresh=None):
         username, ok = QInputDialog.getText(self, "停用帳號", "輸入要停用的用戶名:")
         if ok and username:
-            try:
-                self.user_manager.disable_user(username)
-                QMessageBox.information(self, "成功", f"用戶 {username} 的帳號已成功停用")
-                self.refresh_user_list()
-            except Exception as e:
-                QMessageBox.critical(self, "錯誤", f"停用帳號時發生錯誤：{str(e)}")
-
-    def enable_user_dialog(self):
+            self.run_user_command(self.user_manager.disable_user, username,
+                                  success=f"用戶 {username} 的帳號已成功停用",
+                                  failure="停用帳號時發生錯誤",
+                                  refresh=refresh or self.refresh_user_list)
+
+    def enable_user_dialog(self, refresh=None):
         username, ok = QInputDialog.getText(self, "啟用帳號", "輸入要啟用的用戶名:")
         if ok and username:
-            try:
-                self.user_manager.enable_user(username)
-                QMessageBox.information(self, "成功", f"用戶 {username} 的帳號已成功啟用")
-                self.refresh_user_list()
-            except Exception as e:
-                QMessageBox.critical(self, "錯誤", f"啟用帳號時發生錯誤：{str(e)}")
-
-    def modify_authorities_dialog(self):
+            self.run_user_command(self.user_manager.enable_user, username,
+                                  success=f"用戶 {username} 的帳號已成功啟用",
+                                  failure="啟用帳號時發生錯誤",
+                                  refresh=refresh or self.refresh_user_list)
+
+    def modify_authorities_dialog(self, refresh=None):
         username, ok = QInputDialog.getText(self, "修改改用戶權限", "輸入要修改權限的用戶名:")
         if ok and username:
             dialog = QDialog(self)
@@ -318,65 +374,66 @@ class UserManagerGUI(QWidget):
             if dialog.exec_() == QDialog.Accepted:
                 new_user_class = user_class_combo.currentText()
                 new_special_auths = [cb.text() for cb in auth_checkboxes if cb.isChecked()]
-                try:
-                    self.user_manager.modify_user_authorities(username, new_user_class, new_special_auths)
-                    QMessageBox.information(self, "成功", f"用戶 {username} 的權限已成功修改")
-                    self.refresh_user_list()
-                except Exception as e:
-                    QMessageBox.critical(self, "錯誤", f"修改用戶權限時發生錯誤：{str(e)}")
+                self.run_user_command(self.user_manager.modify_user_authorities,
+                                      username, new_user_class, new_special_auths,
+                                      success=f"用戶 {username} 的權限已成功修改",
+                                      failure="修改用戶權限時發生錯誤",
+                                      refresh=refresh or self.refresh_user_list)
 
     def show_user_spool_files(self):
         username, ok = QInputDialog.getText(self, "查看 Spool Files", "輸入要查看的用戶名:")
         if ok and username:
             username = username.upper()  # 將輸入轉換為大寫
-            result = self.user_manager.get_user_spool_files(username)
-
-            if result:
-                columns, data = result
-                dialog = QDialog(self)
-                dialog.setWindowTitle(f"{username} 的 Spool Files")
-                dialog.resize(1000, 600)  # 設置視窗大小為 1000x600
-                layout = QVBoxLayout(dialog)
-
-                table = QTableWidget()
-                table.setColumnCount(len(columns) + 1)  # 增加一列用於放置"檢視"按鈕
-                table.setRowCount(len(data))
-                headers = columns + ["操作"]
-                table.setHorizontalHeaderLabels(headers)
-
-                for row, spool_data in enumerate(data):
-                    for col, value in enumerate(spool_data):
-                        table.setItem(row, col, QTableWidgetItem(str(value)))
-                    
-                    view_button = QPushButton("檢視")
-                    view_button.clicked.connect(lambda _, r=row: self.view_spool_file_content(data[r]))
-                    table.setCellWidget(row, len(columns), view_button)
-
-                table.resizeColumnsToContents()
-                layout.addWidget(table)
-
-                close_button = QPushButton("關閉")
-                close_button.clicked.connect(dialog.close)
-                layout.addWidget(close_button)
-
-                dialog.setLayout(layout)
-                dialog.exec()
-            else:
-                QMessageBox.warning(self, "錯誤", f"無法獲取 {username} 的 Spool Files")
+            self.query_runner.submit(
+                self.user_manager.get_user_spool_files, username,
+                on_result=lambda result: self.display_user_spool_files(username, result),
+                on_error=lambda error: self.display_user_spool_files(username, None))
+
+    def display_user_spool_files(self, username, result):
+        if result:
+            columns, data = result
+            dialog = QDialog(self)
+            dialog.setWindowTitle(f"{username} 的 Spool Files")
+            dialog.resize(1000, 600)  # 設置視窗大小為 1000x600
+            layout = QVBoxLayout(dialog)
+
+            table = ResultTableView(extra_columns=["操作"])  # 增加一列用於放置"檢視"按鈕
+            table.set_result(columns, data)
+
+            # 查詢最多 100 筆，可以直接為每列放置按鈕
+            for row in range(len(data)):
+                view_button = QPushButton("檢視")
+                view_button.clicked.connect(lambda _, r=row: self.view_spool_file_content(data[r]))
+                table.setIndexWidget(table.result_model.index(row, len(columns)), view_button)
+
+            table.auto_size_columns()
+            layout.addWidget(table)
+
+            close_button = QPushButton("關閉")
+            close_button.clicked.connect(dialog.close)
+            layout.addWidget(close_button)
+
+            dialog.setLayout(layout)
+            dialog.exec()
+        else:
+            QMessageBox.warning(self, "錯誤", f"無法獲取 {username} 的 Spool Files")
 
     def view_spool_file_content(self, spool_data):
         spooled_file_name = spool_data[3]  # SPOOLED_FILE_NAME 在第4列（索引3）
         job_name = spool_data[11]  # JOB_NAME 在第12列（索引11）
-        
-        print(f"Debug: JOB_NAME = {job_name}, SPOOLED_FILE_NAME = {spooled_file_name}")  # 添加調試輸出
-        
-        query = f"""
+
+        query = """
         SELECT * FROM TABLE(SYSTOOLS.SPOOLED_FILE_DATA(
-            JOB_NAME          =>'{job_name}',
-            SPOOLED_FILE_NAME =>'{spooled_file_name}'))
+            JOB_NAME          => ?,
+            SPOOLED_FILE_NAME => ?))
         ORDER BY ORDINAL_POSITION
         """
-        result = self.user_manager._execute_query(query)
+        self.query_runner.submit(
+            self.user_manager._execute_query, query, (job_name, spooled_file_name),
+            on_result=lambda result: self.display_spool_file_content(spooled_file_name, result),
+            on_error=lambda error: self.display_spool_file_content(spooled_file_name, None))
+
+    def display_spool_file_content(self, spooled_file_name, result):
         if result:
             columns, data = result
             if not data:
@@ -387,16 +444,9 @@ class UserManagerGUI(QWidget):
             content_dialog.resize(1200, 800)  # 設置視窗大小為 1200x800
             content_layout = QVBoxLayout(content_dialog)
 
-            content_table = QTableWidget()
-            content_table.setColumnCount(len(columns))
-            content_table.setRowCount(len(data))
-            content_table.setHorizontalHeaderLabels(columns)
-
-            for row, content_data in enumerate(data):
-                for col, value in enumerate(content_data):
-                    content_table.setItem(row, col, QTableWidgetItem(str(value)))
-
-            content_table.resizeColumnsToContents()
+            content_table = ResultTableView()
+            content_table.set_result(columns, data)
+            content_table.auto_size_columns()
             content_layout.addWidget(content_table)
 
             close_button = QPushButton("關閉")
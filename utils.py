@@ -1,5 +1,6 @@
 import os
 import sys
+import time
 from PySide6.QtCore import QCoreApplication
 
 # 確保程序完全退出
@@ -17,4 +18,33 @@ def setup_environment():
     
     os.environ["JAVA_HOME"] = java_home
     os.environ["PATH"] = f"{java_home}/bin:{os.environ.get('PATH', '')}"
-    os.environ["CLASSPATH"] = f"{jt400_path}:{os.environ.get('CLASSPATH', '')}"
\ No newline at end of file
+    os.environ["CLASSPATH"] = f"{jt400_path}:{os.environ.get('CLASSPATH', '')}"
+
+class StartupProfiler:
+    """記錄啟動各階段耗時，enabled 為 False 時不輸出"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.phases = []
+        self._start = time.perf_counter()
+        self._last = self._start
+        self._reported = False
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def record(self, phase, seconds):
+        """記錄在背景執行的階段；報告已輸出時直接補印"""
+        self.phases.append((phase, seconds))
+        if self.enabled and self._reported:
+            print(f"[startup] {phase:<20} {seconds * 1000:8.1f} ms（背景）")
+
+    def report(self):
+        self._reported = True
+        if not self.enabled:
+            return
+        for phase, seconds in self.phases:
+            print(f"[startup] {phase:<20} {seconds * 1000:8.1f} ms")
+        print(f"[startup] {'可操作總計':<20} {(self._last - self._start) * 1000:8.1f} ms")